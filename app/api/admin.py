@@ -0,0 +1,174 @@
+# app/api/admin.py
+import secrets
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from ..models.api_models import CPUProfileRequest, MemoryTracingRequest, EmbeddingMigrationRequest
+from ..rag.engine import get_rag_engine
+from ..config import settings
+from ..db.maintenance import maintenance
+from ..profiling import (
+    cpu_profiler,
+    process_rss_bytes,
+    start_memory_tracing,
+    stop_memory_tracing,
+    take_memory_snapshot,
+    memory_snapshot_path,
+)
+
+def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Admin endpoints need the X-Admin-Key header; they do not exist without ADMIN_API_KEY"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+@router.post("/profiling/cpu")
+async def start_cpu_profiling(request: CPUProfileRequest):
+    """Sample the stacks of all threads while the next matching requests run"""
+    try:
+        return {"success": True, "session": cpu_profiler.start(
+            request.requests, request.sample_rate, request.interval_ms, request.route
+        )}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/profiling/cpu")
+async def cpu_profiling_status(limit: int = 25):
+    """Current CPU profiling session and its hottest functions"""
+    if cpu_profiler.session is None:
+        raise HTTPException(status_code=404, detail="No CPU profiling session")
+    return {
+        "session": dict(cpu_profiler.session),
+        "top_functions": cpu_profiler.top_functions(limit)
+    }
+
+@router.delete("/profiling/cpu")
+async def stop_cpu_profiling():
+    """End the CPU profiling session early"""
+    session = cpu_profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No CPU profiling session")
+    return {"success": True, "session": session}
+
+@router.get("/profiling/cpu/download")
+async def download_cpu_profile():
+    """Collapsed stacks of the last session (flamegraph.pl / speedscope input)"""
+    if cpu_profiler.session is None:
+        raise HTTPException(status_code=404, detail="No CPU profiling session")
+    filename = f"cpu-profile-{cpu_profiler.session['id']}.collapsed"
+    return PlainTextResponse(
+        cpu_profiler.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/profiling/memory/start")
+async def start_memory_profiling(request: MemoryTracingRequest):
+    """Start tracemalloc (allocations are only tracked from this point on)"""
+    return {"success": True, **start_memory_tracing(request.frames)}
+
+@router.post("/profiling/memory/stop")
+async def stop_memory_profiling():
+    """Stop tracemalloc and release its bookkeeping"""
+    return {"success": True, **stop_memory_tracing()}
+
+@router.post("/profiling/memory/snapshot")
+async def memory_snapshot(compare_to: Optional[str] = None, limit: int = 20):
+    """Take a tracemalloc snapshot, optionally diffed against an earlier one"""
+    if compare_to and memory_snapshot_path(compare_to) is None:
+        raise HTTPException(status_code=404, detail=f"Snapshot {compare_to} not found")
+    try:
+        return {"success": True, **take_memory_snapshot(compare_to, limit)}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/profiling/memory/snapshots/{snapshot_id}")
+async def download_memory_snapshot(snapshot_id: str):
+    """Download a snapshot; load it with tracemalloc.Snapshot.load()"""
+    path = memory_snapshot_path(snapshot_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Snapshot {snapshot_id} not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"tracemalloc-{snapshot_id}.pickle")
+
+@router.get("/memory")
+async def memory_report(request: Request):
+    """Memory held by the worker, the vector store and the RAG engine's checkpointer"""
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "rss_bytes": process_rss_bytes()
+    }
+
+    vector_store = request.app.vector_store
+    if vector_store is not None and hasattr(vector_store, "get_memory_usage"):
+        try:
+            report["vector_store"] = {"type": type(vector_store).__name__, **vector_store.get_memory_usage()}
+        except Exception as e:
+            report["vector_store"] = {"error": str(e)}
+
+    try:
+        report["rag_engine"] = get_rag_engine().get_memory_usage()
+    except Exception as e:
+        report["rag_engine"] = {"error": str(e)}
+
+    return report
+
+@router.post("/vectors/migrate-legacy")
+async def migrate_legacy_vectors(request: Request):
+    """Fold pre-content-addressing vector documents into canonical chunks (idempotent)"""
+    vector_store = request.app.vector_store
+    if not hasattr(vector_store, "migrate_legacy_vectors"):
+        raise HTTPException(status_code=400, detail="The configured vector store has no legacy vectors to migrate")
+    return {"success": True, **await run_in_threadpool(vector_store.migrate_legacy_vectors)}
+
+def _embedding_migration(request: Request):
+    vector_store = request.app.vector_store
+    if not hasattr(vector_store, "embedding_migration"):
+        raise HTTPException(status_code=400, detail="The configured vector store does not support embedding migrations")
+    return vector_store.embedding_migration
+
+@router.get("/vectors/embedding-migration")
+async def embedding_migration_status(request: Request):
+    """Serving embedding space and the progress of the current (or last) migration"""
+    return await run_in_threadpool(_embedding_migration(request).status)
+
+@router.post("/vectors/embedding-migration")
+async def start_embedding_migration(migration: EmbeddingMigrationRequest, request: Request):
+    """Re-embed the collection with another model in the background; searches switch when it is done"""
+    try:
+        return {"success": True, **await run_in_threadpool(
+            _embedding_migration(request).start, migration.model, migration.dimensions
+        )}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/vectors/embedding-migration/{action}")
+async def control_embedding_migration(action: str, request: Request):
+    """pause, resume or cancel the current migration (cancelling clears the vectors it wrote)"""
+    if action not in ("pause", "resume", "cancel"):
+        raise HTTPException(status_code=404, detail=f"Unknown action {action}")
+    migration = _embedding_migration(request)
+    try:
+        return {"success": True, **await run_in_threadpool(getattr(migration, action))}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/maintenance")
+async def maintenance_status():
+    """Retention schedule, lease holder and what the last run deleted"""
+    return await run_in_threadpool(maintenance.status)
+
+@router.post("/maintenance/run")
+async def run_maintenance(request: Request):
+    """Start a retention and orphan cleanup run now, in the background"""
+    maintenance.vector_store = maintenance.vector_store or request.app.vector_store
+    try:
+        return {"success": True, **await run_in_threadpool(maintenance.run_now)}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
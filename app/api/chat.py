@@ -1,83 +1,44 @@
 # app/api/chat.py
+import json
 import uuid
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 
-from ..models.api_models import ChatRequest, ChatResponse, ConversationListResponse
+from ..models.api_models import ChatRequest, ChatResponse, ChatBatchRequest, ConversationListResponse
 from ..rag.engine import get_rag_engine
 from ..db.mongodb import get_database
+from ..db.chat_history import chat_history
+from ..db.pagination import read_page, iter_rows
 from ..config import settings
+from ..logging_config import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
-    """Process a chat message and return a response - Updated for unified schema"""
+    """Process a chat message and return a response; the conversation is saved in the background"""
     try:
+        received_at = datetime.now()
+        
         # Get RAG engine
         rag_engine = get_rag_engine()
         
         # Process the message
         response_text, thread_id = rag_engine.process_message(
             request.message, 
-            request.thread_id
+            request.thread_id,
+            user_id=request.user_id,
+            graph_mode=request.graph_mode
         )
         
-        # # Get database
-        # db = get_database()
-        
-        # # If this is a new conversation, create conversation record
-        # if not request.thread_id:
-        #     # Create new conversation record (aligned with Express schema)
-        #     conversation_doc = {
-        #         "conversation_id": thread_id,
-        #         "user_id": request.user_id,
-        #         "title": request.message[:50] + ("..." if len(request.message) > 50 else ""),
-        #         "created_at": datetime.now(),
-        #         "updated_at": datetime.now(),
-        #         "message_count": 0,
-        #         "last_message_preview": ""
-        #     }
-        #     db.conversations.insert_one(conversation_doc)
-        
-        # # Save user message to messages collection
-        # user_message_id = str(uuid.uuid4())
-        # user_message = {
-        #     "conversation_id": thread_id,
-        #     "message_id": user_message_id,
-        #     "type": "user",
-        #     "content": request.message,
-        #     "timestamp": datetime.now(),
-        #     "metadata": {"user_id": request.user_id}
-        # }
-        # db.messages.insert_one(user_message)
-        
-        # # Save AI response to messages collection
-        # ai_message_id = str(uuid.uuid4())
-        # ai_message = {
-        #     "conversation_id": thread_id,
-        #     "message_id": ai_message_id,
-        #     "type": "ai",
-        #     "content": response_text,
-        #     "timestamp": datetime.now(),
-        #     "metadata": {
-        #         "model_used": settings.LLM_MODEL,
-        #         "temperature": settings.LLM_TEMPERATURE
-        #     }
-        # }
-        # db.messages.insert_one(ai_message)
-        
-        # # Update conversation metadata
-        # db.conversations.update_one(
-        #     {"conversation_id": thread_id},
-        #     {
-        #         "$set": {
-        #             "updated_at": datetime.now(),
-        #             "last_message_preview": response_text[:100] + ("..." if len(response_text) > 100 else "")
-        #         },
-        #         "$inc": {"message_count": 2}  # User + AI message
-        #     }
-        # )
+        # Conversation and messages are written in the background
+        if settings.ENABLE_CHAT_HISTORY:
+            chat_history.record_exchange(thread_id, request.user_id, request.message, response_text, received_at)
         
         return ChatResponse(
             response=response_text, 
@@ -87,22 +48,69 @@ async def chat_endpoint(request: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
+@router.post("/chat/batch")
+async def chat_batch_endpoint(request: ChatBatchRequest):
+    """Answer many messages concurrently, streaming one NDJSON result line per message as it completes.
+    
+    Lines are {"index", "id", "thread_id", "response", "error", "latency_ms"} in completion order;
+    index is the message's position in the request.
+    """
+    if len(request.messages) > settings.CHAT_BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(request.messages)} messages; the limit is {settings.CHAT_BATCH_MAX_MESSAGES}"
+        )
+    
+    rag_engine = get_rag_engine()
+    results = rag_engine.process_batch(
+        [message.model_dump() for message in request.messages],
+        user_id=request.user_id,
+        graph_mode=request.graph_mode,
+        concurrency=request.concurrency
+    )
+    
+    async def result_lines():
+        async for result in iterate_in_threadpool(results):
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+@router.get("/rag-stats")
+async def rag_statistics():
+    """Get end-to-end RAG latency per graph mode"""
+    try:
+        rag_engine = get_rag_engine()
+        return {
+            "success": True,
+            "timestamp": datetime.now().isoformat(),
+            "latency": rag_engine.get_latency_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting RAG statistics: {str(e)}")
+
+def _json_line(document: dict) -> str:
+    """One NDJSON line; datetimes as ISO 8601 like the JSON responses"""
+    return json.dumps(document, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value)) + "\n"
+
 @router.get("/conversations", response_model=ConversationListResponse)
-async def list_conversations(user_id: str):
-    """List all conversations for a user - Updated to use conversations collection"""
+async def list_conversations(user_id: str, cursor: Optional[str] = None,
+                             limit: int = Query(settings.CONVERSATIONS_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)):
+    """List a user's conversations, most recently updated first, one page at a time"""
     try:
         # Get database
         db = get_database()
         
-        # Find all conversations for this user (aligned with Express)
-        conversations = list(db.conversations.find(
-            {"user_id": user_id},
-            {"_id": 0}  # Exclude MongoDB _id field
-        ).sort("updated_at", -1).limit(50))
+        # Keyset page on the (user_id, updated_at, conversation_id) index
+        conversations, next_cursor = read_page(
+            db.conversations, {"user_id": user_id}, "updated_at", "conversation_id", limit,
+            cursor=cursor, descending=True, projection={"_id": 0}  # Exclude MongoDB _id field
+        )
         
         # Format the response
-        return ConversationListResponse(conversations=conversations)
+        return ConversationListResponse(conversations=conversations, next_cursor=next_cursor)
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing conversations: {str(e)}")
 
@@ -136,8 +144,9 @@ async def new_conversation(user_id: str):
 
 # New endpoint to get conversation messages (matching Express API)
 @router.get("/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str):
-    """Get messages for a specific conversation"""
+async def get_conversation_messages(conversation_id: str, cursor: Optional[str] = None,
+                                    limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)):
+    """Get a page of a conversation's messages, oldest first; follow next_cursor for the rest"""
     try:
         db = get_database()
         
@@ -150,25 +159,52 @@ async def get_conversation_messages(conversation_id: str):
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        # Get messages for this conversation
-        messages = list(db.messages.find(
-            {"conversation_id": conversation_id},
-            {"_id": 0}  # Exclude MongoDB _id field
-        ).sort("timestamp", 1))
+        # Keyset page on the (conversation_id, timestamp, message_id) index
+        messages, next_cursor = read_page(
+            db.messages, {"conversation_id": conversation_id}, "timestamp", "message_id", limit,
+            cursor=cursor, projection={"_id": 0}  # Exclude MongoDB _id field
+        )
         
         return {
             "conversation": conversation,
             "messages": messages,
-            "total_messages": len(messages)
+            "total_messages": conversation.get("message_count", len(messages)),
+            "next_cursor": next_cursor
         }
     
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching conversation messages: {str(e)}")
 
+@router.get("/conversations/{conversation_id}/messages/export")
+async def export_conversation_messages(conversation_id: str):
+    """Stream every message of a conversation as NDJSON, oldest first, in constant memory"""
+    db = get_database()
+    if db.conversations.find_one({"conversation_id": conversation_id}, {"_id": 1}) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    messages = iter_rows(
+        db.messages, {"conversation_id": conversation_id}, "timestamp", "message_id",
+        settings.MESSAGES_EXPORT_PAGE_SIZE, projection={"_id": 0}
+    )
+    
+    async def message_lines():
+        async for message in iterate_in_threadpool(messages):
+            yield _json_line(message)
+    
+    return StreamingResponse(
+        message_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="conversation-{conversation_id}.ndjson"'}
+    )
+
 # Delete conversation endpoint (matching Express API)
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str, user_id: str):
-    """Delete a conversation and all its messages"""
+    """Delete a conversation with all its messages and checkpoints"""
     try:
         db = get_database()
         
@@ -187,6 +223,12 @@ async def delete_conversation(conversation_id: str, user_id: str):
         # Delete the conversation
         db.conversations.delete_one({"conversation_id": conversation_id})
         
+        # Delete its LangGraph state; maintenance removes orphaned checkpoints should this fail
+        try:
+            get_rag_engine().delete_thread(conversation_id)
+        except Exception as e:
+            logger.warning("Could not delete checkpoints of conversation %s: %s", conversation_id, e)
+        
         return {"message": "Conversation deleted successfully"}
     
     except Exception as e:
@@ -1,88 +1,135 @@
 # app/api/documents.py
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Body
-from typing import Optional
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Body, Request
+from typing import Optional, Iterable, Iterator, List, Dict, Tuple
+from langchain_core.documents import Document
+from starlette.concurrency import run_in_threadpool
 
-from ..models.api_models import DocumentUploadResponse, URLUploadRequest
+from ..config import settings
+from ..models.api_models import (
+    DocumentUploadResponse,
+    URLUploadRequest,
+    URLBatchUploadRequest,
+    URLUploadResult,
+    URLBatchUploadResponse
+)
 from ..document_processing.loaders import (
-    load_document_from_url,
-    load_document_from_pdf,
-    load_document_from_text
+    iter_pdf_pages,
+    load_document_from_text_file
 )
-from ..document_processing.processor import process_and_store_documents
+from ..document_processing.processor import process_and_store_documents, update_source_documents
+from ..document_processing.url_ingest import ingest_url, ingest_urls
+from ..document_processing.uploads import spooled_upload, check_content_length
+from ..logging_config import get_logger
+from ..tracing import annotate, trace_span
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 @router.post("/upload-url", response_model=DocumentUploadResponse)
 async def upload_url(request: URLUploadRequest):
-    """Upload a document from a URL with enhanced debugging"""
-    print(f"\n==== URL UPLOAD ATTEMPT ====")
-    print(f"URL: {request.url}")
-    print(f"User ID: {request.user_id}")
-    print(f"Title: {request.title or 'Not provided'}")
-    
+    """Upload a document from a URL (skipped when unchanged since the last upload)"""
+    annotate(user_id=request.user_id, url=request.url)
     try:
-        print(f"Step 1: Loading document from URL")
-        documents = await load_document_from_url(request.url, request.title)
-        print(f"✅ Successfully loaded document from URL")
-        print(f"Document count: {len(documents)}")
-        if documents:
-            print(f"First document content length: {len(documents[0].page_content)}")
-            print(f"First document metadata: {documents[0].metadata}")
-        
-        print(f"Step 2: Processing and storing documents")
-        document_ids = await process_and_store_documents(documents, request.user_id)
-        print(f"✅ Successfully processed and stored documents")
-        print(f"Document IDs: {document_ids}")
+        result = await ingest_url(request.url, request.user_id, request.title)
         
         # Return information about the stored document
         return DocumentUploadResponse(
-            document_id=document_ids[0],
-            title=documents[0].metadata.get("title", "Unknown"),
-            status="success",
-            message=f"Successfully uploaded and processed document from URL"
+            document_id=result["document_ids"][0],
+            title=result["title"],
+            status=result["status"],
+            message="Document unchanged since the last upload" if result["status"] == "unchanged"
+                    else "Successfully uploaded and processed document from URL"
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        print(f"❌ ERROR in upload_url: {str(e)}")
-        print(f"Exception type: {type(e).__name__}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error uploading document from %s", request.url)
         raise HTTPException(status_code=500, detail=f"Error uploading document: {str(e)}")
 
+@router.post("/upload-urls", response_model=URLBatchUploadResponse)
+async def upload_urls(request: URLBatchUploadRequest):
+    """Upload documents from many URLs concurrently; failures are reported per URL"""
+    if len(request.urls) > settings.URL_BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.URL_BATCH_MAX_URLS} URLs per request")
+    annotate(user_id=request.user_id, url_count=len(request.urls))
+    
+    results = await ingest_urls(request.urls, request.user_id)
+    statuses = [result["status"] for result in results]
+    return URLBatchUploadResponse(
+        results=[URLUploadResult(**result) for result in results],
+        succeeded=statuses.count("success"),
+        unchanged=statuses.count("unchanged"),
+        failed=statuses.count("error")
+    )
+
 @router.post("/upload-file", response_model=DocumentUploadResponse)
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
-    user_id: str = Form(...)
+    user_id: str = Form(...),
+    update: bool = Form(False)
 ):
-    """Upload a document file (PDF or text)"""
+    """Upload a document file (PDF or text)
+
+    With update=true the upload replaces the user's earlier upload of the same file name,
+    re-embedding only the chunks that changed.
+    """
+    annotate(user_id=user_id, filename=file.filename)
+    check_content_length(request.headers.get("content-length"))
+    
+    filename = file.filename or ""
+    is_pdf = filename.lower().endswith('.pdf')
+    if not is_pdf and not filename.lower().endswith(('.txt', '.md')):
+        raise HTTPException(
+            status_code=400, 
+            detail="Unsupported file type. Please upload PDF or text files."
+        )
+    
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Process based on file type
-        if file.filename.lower().endswith('.pdf'):
-            documents = await load_document_from_pdf(file_content, file.filename, title)
-        elif file.filename.lower().endswith(('.txt', '.md')):
-            # Convert bytes to string for text files
-            text_content = file_content.decode('utf-8')
-            documents = await load_document_from_text(text_content, file.filename, title)
-        else:
-            raise HTTPException(
-                status_code=400, 
-                detail="Unsupported file type. Please upload PDF or text files."
-            )
-        
-        # Process and store documents
-        document_ids = await process_and_store_documents(documents, user_id)
+        # Stream the upload to disk; loaders read it from there
+        async with spooled_upload(file) as upload:
+            if is_pdf:
+                # Pages stream from the PDF straight into chunking and embedding
+                with trace_span("ingest.pdf"):
+                    # Opening the PDF (page count) parses it; keep that off the event loop
+                    documents = await run_in_threadpool(iter_pdf_pages, upload.path, filename, title)
+                    document_ids, changes = await _ingest(
+                        _with_content_hash(documents, upload.sha256), user_id, filename, update
+                    )
+            else:
+                with trace_span("load.text"):
+                    documents = await run_in_threadpool(load_document_from_text_file, upload.path, filename, title)
+                document_ids, changes = await _ingest(
+                    _with_content_hash(documents, upload.sha256), user_id, filename, update
+                )
         
         # Return information about the stored document
         return DocumentUploadResponse(
             document_id=document_ids[0],
-            title=documents[0].metadata.get("title", "Unknown"),
+            title=title or filename,
             status="success",
-            message=f"Successfully uploaded and processed {file.filename}"
+            message=f"Successfully uploaded and processed {filename}"
+                    + (f" ({len(document_ids)} pages)" if is_pdf else ""),
+            size_bytes=upload.size,
+            sha256=upload.sha256,
+            changes=changes
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
+
+async def _ingest(documents: Iterable[Document], user_id: str, source: str,
+                  update: bool) -> Tuple[List[str], Optional[Dict[str, int]]]:
+    if update:
+        return await update_source_documents(documents, user_id, source)
+    return await process_and_store_documents(documents, user_id), None
+
+def _with_content_hash(documents: Iterable[Document], sha256: str) -> Iterator[Document]:
+    """Tag documents with the SHA-256 of the uploaded file"""
+    for doc in documents:
+        doc.metadata["content_sha256"] = sha256
+        yield doc
@@ -1,5 +1,7 @@
 # app/config.py - ENHANCED FOR ATLAS
 import os
+import logging
+import tempfile
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import urllib.parse
@@ -7,6 +9,9 @@ import urllib.parse
 # Load .env file
 load_dotenv(override=True)
 
+# Plain stdlib logger: settings load before logging is configured, so only warnings surface here
+logger = logging.getLogger(__name__)
+
 class Settings(BaseSettings):
     # API settings
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
@@ -24,32 +29,146 @@ class Settings(BaseSettings):
     # Collection names
     DOCUMENTS_COLLECTION: str = os.getenv("DOCUMENTS_COLLECTION", "documents")
     VECTORS_COLLECTION: str = os.getenv("VECTORS_COLLECTION", "vectors")
+    CHUNK_REFS_COLLECTION: str = os.getenv("CHUNK_REFS_COLLECTION", "chunk_refs")  # Per-document references to canonical chunks
     CHAT_HISTORY_COLLECTION: str = os.getenv("CHAT_HISTORY_COLLECTION", "conversations")
     MESSAGES_COLLECTION: str = os.getenv("MESSAGES_COLLECTION", "messages")
+    VECTOR_STATS_COLLECTION: str = os.getenv("VECTOR_STATS_COLLECTION", "vector_stats")
     # LangGraph MongoDB Checkpointer Settings
     LANGGRAPH_CHECKPOINT_COLLECTION: str = os.getenv("LANGGRAPH_CHECKPOINT_COLLECTION", "langgraph_checkpoints")
+    LANGGRAPH_WRITES_COLLECTION: str = os.getenv("LANGGRAPH_WRITES_COLLECTION", "langgraph_checkpoint_writes")
     ENABLE_MONGODB_CHECKPOINTER: bool = os.getenv("ENABLE_MONGODB_CHECKPOINTER", "True").lower() == "true"
 
     # Vector Store Settings
     VECTOR_STORE_TYPE: str = os.getenv("VECTOR_STORE_TYPE", "mongodb")  # "mongodb" or "faiss"
     
+    # Multi-worker FAISS: index segments on disk, memory-mapped read-only by every worker
+    FAISS_SHARED_DIR: str = os.getenv("FAISS_SHARED_DIR", "")  # Empty = in-process index (single worker only)
+    FAISS_REFRESH_SECONDS: float = float(os.getenv("FAISS_REFRESH_SECONDS", "2"))  # How often workers look for new segments
+    FAISS_MAX_SEGMENTS: int = int(os.getenv("FAISS_MAX_SEGMENTS", "16"))  # Beyond this the smaller segments are merged
+    WEB_WORKERS: int = int(os.getenv("WEB_WORKERS", "1"))  # uvicorn worker processes in production
+    
     # MongoDB Atlas Vector Search Settings (for production)
     ATLAS_VECTOR_INDEX_NAME: str = os.getenv("ATLAS_VECTOR_INDEX_NAME", "vector_index")
+    ATLAS_NUM_CANDIDATES_MULTIPLIER: int = int(os.getenv("ATLAS_NUM_CANDIDATES_MULTIPLIER", "10"))  # numCandidates = k * multiplier
+    ATLAS_CREATE_SEARCH_INDEX: bool = os.getenv("ATLAS_CREATE_SEARCH_INDEX", "True").lower() == "true"
     
     # OpenAI settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")  # Empty = api.openai.com; set to use an OpenAI-compatible server
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    EMBEDDING_DIMENSIONS: int = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))  # 0 = the model's native size; text-embedding-3-* can shorten
+    # Token-based input length checks need tiktoken encodings (downloaded on first use); disable for offline stubs
+    EMBEDDING_CHECK_CTX_LENGTH: bool = os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "True").lower() == "true"
+    # Re-embedding migrations (see app/vector_store/migration.py)
+    EMBEDDING_MIGRATIONS_COLLECTION: str = os.getenv("EMBEDDING_MIGRATIONS_COLLECTION", "embedding_migrations")
+    EMBEDDING_SPACE_REFRESH_SECONDS: float = float(os.getenv("EMBEDDING_SPACE_REFRESH_SECONDS", "5"))  # How often workers look for a switch
+    EMBEDDING_MIGRATION_BATCH_SIZE: int = int(os.getenv("EMBEDDING_MIGRATION_BATCH_SIZE", "100"))
+    EMBEDDING_MIGRATION_CHUNKS_PER_SECOND: float = float(os.getenv("EMBEDDING_MIGRATION_CHUNKS_PER_SECOND", "50"))  # 0 = unthrottled
+    EMBEDDING_MIGRATION_MAX_IN_FLIGHT: int = int(os.getenv("EMBEDDING_MIGRATION_MAX_IN_FLIGHT", "4"))  # Busier workers hold the job back
+    EMBEDDING_MIGRATION_LEASE_SECONDS: float = float(os.getenv("EMBEDDING_MIGRATION_LEASE_SECONDS", "60"))  # Another worker resumes after this
+    EMBEDDING_MIGRATION_SHADOW_READ_RATE: float = float(os.getenv("EMBEDDING_MIGRATION_SHADOW_READ_RATE", "0.05"))  # Searches also compared in the target space
     
     # LLM settings
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
     LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.2"))
     
+    # RAG graph settings
+    RAG_GRAPH_MODE: str = os.getenv("RAG_GRAPH_MODE", "agentic")  # "agentic" or "retrieval_first"
+    RAG_LATENCY_WINDOW: int = int(os.getenv("RAG_LATENCY_WINDOW", "500"))  # Samples kept per graph mode
+    
+    # Speculative retrieval (agentic mode): search on the raw user message while the first LLM call runs
+    ENABLE_SPECULATIVE_RETRIEVAL: bool = os.getenv("ENABLE_SPECULATIVE_RETRIEVAL", "True").lower() == "true"
+    SPECULATIVE_MATCH_THRESHOLD: float = float(os.getenv("SPECULATIVE_MATCH_THRESHOLD", "0.8"))
+    RETRIEVAL_WORKERS: int = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+    
+    # Multi-query retrieval: search rephrasings / sub-questions together and fuse the results
+    ENABLE_MULTI_QUERY_RETRIEVAL: bool = os.getenv("ENABLE_MULTI_QUERY_RETRIEVAL", "False").lower() == "true"
+    MULTI_QUERY_MAX_QUERIES: int = int(os.getenv("MULTI_QUERY_MAX_QUERIES", "4"))
+    
+    # Batched chat (/chat/batch): bounded concurrent graph runs sharing query embedding requests
+    CHAT_BATCH_MAX_MESSAGES: int = int(os.getenv("CHAT_BATCH_MAX_MESSAGES", "5000"))  # Larger batches get a 413
+    CHAT_BATCH_CONCURRENCY: int = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))  # Default and upper bound per batch
+    CHAT_BATCH_EMBEDDING_SIZE: int = int(os.getenv("CHAT_BATCH_EMBEDDING_SIZE", "256"))  # Queries per embeddings request
+    CHAT_BATCH_EMBEDDING_WAIT_MS: float = float(os.getenv("CHAT_BATCH_EMBEDDING_WAIT_MS", "20"))  # Wait for other runs' queries
+    
+    # Chat history: /chat queues conversation and message writes for a background writer
+    ENABLE_CHAT_HISTORY: bool = os.getenv("ENABLE_CHAT_HISTORY", "True").lower() == "true"
+    CHAT_HISTORY_FLUSH_MS: float = float(os.getenv("CHAT_HISTORY_FLUSH_MS", "250"))  # Longest a write waits for company
+    CHAT_HISTORY_BATCH_SIZE: int = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "200"))  # Exchanges per flush
+    CHAT_HISTORY_QUEUE_SIZE: int = int(os.getenv("CHAT_HISTORY_QUEUE_SIZE", "10000"))  # Exchanges are dropped beyond this
+    CHAT_HISTORY_MAX_RETRIES: int = int(os.getenv("CHAT_HISTORY_MAX_RETRIES", "5"))
+    CHAT_HISTORY_RETRY_BACKOFF_SECONDS: float = float(os.getenv("CHAT_HISTORY_RETRY_BACKOFF_SECONDS", "0.5"))  # Doubles per retry
+    CHAT_HISTORY_SHUTDOWN_TIMEOUT_SECONDS: float = float(os.getenv("CHAT_HISTORY_SHUTDOWN_TIMEOUT_SECONDS", "10"))
+    
+    # Conversation / message listing (keyset pages; export streams NDJSON)
+    CONVERSATIONS_PAGE_SIZE: int = int(os.getenv("CONVERSATIONS_PAGE_SIZE", "50"))
+    MESSAGES_PAGE_SIZE: int = int(os.getenv("MESSAGES_PAGE_SIZE", "100"))
+    MAX_PAGE_SIZE: int = int(os.getenv("MAX_PAGE_SIZE", "1000"))  # Largest ?limit= accepted
+    MESSAGES_EXPORT_PAGE_SIZE: int = int(os.getenv("MESSAGES_EXPORT_PAGE_SIZE", "500"))  # Messages read per query while exporting
+    
+    # Maintenance: retention and orphan cleanup run by one worker at a time (0 days = keep forever)
+    MAINTENANCE_INTERVAL_MINUTES: float = float(os.getenv("MAINTENANCE_INTERVAL_MINUTES", "60"))  # 0 disables the schedule
+    MAINTENANCE_COLLECTION: str = os.getenv("MAINTENANCE_COLLECTION", "maintenance")  # Lease and last run report
+    MAINTENANCE_LEASE_SECONDS: float = float(os.getenv("MAINTENANCE_LEASE_SECONDS", "120"))  # Another worker takes over after this
+    MAINTENANCE_BATCH_SIZE: int = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))  # Ids per delete
+    MAINTENANCE_DELETES_PER_SECOND: float = float(os.getenv("MAINTENANCE_DELETES_PER_SECOND", "1000"))  # 0 = unthrottled
+    MAINTENANCE_MAX_IN_FLIGHT: int = int(os.getenv("MAINTENANCE_MAX_IN_FLIGHT", "4"))  # Pause while this worker serves more requests
+    MAINTENANCE_ORPHANED_CHECKPOINTS: bool = os.getenv("MAINTENANCE_ORPHANED_CHECKPOINTS", "False").lower() == "true"  # Delete threads without a conversation record
+    MAINTENANCE_ORPHAN_GRACE_MINUTES: float = float(os.getenv("MAINTENANCE_ORPHAN_GRACE_MINUTES", "60"))  # Recent checkpoints may await their conversation
+    RETENTION_CONVERSATION_DAYS: float = float(os.getenv("RETENTION_CONVERSATION_DAYS", "0"))  # Idle conversations, with messages and checkpoints
+    RETENTION_FAILED_DOCUMENT_DAYS: float = float(os.getenv("RETENTION_FAILED_DOCUMENT_DAYS", "7"))  # Failed ingestions and their partial vectors
+    RETENTION_STALE_PROCESSING_HOURS: float = float(os.getenv("RETENTION_STALE_PROCESSING_HOURS", "24"))  # "processing" this long counts as failed
+    CHECKPOINTS_PER_THREAD: int = int(os.getenv("CHECKPOINTS_PER_THREAD", "5"))  # Newest LangGraph checkpoints kept per thread; 0 keeps all
+    
     # Document processing
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    INGEST_BATCH_DOCUMENTS: int = int(os.getenv("INGEST_BATCH_DOCUMENTS", "32"))  # Pages / documents chunked and embedded together
+    SOURCE_UPDATES_COLLECTION: str = os.getenv("SOURCE_UPDATES_COLLECTION", "source_updates")  # Lease per source being updated in place
+    SOURCE_UPDATE_LEASE_SECONDS: float = float(os.getenv("SOURCE_UPDATE_LEASE_SECONDS", "300"))  # A crashed update's source is free again after this
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))  # Larger uploads get a 413
+    UPLOAD_CHUNK_BYTES: int = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+    UPLOAD_TMP_DIR: str = os.getenv("UPLOAD_TMP_DIR", "")  # Empty = system temp dir
+
+    # PDF extraction: large PDFs are split into page ranges across a process pool
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "0"))  # 0 = one per CPU, 1 = always extract in-process
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+    # URL fetching: shared async HTTP client, per-host limits and conditional re-fetch
+    URL_FETCH_TIMEOUT: float = float(os.getenv("URL_FETCH_TIMEOUT", "20"))  # Seconds, whole response
+    URL_FETCH_CONNECT_TIMEOUT: float = float(os.getenv("URL_FETCH_CONNECT_TIMEOUT", "5"))
+    URL_FETCH_MAX_CONNECTIONS: int = int(os.getenv("URL_FETCH_MAX_CONNECTIONS", "50"))
+    URL_FETCH_PER_HOST: int = int(os.getenv("URL_FETCH_PER_HOST", "4"))  # Concurrent requests per host
+    URL_FETCH_MAX_BYTES: int = int(os.getenv("URL_FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+    URL_FETCH_USER_AGENT: str = os.getenv("URL_FETCH_USER_AGENT", "PrenatalClinicRAG/2.0")
+    URL_BATCH_MAX_URLS: int = int(os.getenv("URL_BATCH_MAX_URLS", "50"))
+    URL_BATCH_CONCURRENCY: int = int(os.getenv("URL_BATCH_CONCURRENCY", "8"))
+    URL_CACHE_COLLECTION: str = os.getenv("URL_CACHE_COLLECTION", "url_fetch_cache")  # ETag / Last-Modified per URL and user
 
     # Vector search settings
     SIMILARITY_SEARCH_K: int = int(os.getenv("SIMILARITY_SEARCH_K", "4"))
     SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
+    VECTOR_STATS_CACHE_TTL: float = float(os.getenv("VECTOR_STATS_CACHE_TTL", "30"))  # Seconds
+    # Local searches (MongoDB without Atlas, shared FAISS) screen compact codes, then rescore exactly
+    VECTOR_QUANTIZATION: str = os.getenv("VECTOR_QUANTIZATION", "none")  # "none", "int8" or "binary"
+    QUANTIZATION_CANDIDATES: int = int(os.getenv("QUANTIZATION_CANDIDATES", "10"))  # int8: rescored candidates = k * this
+    BINARY_QUANTIZATION_CANDIDATES: int = int(os.getenv("BINARY_QUANTIZATION_CANDIDATES", "40"))  # Sign bits screen coarser
+    
+    # Request tracing: Server-Timing headers and slow request capture
+    ENABLE_SERVER_TIMING: bool = os.getenv("ENABLE_SERVER_TIMING", "True").lower() == "true"
+    SLOW_REQUEST_THRESHOLD_MS: float = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "5000"))  # 0 disables capture
+    REQUEST_TRACES_COLLECTION: str = os.getenv("REQUEST_TRACES_COLLECTION", "request_traces")
+    REQUEST_TRACES_MAX_BYTES: int = int(os.getenv("REQUEST_TRACES_MAX_BYTES", str(16 * 1024 * 1024)))  # Capped collection size
+    
+    # Admin API (profiling); empty key disables the admin endpoints
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY", "")
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "rag-profiles"))
+    
+    # Logging
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")  # Per-module overrides, e.g. "app.rag=DEBUG,app.vector_store=WARNING"
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
     
     # Atlas-specific settings
     ATLAS_PROJECT_ID: str = os.getenv("ATLAS_PROJECT_ID", "")
@@ -65,7 +184,7 @@ class Settings(BaseSettings):
         is_atlas = "mongodb+srv://" in self.MONGODB_CONNECTION_STRING or "mongodb.net" in self.MONGODB_CONNECTION_STRING
         
         if is_atlas:
-            print("🌐 Detected MongoDB Atlas connection")
+            logger.debug("Detected MongoDB Atlas connection")
             
             # Validate connection string format
             if not self.MONGODB_CONNECTION_STRING.startswith(("mongodb://", "mongodb+srv://")):
@@ -73,22 +192,22 @@ class Settings(BaseSettings):
             
             # Check for credentials in Atlas connection string
             if "@" not in self.MONGODB_CONNECTION_STRING:
-                print("⚠️ Warning: No credentials found in Atlas connection string")
+                logger.warning("No credentials found in Atlas connection string")
             
             # Validate database name
             if not self.DB_NAME:
                 raise ValueError("DB_NAME is required for Atlas connections")
                 
-            print(f"📊 Atlas Database: {self.DB_NAME}")
-            print(f"📁 Collections: docs={self.DOCUMENTS_COLLECTION}, vectors={self.VECTORS_COLLECTION}")
+            logger.debug("Atlas database: %s (docs=%s, vectors=%s)",
+                         self.DB_NAME, self.DOCUMENTS_COLLECTION, self.VECTORS_COLLECTION)
         else:
-            print("🏠 Detected local MongoDB connection")
+            logger.debug("Detected local MongoDB connection")
         
         # Validate OpenAI API key
         if not self.OPENAI_API_KEY:
-            print("⚠️ Warning: OPENAI_API_KEY not set - RAG functionality will not work")
+            logger.warning("OPENAI_API_KEY not set - RAG functionality will not work")
         else:
-            print(f"🤖 OpenAI API Key configured (model: {self.LLM_MODEL})")
+            logger.debug("OpenAI API key configured (model: %s)", self.LLM_MODEL)
     
     def get_connection_info(self):
         """Get connection information for debugging"""
@@ -126,8 +245,7 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-# Print configuration info on startup
-if __name__ == "__main__" or settings.DEBUG:
+if __name__ == "__main__":
     print("🔧 Configuration loaded:")
     info = settings.get_connection_info()
     for key, value in info.items():
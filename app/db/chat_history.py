@@ -0,0 +1,232 @@
+# app/db/chat_history.py
+"""
+Write-behind persistence of conversations and messages.
+
+/chat hands each exchange (user message + AI reply) to the ChatHistoryWriter and returns
+without waiting for MongoDB. A background thread collects exchanges for up to
+CHAT_HISTORY_FLUSH_MS (or CHAT_HISTORY_BATCH_SIZE of them) and writes them with two bulk
+operations: one upsert per conversation (created on first use, counters incremented by the
+whole batch) and one insert of all messages. Failed writes are retried with backoff; what is
+still queued at shutdown is flushed before the process exits.
+"""
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import track_stage, CHAT_HISTORY_FLUSH_SECONDS, CHAT_HISTORY_QUEUE_DEPTH, CHAT_HISTORY_WRITES_TOTAL
+from .mongodb import get_database
+
+logger = get_logger(__name__)
+
+DUPLICATE_KEY = 11000
+
+def _preview(text: str, length: int) -> str:
+    return text[:length] + ("..." if len(text) > length else "")
+
+class ChatHistoryWriter:
+    """Queues chat exchanges and writes them to MongoDB in batches from a background thread"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=settings.CHAT_HISTORY_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._db = None
+
+    def record_exchange(self, conversation_id: str, user_id: str, user_message: str, ai_message: str,
+                        received_at: Optional[datetime] = None):
+        """Queue a user message and its reply; returns immediately"""
+        now = datetime.now()
+        exchange = {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "messages": [
+                {
+                    "conversation_id": conversation_id,
+                    "message_id": str(uuid.uuid4()),
+                    "type": "user",
+                    "content": user_message,
+                    "timestamp": received_at or now,
+                    "metadata": {"user_id": user_id}
+                },
+                {
+                    "conversation_id": conversation_id,
+                    "message_id": str(uuid.uuid4()),
+                    "type": "ai",
+                    "content": ai_message,
+                    "timestamp": now,
+                    "metadata": {
+                        "model_used": settings.LLM_MODEL,
+                        "temperature": settings.LLM_TEMPERATURE
+                    }
+                }
+            ]
+        }
+        with self._lock:
+            if self._closed:
+                logger.warning("Chat history writer is closed; exchange not saved", extra={"thread_id": conversation_id})
+                CHAT_HISTORY_WRITES_TOTAL.labels(kind="exchanges", outcome="dropped").inc()
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+                self._thread.start()
+        CHAT_HISTORY_QUEUE_DEPTH.inc()
+        try:
+            self._queue.put_nowait(exchange)
+        except queue.Full:
+            CHAT_HISTORY_QUEUE_DEPTH.dec()
+            logger.error("Chat history queue is full (%d exchanges); exchange not saved",
+                         settings.CHAT_HISTORY_QUEUE_SIZE, extra={"thread_id": conversation_id})
+            CHAT_HISTORY_WRITES_TOTAL.labels(kind="exchanges", outcome="dropped").inc()
+
+    def pending(self) -> int:
+        """Exchanges waiting to be written"""
+        return self._queue.qsize()
+
+    def close(self, timeout: Optional[float] = None):
+        """Write everything still queued and stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(settings.CHAT_HISTORY_SHUTDOWN_TIMEOUT_SECONDS if timeout is None else timeout)
+        if thread.is_alive():
+            logger.error("Chat history writer did not finish; %d exchanges were not saved", self.pending())
+
+    def _run(self):
+        flush_seconds = settings.CHAT_HISTORY_FLUSH_MS / 1000
+        stopping = False
+        while not stopping:
+            exchange = self._queue.get()
+            if exchange is None:
+                break
+            exchanges = [exchange]
+            # Collect what arrives within the flush delay so it goes out in the same writes
+            deadline = time.monotonic() + flush_seconds
+            while len(exchanges) < settings.CHAT_HISTORY_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                try:
+                    exchange = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if exchange is None:
+                    stopping = True
+                    break
+                exchanges.append(exchange)
+            CHAT_HISTORY_QUEUE_DEPTH.dec(len(exchanges))
+            self._flush(exchanges)
+
+        # Shutting down: write whatever was queued before close()
+        exchanges = []
+        while True:
+            try:
+                exchange = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if exchange is not None:
+                exchanges.append(exchange)
+        CHAT_HISTORY_QUEUE_DEPTH.dec(len(exchanges))
+        for start in range(0, len(exchanges), settings.CHAT_HISTORY_BATCH_SIZE):
+            self._flush(exchanges[start:start + settings.CHAT_HISTORY_BATCH_SIZE])
+
+    def _database(self):
+        if self._db is None:
+            self._db = get_database()
+        return self._db
+
+    def _flush(self, exchanges: List[Dict[str, Any]]):
+        conversations: Dict[str, Dict[str, Any]] = {}
+        messages = []
+        for exchange in exchanges:
+            user_message, ai_message = exchange["messages"]
+            conversation = conversations.setdefault(exchange["conversation_id"], {
+                "user_id": exchange["user_id"],
+                "title": _preview(user_message["content"], 50),
+                "created_at": user_message["timestamp"],
+                "message_count": 0
+            })
+            conversation["message_count"] += len(exchange["messages"])
+            conversation["updated_at"] = ai_message["timestamp"]
+            conversation["last_message_preview"] = _preview(ai_message["content"], 100)
+            messages.extend(exchange["messages"])
+
+        updates = [
+            UpdateOne(
+                {"conversation_id": conversation_id},
+                {
+                    # Conversations started with /new-conversation keep their record and title
+                    "$setOnInsert": {
+                        "conversation_id": conversation_id,
+                        "user_id": conversation["user_id"],
+                        "title": conversation["title"],
+                        "created_at": conversation["created_at"]
+                    },
+                    "$set": {"last_message_preview": conversation["last_message_preview"]},
+                    "$max": {"updated_at": conversation["updated_at"]},
+                    "$inc": {"message_count": conversation["message_count"]}
+                },
+                upsert=True
+            )
+            for conversation_id, conversation in conversations.items()
+        ]
+
+        with track_stage(CHAT_HISTORY_FLUSH_SECONDS):
+            self._write_with_retries("conversations", updates, self._write_conversations)
+            self._write_with_retries("messages", messages, self._write_messages)
+        logger.debug("Saved %d exchanges in %d conversations", len(exchanges), len(conversations))
+
+    def _write_conversations(self, updates: List[UpdateOne]) -> List[UpdateOne]:
+        """Upsert conversations; returns the updates to retry"""
+        try:
+            self._database()[settings.CHAT_HISTORY_COLLECTION].bulk_write(updates, ordered=False)
+            return []
+        except BulkWriteError as e:
+            # Includes two workers upserting a new conversation at once; the retry updates it
+            return [updates[error["index"]] for error in e.details["writeErrors"]]
+
+    def _write_messages(self, messages: List[dict]) -> List[dict]:
+        """Insert messages; returns the messages to retry"""
+        try:
+            self._database()[settings.MESSAGES_COLLECTION].insert_many(messages, ordered=False)
+            return []
+        except BulkWriteError as e:
+            # Duplicates were written by an earlier attempt whose reply got lost
+            return [messages[error["index"]] for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY]
+
+    def _write_with_retries(self, kind: str, items: list, write):
+        total = len(items)
+        error = None
+        for attempt in range(settings.CHAT_HISTORY_MAX_RETRIES + 1):
+            if attempt:
+                delay = settings.CHAT_HISTORY_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+                logger.warning("Writing %d %s failed (%s); retrying in %.1f s", len(items), kind, error, delay)
+                time.sleep(delay)
+            try:
+                items = write(items)
+            except PyMongoError as e:
+                # Connection errors leave the outcome unknown: conversation counters may be
+                # incremented twice, messages are deduplicated by their unique message_id
+                error = e
+                continue
+            if not items:
+                CHAT_HISTORY_WRITES_TOTAL.labels(kind=kind, outcome="written").inc(total)
+                return
+            error = f"{len(items)} of the writes were rejected"
+        logger.error("Giving up on %d %s after %d attempts: %s",
+                     len(items), kind, settings.CHAT_HISTORY_MAX_RETRIES + 1, error)
+        CHAT_HISTORY_WRITES_TOTAL.labels(kind=kind, outcome="written").inc(total - len(items))
+        CHAT_HISTORY_WRITES_TOTAL.labels(kind=kind, outcome="dropped").inc(len(items))
+
+chat_history = ChatHistoryWriter()
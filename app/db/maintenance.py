@@ -0,0 +1,440 @@
+# app/db/maintenance.py
+"""
+Scheduled retention and orphan cleanup.
+
+Every MAINTENANCE_INTERVAL_MINUTES one worker takes the lease in the maintenance collection and
+runs the jobs below; the other workers skip that run. Jobs delete in batches of
+MAINTENANCE_BATCH_SIZE, paced to MAINTENANCE_DELETES_PER_SECOND, and give way while the worker
+is busy serving requests, so a backlog is worked off without a latency spike. Children are
+deleted before their parents (messages and checkpoints before the conversation, vectors before
+the document record), so an interrupted run leaves nothing the next one cannot find.
+
+Retention runs here rather than through TTL indexes because expiring a conversation or a
+document has to cascade to other collections, and TTL deletes are not throttled.
+"""
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import requests_in_flight, MAINTENANCE_DELETED_TOTAL, MAINTENANCE_RUN_SECONDS
+from .mongodb import get_database
+from .pagination import iter_rows
+
+logger = get_logger(__name__)
+
+MAINTENANCE_STATE_ID = "maintenance"
+
+# Jobs in the order a run executes them
+JOBS = (
+    "expired_conversations",
+    "failed_documents",
+    "orphaned_messages",
+    "orphaned_checkpoints",
+    "orphaned_vectors",
+    "checkpoint_history",
+)
+
+class MaintenanceInterrupted(Exception):
+    """The worker lost the lease or is shutting down; the next run picks up from here"""
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _distinct_values(collection, field: str, query: Optional[Dict[str, Any]] = None) -> Iterator:
+    """Distinct values of a field, streamed from an aggregation cursor
+    
+    distinct() returns all values in one reply document, which fails past 16 MB.
+    """
+    pipeline = ([{"$match": query}] if query else []) + [{"$group": {"_id": f"${field}"}}]
+    groups = collection.aggregate(pipeline, allowDiskUse=True, batchSize=settings.MAINTENANCE_BATCH_SIZE)
+    return (group["_id"] for group in groups if group["_id"] is not None)
+
+def delete_thread_checkpoints(db, thread_ids: List[str]) -> int:
+    """Delete the checkpoints and pending writes of LangGraph threads from the MongoDB checkpointer's collections"""
+    query = {"thread_id": {"$in": list(thread_ids)}}
+    writes = db[settings.LANGGRAPH_WRITES_COLLECTION].delete_many(query).deleted_count
+    return writes + db[settings.LANGGRAPH_CHECKPOINT_COLLECTION].delete_many(query).deleted_count
+
+class Maintenance:
+    """Runs the retention and orphan cleanup jobs on a schedule, in one worker at a time"""
+
+    def __init__(self):
+        # Lease holder: unique per process, since several uvicorn workers share a host
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.vector_store = None
+        self._db = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._lease_renewed = 0.0
+        self._previous_run: Optional[datetime] = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_database()
+        return self._db
+
+    @property
+    def state_collection(self):
+        return self.db[settings.MAINTENANCE_COLLECTION]
+
+    def start(self, vector_store=None):
+        """Start the schedule in this worker (runs only happen where the lease is free)"""
+        self.vector_store = vector_store
+        try:
+            self.record_chat_history_start()
+        except Exception as e:
+            logger.warning("Could not record when chat history was enabled: %s", e)
+        if settings.MAINTENANCE_INTERVAL_MINUTES <= 0:
+            logger.info("Scheduled maintenance disabled (MAINTENANCE_INTERVAL_MINUTES=0)")
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._schedule, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the schedule; a run in progress stops after its current batch"""
+        self._stop.set()
+
+    def record_chat_history_start(self):
+        """Keep the time conversation records started being written (cleared while they are not)
+        
+        Threads checkpointed before then have no conversation record without being orphaned.
+        """
+        if settings.ENABLE_CHAT_HISTORY:
+            update = {
+                "$setOnInsert": self._initial_state(datetime.now()),
+                "$min": {"chat_history_since": datetime.now(timezone.utc)}
+            }
+        else:
+            update = {"$setOnInsert": self._initial_state(datetime.now()), "$unset": {"chat_history_since": ""}}
+        try:
+            self.state_collection.update_one({"_id": MAINTENANCE_STATE_ID}, update, upsert=True)
+        except DuplicateKeyError:
+            self.state_collection.update_one({"_id": MAINTENANCE_STATE_ID}, update)
+
+    @staticmethod
+    def _initial_state(now: datetime) -> Dict[str, Any]:
+        return {"next_run_at": now, "lease_owner": None, "lease_expires": now, "last_run": None}
+
+    def status(self) -> Dict[str, Any]:
+        """Schedule, lease and the report of the last run"""
+        state = self.state_collection.find_one({"_id": MAINTENANCE_STATE_ID}, {"_id": 0}) or {}
+        return {"interval_minutes": settings.MAINTENANCE_INTERVAL_MINUTES, "jobs": list(JOBS), **state}
+
+    def run_now(self) -> Dict[str, Any]:
+        """Start a run in the background right away, whatever the schedule says"""
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError("Maintenance is already running in this worker")
+        try:
+            if not self._acquire_lease(force=True):
+                raise RuntimeError("Maintenance is running in another worker")
+        except Exception:
+            self._run_lock.release()
+            raise
+        threading.Thread(target=self._run_and_release, name="maintenance-run", daemon=True).start()
+        return self.status()
+
+    def run_if_due(self) -> Optional[Dict[str, Any]]:
+        """Run the jobs when a run is due and no other worker holds the lease; returns the report"""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            if not self._acquire_lease(force=False):
+                return None
+            return self._run()
+        finally:
+            self._run_lock.release()
+
+    def _schedule(self):
+        # Look for a due run a few times per interval; jitter spreads workers started together
+        poll = min(60.0, settings.MAINTENANCE_INTERVAL_MINUTES * 60 / 4)
+        while not self._stop.wait(poll * random.uniform(0.5, 1.5)):
+            try:
+                self.run_if_due()
+            except Exception:
+                logger.exception("Maintenance run failed")
+
+    def _run_and_release(self):
+        try:
+            self._run()
+        except Exception:
+            logger.exception("Maintenance run failed")
+        finally:
+            self._run_lock.release()
+
+    def _acquire_lease(self, force: bool) -> bool:
+        now = datetime.now()
+        try:
+            self.state_collection.update_one(
+                {"_id": MAINTENANCE_STATE_ID},
+                {"$setOnInsert": self._initial_state(now)},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # Another worker created it first
+        query = {
+            "_id": MAINTENANCE_STATE_ID,
+            "$or": [{"lease_owner": self.owner}, {"lease_expires": {"$lte": now}}]
+        }
+        if not force:
+            query["next_run_at"] = {"$lte": now}
+        result = self.state_collection.update_one(query, {"$set": {
+            "lease_owner": self.owner,
+            "lease_expires": now + timedelta(seconds=settings.MAINTENANCE_LEASE_SECONDS)
+        }})
+        if not result.matched_count:
+            return False
+        self._lease_renewed = time.monotonic()
+        last_run = self.state_collection.find_one({"_id": MAINTENANCE_STATE_ID}, {"last_run": 1}).get("last_run")
+        # Checkpoint trimming continues from the last run that got through it
+        completed = last_run is not None and "checkpoint_history" in last_run.get("deleted", {})
+        self._previous_run = last_run["started_at"] if completed else None
+        return True
+
+    def _renew_lease(self):
+        if self._stop.is_set():
+            raise MaintenanceInterrupted("Shutting down")
+        if time.monotonic() - self._lease_renewed < settings.MAINTENANCE_LEASE_SECONDS / 4:
+            return
+        now = datetime.now()
+        result = self.state_collection.update_one(
+            {"_id": MAINTENANCE_STATE_ID, "lease_owner": self.owner},
+            {"$set": {"lease_expires": now + timedelta(seconds=settings.MAINTENANCE_LEASE_SECONDS)}}
+        )
+        if not result.matched_count:
+            raise MaintenanceInterrupted("Lost the maintenance lease")
+        self._lease_renewed = time.monotonic()
+
+    def _run(self) -> Dict[str, Any]:
+        started_at = datetime.now()
+        report = {"started_at": started_at, "owner": self.owner, "deleted": {}, "errors": {}}
+        logger.info("Maintenance run started")
+        try:
+            with MAINTENANCE_RUN_SECONDS.time():
+                for job in JOBS:
+                    try:
+                        report["deleted"][job] = getattr(self, f"_{job}")()
+                    except MaintenanceInterrupted:
+                        raise
+                    except Exception as e:
+                        logger.exception("Maintenance job %s failed", job)
+                        report["errors"][job] = str(e)
+        except MaintenanceInterrupted as e:
+            report["errors"]["interrupted"] = str(e)
+            logger.warning("Maintenance run interrupted: %s", e)
+        finally:
+            finished_at = datetime.now()
+            report["finished_at"] = finished_at
+            self.state_collection.update_one(
+                {"_id": MAINTENANCE_STATE_ID, "lease_owner": self.owner},
+                {"$set": {
+                    "last_run": report,
+                    "next_run_at": finished_at + timedelta(minutes=max(settings.MAINTENANCE_INTERVAL_MINUTES, 0)),
+                    "lease_owner": None,
+                    "lease_expires": finished_at
+                }}
+            )
+        logger.info("Maintenance run finished in %.1f s: %s", (report["finished_at"] - started_at).total_seconds(),
+                    report["deleted"], extra={"errors": report["errors"]} if report["errors"] else None)
+        return report
+
+    def _pace(self, job: str, deleted: int, started: float):
+        """Count a batch, hold the delete rate, give way to requests and keep the lease"""
+        if deleted:
+            MAINTENANCE_DELETED_TOTAL.labels(job=job).inc(deleted)
+        if settings.MAINTENANCE_DELETES_PER_SECOND > 0:
+            delay = deleted / settings.MAINTENANCE_DELETES_PER_SECOND - (time.monotonic() - started)
+            if delay > 0 and self._stop.wait(delay):
+                raise MaintenanceInterrupted("Shutting down")
+        # Gives way for at most half a lease, so the run keeps its lease under constant load
+        waited = 0.0
+        while (requests_in_flight() > settings.MAINTENANCE_MAX_IN_FLIGHT
+               and waited < settings.MAINTENANCE_LEASE_SECONDS / 2):
+            if self._stop.wait(0.5):
+                raise MaintenanceInterrupted("Shutting down")
+            waited += 0.5
+        self._renew_lease()
+
+    def _delete_conversations(self, conversation_ids: List[str]) -> int:
+        """Delete conversations with their messages and LangGraph state"""
+        query = {"conversation_id": {"$in": conversation_ids}}
+        deleted = self.db[settings.MESSAGES_COLLECTION].delete_many(query).deleted_count
+        deleted += delete_thread_checkpoints(self.db, conversation_ids)
+        return deleted + self.db[settings.CHAT_HISTORY_COLLECTION].delete_many(query).deleted_count
+
+    def _existing(self, collection, field: str, values: List[Any], query: Optional[Dict[str, Any]] = None) -> set:
+        if not values:
+            return set()
+        return {doc[field] for doc in collection.find({field: {"$in": values}, **(query or {})}, {field: 1})}
+
+    def _expired_conversations(self) -> int:
+        """Conversations idle for RETENTION_CONVERSATION_DAYS, with everything that belongs to them"""
+        if settings.RETENTION_CONVERSATION_DAYS <= 0:
+            return 0
+        cutoff = datetime.now() - timedelta(days=settings.RETENTION_CONVERSATION_DAYS)
+        conversations = self.db[settings.CHAT_HISTORY_COLLECTION]
+        deleted = 0
+        while True:
+            started = time.monotonic()
+            conversation_ids = [
+                conversation["conversation_id"] for conversation in
+                conversations.find({"updated_at": {"$lt": cutoff}}, {"conversation_id": 1})
+                .limit(settings.MAINTENANCE_BATCH_SIZE)
+            ]
+            if not conversation_ids:
+                return deleted
+            count = self._delete_conversations(conversation_ids)
+            deleted += count
+            self._pace("expired_conversations", count, started)
+
+    def _failed_documents(self) -> int:
+        """Failed (or abandoned) ingestions older than their retention, with their partial vectors"""
+        if settings.RETENTION_FAILED_DOCUMENT_DAYS <= 0:
+            return 0
+        now = datetime.now()
+        query = {"$or": [
+            {"processing_status": "error",
+             "date_added": {"$lt": now - timedelta(days=settings.RETENTION_FAILED_DOCUMENT_DAYS)}},
+            {"processing_status": "processing",
+             "date_added": {"$lt": now - timedelta(hours=settings.RETENTION_STALE_PROCESSING_HOURS)}}
+        ]}
+        documents = self.db[settings.DOCUMENTS_COLLECTION]
+        deletes_vectors = hasattr(self.vector_store, "delete_by_documents")
+        if not deletes_vectors:
+            logger.debug("%s cannot delete by document; only failed document records are removed",
+                         type(self.vector_store).__name__)
+        deleted = 0
+        while True:
+            started = time.monotonic()
+            document_ids = [doc["_id"] for doc in documents.find(query, {"_id": 1}).limit(settings.MAINTENANCE_BATCH_SIZE)]
+            if not document_ids:
+                return deleted
+            count = self.vector_store.delete_by_documents(document_ids) if deletes_vectors else 0
+            count += documents.delete_many({"_id": {"$in": document_ids}}).deleted_count
+            deleted += count
+            self._pace("failed_documents", count, started)
+
+    def _orphaned_messages(self) -> int:
+        """Messages whose conversation no longer exists"""
+        messages = self.db[settings.MESSAGES_COLLECTION]
+        conversations = self.db[settings.CHAT_HISTORY_COLLECTION]
+        deleted = 0
+        for conversation_ids in _batched(_distinct_values(messages, "conversation_id"), settings.MAINTENANCE_BATCH_SIZE):
+            started = time.monotonic()
+            existing = self._existing(conversations, "conversation_id", conversation_ids)
+            orphaned = [conversation_id for conversation_id in conversation_ids if conversation_id not in existing]
+            count = messages.delete_many({"conversation_id": {"$in": orphaned}}).deleted_count if orphaned else 0
+            deleted += count
+            self._pace("orphaned_messages", count, started)
+        return deleted
+
+    def _orphaned_checkpoints(self) -> int:
+        """LangGraph threads without a conversation (deleted conversations, /chat/batch runs)
+        
+        Only threads started since chat history was enabled: older ones never got a conversation
+        record, so missing one says nothing about them.
+        """
+        if not settings.MAINTENANCE_ORPHANED_CHECKPOINTS or not settings.ENABLE_CHAT_HISTORY:
+            return 0  # Without conversation records every thread would look orphaned
+        state = self.state_collection.find_one({"_id": MAINTENANCE_STATE_ID}, {"chat_history_since": 1}) or {}
+        if state.get("chat_history_since") is None:
+            logger.info("Skipping orphaned checkpoints: no record of when chat history was enabled")
+            return 0
+        since = ObjectId.from_datetime(state["chat_history_since"])
+        checkpoints = self.db[settings.LANGGRAPH_CHECKPOINT_COLLECTION]
+        conversations = self.db[settings.CHAT_HISTORY_COLLECTION]
+        # Threads checkpointed lately may still be waiting for their conversation to be written
+        grace = datetime.now(timezone.utc) - timedelta(minutes=settings.MAINTENANCE_ORPHAN_GRACE_MINUTES)
+        recent = set(_distinct_values(checkpoints, "thread_id", {"_id": {"$gte": ObjectId.from_datetime(grace)}}))
+        deleted = 0
+        thread_ids = (
+            thread_id for thread_id in _distinct_values(checkpoints, "thread_id", {"_id": {"$gte": since}})
+            if thread_id not in recent
+        )
+        for batch in _batched(thread_ids, settings.MAINTENANCE_BATCH_SIZE):
+            started = time.monotonic()
+            existing = self._existing(conversations, "conversation_id", batch)
+            # A thread that already existed before then is not orphaned by lacking a record either
+            existing |= self._existing(checkpoints, "thread_id", [
+                thread_id for thread_id in batch if thread_id not in existing
+            ], {"_id": {"$lt": since}})
+            orphaned = [thread_id for thread_id in batch if thread_id not in existing]
+            count = delete_thread_checkpoints(self.db, orphaned) if orphaned else 0
+            deleted += count
+            self._pace("orphaned_checkpoints", count, started)
+        return deleted
+
+    def _orphaned_vectors(self) -> int:
+        """Chunk references of documents that no longer exist, and chunks left without references"""
+        store = self.vector_store
+        if not hasattr(store, "delete_unreferenced_chunks"):
+            return 0
+        documents = self.db[settings.DOCUMENTS_COLLECTION]
+        deleted = 0
+        for document_ids in _batched(store.referenced_document_ids(settings.MAINTENANCE_BATCH_SIZE),
+                                     settings.MAINTENANCE_BATCH_SIZE):
+            started = time.monotonic()
+            existing = self._existing(documents, "_id", document_ids)
+            orphaned = [document_id for document_id in document_ids if document_id not in existing]
+            count = store.delete_by_documents(orphaned) if orphaned else 0
+            deleted += count
+            self._pace("orphaned_vectors", count, started)
+
+        after = None
+        while True:
+            started = time.monotonic()
+            count, after = store.delete_unreferenced_chunks(after, settings.MAINTENANCE_BATCH_SIZE)
+            deleted += count
+            self._pace("orphaned_vectors", count, started)
+            if after is None:
+                return deleted
+
+    def _checkpoint_history(self) -> int:
+        """Checkpoints beyond the newest CHECKPOINTS_PER_THREAD of threads active since the last run"""
+        keep = settings.CHECKPOINTS_PER_THREAD
+        if keep <= 0:
+            return 0
+        checkpoints = self.db[settings.LANGGRAPH_CHECKPOINT_COLLECTION]
+        writes = self.db[settings.LANGGRAPH_WRITES_COLLECTION]
+        # Only threads written to since the last run can have grown (the first run checks them all)
+        query = {"updated_at": {"$gte": self._previous_run}} if self._previous_run else {}
+        conversations = iter_rows(self.db[settings.CHAT_HISTORY_COLLECTION], query, "updated_at", "conversation_id",
+                                  settings.MAINTENANCE_BATCH_SIZE, projection={"conversation_id": 1, "updated_at": 1})
+        deleted = 0
+        for conversation in conversations:
+            thread_id = conversation["conversation_id"]
+            started = time.monotonic()
+            thread = {"thread_id": thread_id, "checkpoint_ns": ""}
+            # checkpoint_id is time-ordered (the checkpointer reads the highest as the latest)
+            old = [
+                checkpoint["checkpoint_id"] for checkpoint in
+                checkpoints.find(thread, {"checkpoint_id": 1}).sort("checkpoint_id", -1).skip(keep)
+            ]
+            count = 0
+            if old:
+                count = writes.delete_many({**thread, "checkpoint_id": {"$in": old}}).deleted_count
+                count += checkpoints.delete_many({**thread, "checkpoint_id": {"$in": old}}).deleted_count
+            deleted += count
+            self._pace("checkpoint_history", count, started)
+        return deleted
+
+maintenance = Maintenance()
@@ -2,6 +2,10 @@
 from pymongo import MongoClient
 from motor.motor_asyncio import AsyncIOMotorClient
 from ..config import settings
+from ..logging_config import get_logger
+from ..tracing import ensure_trace_collection
+
+logger = get_logger(__name__)
 
 # Synchronous client
 def get_mongodb_client():
@@ -42,23 +46,39 @@ def init_database():
         if collection not in db.list_collection_names():
             db.create_collection(collection)
     
+    # Capped collection for slow request traces
+    try:
+        ensure_trace_collection(db)
+    except Exception as e:
+        logger.warning("Could not create request traces collection: %s", e)
+    
     # Create indexes for better performance
     try:
-        # Conversations indexes
+        # Conversations indexes (the id tie-breaker makes listing pages pure index range scans)
         db.conversations.create_index([("conversation_id", 1)], unique=True)
-        db.conversations.create_index([("user_id", 1), ("updated_at", -1)])
+        db.conversations.create_index([("user_id", 1), ("updated_at", -1), ("conversation_id", -1)])
+        db.conversations.create_index([("updated_at", 1), ("conversation_id", 1)])  # Retention and checkpoint trimming walk it
         
         # Messages indexes
-        db.messages.create_index([("conversation_id", 1), ("timestamp", 1)])
+        db.messages.create_index([("conversation_id", 1), ("timestamp", 1), ("message_id", 1)])
         db.messages.create_index([("message_id", 1)], unique=True)
         
         # Documents indexes (existing)
         db.documents.create_index([("user_id", 1)])
+        # Update-in-place ingestion finds a user's earlier upload of a source
+        db.documents.create_index([("user_id", 1), ("metadata.source", 1)])
+        # One in-place update per source at a time, across workers
+        db[settings.SOURCE_UPDATES_COLLECTION].create_index([("user_id", 1), ("source", 1)], unique=True)
+        # Retention finds failed and abandoned ingestions
+        db.documents.create_index([("processing_status", 1), ("date_added", 1)])
         
-        print("✅ Database indexes created successfully")
+        # URL fetch validators, one record per URL and user
+        db[settings.URL_CACHE_COLLECTION].create_index([("url", 1), ("user_id", 1)], unique=True)
+        
+        logger.info("Database indexes created")
         
     except Exception as e:
-        print(f"⚠️ Warning: Could not create indexes: {e}")
+        logger.warning("Could not create indexes: %s", e)
     
     # Setup vector index if needed (existing functionality)
     setup_vector_index(db)
@@ -67,17 +87,27 @@ def init_database():
 
 def setup_vector_index(db):
     """Set up vector search index if it doesn't exist"""
-    # In a production environment with MongoDB Atlas, you would set up
-    # vector search index here. For local development, this is a placeholder.
+    # With MongoDB Atlas the vector search index is created and validated here.
+    # For local development, similarity is calculated in Python instead.
     vectors_collection = db[settings.VECTORS_COLLECTION]
     
-    # Check if index exists
+    is_atlas = "mongodb.net" in settings.MONGODB_CONNECTION_STRING or "mongodb+srv" in settings.MONGODB_CONNECTION_STRING
+    if not is_atlas:
+        logger.info("Local MongoDB detected - vector search runs in Python")
+        return
+    
+    if not settings.ATLAS_CREATE_SEARCH_INDEX:
+        logger.info("Atlas search index creation disabled (ATLAS_CREATE_SEARCH_INDEX=False)")
+        return
+    
     try:
-        existing_indexes = list(vectors_collection.list_indexes())
-        index_exists = any("vector" in idx.get("name", "") for idx in existing_indexes)
-        
-        if not index_exists:
-            print("💡 Note: For production, set up a vector search index in MongoDB Atlas")
-            print("📚 Follow MongoDB Atlas documentation for vector search setup")
+        from ..vector_store.mongodb_store import ensure_vector_search_index, MIGRATION_STATE_ID
+        # After an embedding migration the serving vectors may be in the other slot, at another size
+        state = db[settings.EMBEDDING_MIGRATIONS_COLLECTION].find_one({"_id": MIGRATION_STATE_ID})
+        if state is None:
+            ensure_vector_search_index(vectors_collection)
+        else:
+            ensure_vector_search_index(vectors_collection, num_dimensions=state["active"]["dimensions"],
+                                       slot=state["active"]["slot"])
     except Exception as e:
-        print(f"⚠️ Could not check vector indexes: {e}")
\ No newline at end of file
+        logger.warning("Could not check vector indexes: %s", e)
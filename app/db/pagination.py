@@ -0,0 +1,67 @@
+# app/db/pagination.py
+"""
+Keyset (cursor) pagination for lists ordered by a timestamp with an id tie-breaker.
+
+A page continues strictly after the last row of the previous one, so each page is an index range
+scan of `limit` entries however deep it is, and rows written meanwhile do not shift or repeat
+pages the way skip/limit does. The compound index must cover the filter prefix plus both keys.
+Cursors are opaque to clients: base64 of the last row's (timestamp, id).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+def encode_cursor(sort_value: datetime, tie_breaker: str) -> str:
+    """Cursor pointing after the row with this (timestamp, id)"""
+    raw = json.dumps([sort_value.isoformat(), tie_breaker], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """(timestamp, id) of a cursor; raises ValueError for anything encode_cursor did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, tie_breaker = json.loads(raw)
+        return datetime.fromisoformat(sort_value), str(tie_breaker)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def keyset_sort(sort_field: str, tie_field: str, descending: bool = False) -> List[Tuple[str, int]]:
+    direction = -1 if descending else 1
+    return [(sort_field, direction), (tie_field, direction)]
+
+def keyset_filter(sort_field: str, tie_field: str, cursor: str, descending: bool = False) -> Dict[str, Any]:
+    """Rows that come after the cursor in keyset_sort order"""
+    sort_value, tie_breaker = decode_cursor(cursor)
+    after = "$lt" if descending else "$gt"
+    return {"$or": [
+        {sort_field: {after: sort_value}},
+        {sort_field: sort_value, tie_field: {after: tie_breaker}}
+    ]}
+
+def read_page(collection, query: Dict[str, Any], sort_field: str, tie_field: str, limit: int,
+              cursor: Optional[str] = None, descending: bool = False,
+              projection: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of rows and the cursor of the next page (None on the last page)"""
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort_field, tie_field, cursor, descending)]}
+    # One row more than asked tells whether there is a next page
+    rows = list(
+        collection.find(query, projection)
+        .sort(keyset_sort(sort_field, tie_field, descending))
+        .limit(limit + 1)
+    )
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][sort_field], rows[-1][tie_field])
+
+def iter_rows(collection, query: Dict[str, Any], sort_field: str, tie_field: str, page_size: int,
+              descending: bool = False, projection: Optional[Dict[str, Any]] = None):
+    """Every matching row in keyset order, read one page at a time (constant memory, no cursor timeouts)"""
+    cursor = None
+    while True:
+        rows, cursor = read_page(collection, query, sort_field, tie_field, page_size, cursor, descending, projection)
+        yield from rows
+        if cursor is None:
+            return
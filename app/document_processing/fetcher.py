@@ -0,0 +1,120 @@
+# app/document_processing/fetcher.py
+"""
+Async URL fetching.
+
+One shared httpx.AsyncClient (connection pool, timeouts) serves every URL fetch. A batch
+passes its own semaphore per host so many URLs from one site do not hammer it. Fetches can be
+conditional (If-None-Match / If-Modified-Since); HTML is parsed off the event loop.
+"""
+import asyncio
+import hashlib
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..tracing import trace_span
+
+logger = get_logger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+class FetchedPage:
+    """Result of a URL fetch; text is None when the server answered 304 Not Modified"""
+
+    def __init__(self, url: str, status: int, text: Optional[str] = None, title: Optional[str] = None,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None, sha256: Optional[str] = None):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.title = title
+        self.etag = etag
+        self.last_modified = last_modified
+        self.sha256 = sha256
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared client for URL fetches (created on first use)"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.URL_FETCH_TIMEOUT, connect=settings.URL_FETCH_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.URL_FETCH_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.URL_FETCH_MAX_CONNECTIONS
+            ),
+            follow_redirects=True,
+            headers={"User-Agent": settings.URL_FETCH_USER_AGENT}
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _host_limit(url: str, host_limits: Dict[str, asyncio.Semaphore]) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc.lower()
+    if host not in host_limits:
+        host_limits[host] = asyncio.Semaphore(settings.URL_FETCH_PER_HOST)
+    return host_limits[host]
+
+def _extract_text(body: bytes, content_type: str, encoding: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Page text and title from a response body"""
+    if "html" not in content_type and "xml" not in content_type:
+        return body.decode(encoding or "utf-8", errors="replace"), None
+
+    soup = BeautifulSoup(body, "html.parser", from_encoding=encoding)
+    title = soup.title.get_text(strip=True) if soup.title else None
+    for element in soup(["script", "style", "noscript"]):
+        element.decompose()
+    return soup.get_text(separator="\n", strip=True), title
+
+async def fetch_url(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                    host_limits: Optional[Dict[str, asyncio.Semaphore]] = None) -> FetchedPage:
+    """GET a URL, conditionally when validators from an earlier fetch are given
+
+    `host_limits` is the per-host semaphores of the batch this fetch belongs to; they live
+    only as long as the batch, so hosts do not pile up across requests or event loops.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with _host_limit(url, {} if host_limits is None else host_limits):
+        with trace_span("fetch.url"):
+            async with get_http_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    return FetchedPage(url, 304, etag=etag, last_modified=last_modified)
+                response.raise_for_status()
+
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) > settings.URL_FETCH_MAX_BYTES:
+                        raise ValueError(f"Response exceeds the {settings.URL_FETCH_MAX_BYTES} byte limit")
+
+    logger.debug("Fetched %s (%d bytes, status %d)", url, len(body), response.status_code)
+    body = bytes(body)
+    text, title = await run_in_threadpool(
+        _extract_text, body, response.headers.get("content-type", "").lower(), response.charset_encoding
+    )
+    return FetchedPage(
+        url,
+        response.status_code,
+        text=text,
+        title=title,
+        etag=response.headers.get("etag"),
+        last_modified=response.headers.get("last-modified"),
+        sha256=hashlib.sha256(body).hexdigest()
+    )
@@ -1,108 +1,171 @@
 # app/document_processing/loaders.py
 import os
 import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Iterator, Tuple
 from fastapi import HTTPException
 from langchain_core.documents import Document
-from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader, TextLoader
+from langchain_community.document_loaders import TextLoader
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..logging_config import get_logger
+from .fetcher import fetch_url, FetchedPage
+from .pdf_pages import count_pages, extract_page_range, iter_page_texts
+
+logger = get_logger(__name__)
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+def _pdf_worker_count() -> int:
+    return settings.PDF_WORKERS or os.cpu_count() or 1
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """Process pool for PDF text extraction (spawned, so workers do not inherit the app's threads)"""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(
+            max_workers=_pdf_worker_count(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_executor
+
+def shutdown_pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+def _iter_page_texts_parallel(path: str, page_count: int) -> Iterator[Tuple[int, str]]:
+    """Extract page ranges across the process pool, yielding pages in order
+
+    Only a window of ranges is in flight at a time, so extracted text does not pile up
+    faster than the consumer chunks and embeds it.
+    """
+    executor = get_pdf_executor()
+    # Enough ranges to keep every worker busy, but no smaller than PDF_PAGES_PER_TASK
+    step = max(1, settings.PDF_PAGES_PER_TASK, -(-page_count // (4 * _pdf_worker_count())))
+    starts = iter(range(0, page_count, step))
+    pending = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            pending.append(executor.submit(extract_page_range, path, start, min(start + step, page_count)))
+
+    try:
+        for _ in range(2 * _pdf_worker_count()):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        for future in pending:
+            future.cancel()
+
+def iter_pdf_pages(path: str, filename: str, title: Optional[str] = None) -> Iterator[Document]:
+    """Stream a PDF as one Document per page
+
+    The file is opened eagerly so an invalid PDF fails here (400) rather than midway
+    through ingestion. Large PDFs are extracted across the PDF process pool.
+    """
+    try:
+        page_count = count_pages(path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to load PDF: {str(e)}")
+
+    parallel = page_count >= settings.PDF_PARALLEL_MIN_PAGES and _pdf_worker_count() > 1
+    logger.debug("Extracting %d pages from %s (%s)", page_count, filename, "parallel" if parallel else "serial")
+    page_texts = _iter_page_texts_parallel(path, page_count) if parallel else iter_page_texts(path)
+
+    doc_title = title or filename
+    date_added = datetime.now()
+
+    def pages() -> Iterator[Document]:
+        for page_number, text in page_texts:
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": filename,
+                    "title": doc_title,
+                    "type": "pdf",
+                    "page": page_number,
+                    "total_pages": page_count,
+                    "date_added": date_added
+                }
+            )
+
+    return pages()
+
+def page_documents(page: FetchedPage, title: Optional[str] = None) -> List[Document]:
+    """Documents for a fetched web page"""
+    # Set title if provided, else the page title, else the last URL segment
+    doc_title = title or page.title or page.url.rstrip("/").split("/")[-1]
+    return [Document(
+        page_content=page.text or "",
+        metadata={
+            "source": page.url,
+            "title": doc_title,
+            "type": "url",
+            "content_sha256": page.sha256,
+            "date_added": datetime.now()
+        }
+    )]
 
 async def load_document_from_url(url: str, title: Optional[str] = None) -> List[Document]:
-    """Load document from URL with enhanced debugging"""
-    print(f"load_document_from_url: Starting with URL {url}")
+    """Load document from URL"""
     try:
-        print(f"Creating WebBaseLoader for URL: {url}")
-        loader = WebBaseLoader(url)
-        print(f"Calling loader.load()")
-        documents = loader.load()
-        print(f"✅ Successfully loaded {len(documents)} documents from URL")
-        
-        # Set title if provided or extract from URL
-        doc_title = title or url.split("/")[-1]
-        print(f"Setting document title: {doc_title}")
-        
-        # Update metadata
-        for i, doc in enumerate(documents):
-            doc.metadata.update({
-                "source": url,
-                "title": doc_title,
-                "type": "url",
-                "date_added": datetime.now()
-            })
-            print(f"Updated metadata for document {i+1}")
-        
-        return documents
+        page = await fetch_url(url)
     except Exception as e:
-        import traceback
-        print(f"❌ ERROR in load_document_from_url: {str(e)}")
-        print(f"Exception type: {type(e).__name__}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.warning("Failed to load URL %s: %s", url, e)
         raise HTTPException(status_code=400, detail=f"Failed to load URL: {str(e)}")
+    return page_documents(page, title)
 
 async def load_document_from_pdf(file_content: bytes, filename: str, title: Optional[str] = None) -> List[Document]:
-    """Load document from PDF file"""
+    """Load document from PDF file (all pages in memory - prefer iter_pdf_pages for ingestion)"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        tmp_file.write(file_content)
+        tmp_path = tmp_file.name
     try:
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
-        
-        # Load PDF
-        loader = PyPDFLoader(tmp_path)
-        documents = loader.load()
-        
-        # Clean up temporary file
-        os.unlink(tmp_path)
-        
-        # Set title if provided or use filename
-        doc_title = title or filename
-        
-        # Update metadata
-        for doc in documents:
-            doc.metadata.update({
-                "source": filename,
-                "title": doc_title,
-                "type": "pdf",
-                "date_added": datetime.now()
-            })
-        
-        return documents
+        return await run_in_threadpool(lambda: list(iter_pdf_pages(tmp_path, filename, title)))
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up on error
-        if 'tmp_path' in locals():
-            os.unlink(tmp_path)
         raise HTTPException(status_code=400, detail=f"Failed to load PDF: {str(e)}")
+    finally:
+        os.unlink(tmp_path)
+
+def load_document_from_text_file(path: str, filename: str, title: Optional[str] = None) -> List[Document]:
+    """Load a UTF-8 text file from disk"""
+    try:
+        documents = TextLoader(path, encoding="utf-8").load()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to load text file: {str(e)}")
+    
+    # Set title if provided or use filename
+    doc_title = title or filename
+    
+    # Update metadata
+    for doc in documents:
+        doc.metadata.update({
+            "source": filename,
+            "title": doc_title,
+            "type": "text",
+            "date_added": datetime.now()
+        })
+    
+    return documents
 
 async def load_document_from_text(file_content: str, filename: str, title: Optional[str] = None) -> List[Document]:
-    """Load document from text file"""
+    """Load document from text content"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as tmp_file:
+        tmp_file.write(file_content.encode('utf-8'))
+        tmp_path = tmp_file.name
     try:
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as tmp_file:
-            tmp_file.write(file_content.encode('utf-8'))
-            tmp_path = tmp_file.name
-        
-        # Load text file
-        loader = TextLoader(tmp_path)
-        documents = loader.load()
-        
-        # Clean up temporary file
+        return load_document_from_text_file(tmp_path, filename, title)
+    finally:
         os.unlink(tmp_path)
-        
-        # Set title if provided or use filename
-        doc_title = title or filename
-        
-        # Update metadata
-        for doc in documents:
-            doc.metadata.update({
-                "source": filename,
-                "title": doc_title,
-                "type": "text",
-                "date_added": datetime.now()
-            })
-        
-        return documents
-    except Exception as e:
-        # Clean up on error
-        if 'tmp_path' in locals():
-            os.unlink(tmp_path)
-        raise HTTPException(status_code=400, detail=f"Failed to load text file: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,34 @@
+# app/document_processing/pdf_pages.py
+"""
+Page-level PDF text extraction.
+
+Kept free of app imports so PDF worker processes only load pypdf.
+"""
+import os
+from typing import List, Tuple, Iterator, Optional
+
+from pypdf import PdfReader
+
+# A worker usually gets several page ranges of the same file - keep its parsed reader
+_cached_reader: Optional[Tuple[Tuple[str, float], PdfReader]] = None
+
+def _reader(path: str) -> PdfReader:
+    global _cached_reader
+    key = (path, os.path.getmtime(path))
+    if _cached_reader is None or _cached_reader[0] != key:
+        _cached_reader = (key, PdfReader(path))
+    return _cached_reader[1]
+
+def count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+def extract_page_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Extract (page_number, text) for pages [start, stop) - runs in a worker process"""
+    reader = _reader(path)
+    return [(number, reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+def iter_page_texts(path: str) -> Iterator[Tuple[int, str]]:
+    """Extract (page_number, text) one page at a time in this process"""
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages):
+        yield number, page.extract_text() or ""
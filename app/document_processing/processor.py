@@ -1,8 +1,13 @@
 # app/document_processing/processor.py - Updated for MongoDB Vector Store
+import hashlib
 import uuid
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
 from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
@@ -10,174 +15,380 @@ from langchain_openai import OpenAIEmbeddings
 from ..config import settings
 from ..db.mongodb import get_database
 from ..vector_store import get_vector_store  # Uses factory pattern now
+from ..metrics import track_stage, CHUNKING_SECONDS
+from ..logging_config import get_logger
+from ..tracing import trace_span
 
-async def process_and_store_documents(documents: List[Document], user_id: str):
-    """Process documents and store in MongoDB with vector embeddings"""
-    print(f"\n==== DOCUMENT PROCESSING (MongoDB Vector Store) ====")
-    print(f"Processing {len(documents)} documents for user {user_id}")
+logger = get_logger(__name__)
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """Split documents into chunks using the configured chunk size and overlap"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        length_function=len,
+    )
+    with track_stage(CHUNKING_SECONDS):
+        return text_splitter.split_documents(documents)
+
+def assign_parent_documents(chunks: List[Document], documents: List[Document], user_id: str,
+                            start_index: int = 0) -> Dict[str, int]:
+    """Add parent document references to chunks, returning the chunk count per document id"""
+    chunk_count_by_doc = {}
     
-    try:
-        print(f"Step 1: Getting database connection")
-        db = get_database()
-        print(f"✅ Database connection successful")
-        
-        # Split documents into chunks
-        print(f"Step 2: Splitting documents into chunks")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            length_function=len,
-        )
-        chunks = text_splitter.split_documents(documents)
-        print(f"✅ Split into {len(chunks)} chunks")
-        
-        # Store original documents in MongoDB
-        print(f"Step 3: Storing original documents in MongoDB")
-        docs_collection = db[settings.DOCUMENTS_COLLECTION]
-        document_ids = []
-        
-        for i, doc in enumerate(documents):
-            doc_id = str(uuid.uuid4())
-            document_ids.append(doc_id)
-            print(f"  Storing document {i+1} with ID: {doc_id}")
-            
-            # Store document metadata and content
-            doc_record = {
-                "_id": doc_id,
-                "content": doc.page_content,
-                "metadata": doc.metadata,
-                "user_id": user_id,
-                "date_added": datetime.now(),
-                "chunk_count": 0,  # Will be updated after chunking
-                "processing_status": "processing"
-            }
-            try:
-                result = docs_collection.insert_one(doc_record)
-                print(f"  ✅ MongoDB insert successful: {result.acknowledged}")
-            except Exception as e:
-                print(f"  ❌ MongoDB insert error: {str(e)}")
-                raise
-            
-            # Add document_id to metadata for reference
-            if not doc.metadata:
-                doc.metadata = {}
-            doc.metadata["document_id"] = doc_id
-        
-        # Add parent document reference to chunks
-        print(f"Step 4: Adding parent document references to chunks")
-        chunk_count_by_doc = {}
-        
-        for i, chunk in enumerate(chunks):
-            # Find document this chunk belongs to
-            parent_doc = None
+    for i, chunk in enumerate(chunks, start=start_index):
+        # Chunks split from documents that already carry an id inherit it; otherwise find the parent
+        parent_doc_id = (chunk.metadata or {}).get("document_id")
+        if parent_doc_id is None:
             for doc in documents:
-                if chunk.page_content in doc.page_content:
-                    parent_doc = doc
+                if chunk.page_content in doc.page_content and "document_id" in doc.metadata:
+                    parent_doc_id = doc.metadata["document_id"]
                     break
-            
-            if parent_doc and "document_id" in parent_doc.metadata:
-                # Add reference to parent document
-                if not chunk.metadata:
-                    chunk.metadata = {}
-                
-                parent_doc_id = parent_doc.metadata["document_id"]
-                chunk.metadata["parent_document_id"] = parent_doc_id
-                chunk.metadata["document_id"] = parent_doc_id  # For compatibility
-                chunk.metadata["user_id"] = user_id
-                chunk.metadata["chunk_index"] = i
-                
-                # Count chunks per document
-                if parent_doc_id not in chunk_count_by_doc:
-                    chunk_count_by_doc[parent_doc_id] = 0
-                chunk_count_by_doc[parent_doc_id] += 1
-                
-            if i < 3 or i == len(chunks) - 1:
-                print(f"  Chunk {i+1}/{len(chunks)} metadata: {chunk.metadata}")
         
-        # Add chunks to MongoDB vector store
-        print(f"Step 5: Adding chunks to MongoDB vector store")
-        try:
-            vector_store = get_vector_store()
-            print(f"  Vector store initialized: {type(vector_store).__name__}")
-            
-            # Check OpenAI API key
-            openai_key = settings.OPENAI_API_KEY
-            if not openai_key:
-                print(f"  ❌ WARNING: OPENAI_API_KEY is not set")
-            else:
-                print(f"  ✅ OPENAI_API_KEY is set (length: {len(openai_key)})")
+        if parent_doc_id:
+            # Add reference to parent document
+            if not chunk.metadata:
+                chunk.metadata = {}
             
-            # Add documents to vector store
-            print(f"  Adding {len(chunks)} chunks to vector store...")
-            vector_store.add_documents(chunks, user_id)
-            print(f"  ✅ Successfully added chunks to MongoDB vector store")
+            chunk.metadata["parent_document_id"] = parent_doc_id
+            chunk.metadata["document_id"] = parent_doc_id  # For compatibility
+            chunk.metadata["user_id"] = user_id
+            chunk.metadata["chunk_index"] = i
             
-            # Get vector store statistics
-            try:
-                stats = vector_store.get_stats()
-                print(f"  📊 Vector store now contains {stats.get('total_documents', 0)} total documents")
-            except Exception as e:
-                print(f"  ⚠️ Could not get vector store stats: {e}")
-                
-        except Exception as e:
-            import traceback
-            print(f"  ❌ Vector store error: {str(e)}")
-            print(f"  ❌ Traceback: {traceback.format_exc()}")
-            raise
+            # Count chunks per document
+            if parent_doc_id not in chunk_count_by_doc:
+                chunk_count_by_doc[parent_doc_id] = 0
+            chunk_count_by_doc[parent_doc_id] += 1
+    
+    return chunk_count_by_doc
+
+def _batched(documents: Iterable[Document], size: int) -> Iterator[List[Document]]:
+    iterator = iter(documents)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _document_record(doc_id: str, doc: Document, user_id: str) -> Dict[str, Any]:
+    # Store document metadata; the text itself lives once in the canonical chunks
+    return {
+        "_id": doc_id,
+        "content_sha256": _content_hash(doc.page_content),
+        "content_length": len(doc.page_content),
+        "metadata": dict(doc.metadata or {}),
+        "user_id": user_id,
+        "date_added": datetime.now(),
+        "chunk_count": 0,  # Will be updated after chunking
+        "processing_status": "processing"
+    }
+
+def _store_batch(batch: List[Document], user_id: str, docs_collection, vector_store,
+                 document_ids: List[str], chunk_offset: int) -> int:
+    """Store, chunk and embed one batch of documents, returning its chunk count"""
+    records = []
+    for doc in batch:
+        doc_id = str(uuid.uuid4())
+        document_ids.append(doc_id)
+        records.append(_document_record(doc_id, doc, user_id))
         
-        # Update document records with chunk counts and completion status
-        print(f"Step 6: Updating document records with processing results")
-        for doc_id in document_ids:
-            chunk_count = chunk_count_by_doc.get(doc_id, 0)
-            try:
-                docs_collection.update_one(
-                    {"_id": doc_id},
+        # Add document_id to metadata so chunks inherit the reference
+        if not doc.metadata:
+            doc.metadata = {}
+        doc.metadata["document_id"] = doc_id
+    
+    with trace_span("mongo.store_documents"):
+        docs_collection.insert_many(records, ordered=False)
+    
+    chunks = split_documents(batch)
+    chunk_count_by_doc = assign_parent_documents(chunks, batch, user_id, start_index=chunk_offset)
+    if chunks:
+        vector_store.add_documents(chunks, user_id)
+    
+    # Where each document's chunk numbering starts, so an in-place update can keep it
+    chunk_start_by_doc = {}
+    for chunk in chunks:
+        chunk_start_by_doc.setdefault(chunk.metadata.get("document_id"), chunk.metadata.get("chunk_index"))
+    
+    # Update document records with chunk counts and completion status
+    completed_at = datetime.now()
+    try:
+        with trace_span("mongo.update_documents"):
+            docs_collection.bulk_write([
+                UpdateOne(
+                    {"_id": record["_id"]},
                     {
                         "$set": {
-                            "chunk_count": chunk_count,
+                            "chunk_count": chunk_count_by_doc.get(record["_id"], 0),
+                            "chunk_start": chunk_start_by_doc.get(record["_id"], chunk_offset),
                             "processing_status": "completed",
-                            "processing_completed_at": datetime.now()
+                            "processing_completed_at": completed_at
                         }
                     }
                 )
-                print(f"  ✅ Updated document {doc_id}: {chunk_count} chunks")
-            except Exception as e:
-                print(f"  ⚠️ Warning: Could not update document {doc_id}: {e}")
+                for record in records
+            ], ordered=False)
+    except Exception as e:
+        logger.warning("Could not update %d documents: %s", len(records), e)
+    
+    return len(chunks)
+
+async def process_and_store_documents(documents: Iterable[Document], user_id: str) -> List[str]:
+    """Process documents and store in MongoDB with vector embeddings
+
+    Documents may be a lazy stream (e.g. PDF pages); they are stored, chunked and
+    embedded INGEST_BATCH_DOCUMENTS at a time, so only one batch is held in memory.
+    """
+    logger.debug("Processing documents for user %s", user_id)
+    document_ids: List[str] = []
+    
+    try:
+        db = get_database()
+        docs_collection = db[settings.DOCUMENTS_COLLECTION]
+        vector_store = get_vector_store()
+        if not settings.OPENAI_API_KEY:
+            logger.warning("OPENAI_API_KEY is not set - embedding the chunks will fail")
         
-        print(f"✅ Successfully processed documents: {document_ids}")
-        print(f"📊 Summary:")
-        print(f"  - Original documents: {len(documents)}")
-        print(f"  - Generated chunks: {len(chunks)}")
-        print(f"  - Document IDs: {document_ids}")
+        # Page extraction, Mongo writes and embedding block, so batches run off the event loop
+        total_chunks = 0
+        batches = _batched(documents, max(1, settings.INGEST_BATCH_DOCUMENTS))
+        while (batch := await run_in_threadpool(next, batches, None)) is not None:
+            total_chunks += await run_in_threadpool(
+                _store_batch, batch, user_id, docs_collection, vector_store, document_ids, total_chunks
+            )
+            logger.debug("Stored %d documents / %d chunks so far", len(document_ids), total_chunks)
+        
+        if not document_ids:
+            raise ValueError("No content to process")
+        
+        logger.info("Processed %d documents into %d chunks for user %s",
+                    len(document_ids), total_chunks, user_id, extra={"document_ids": document_ids[:20]})
         
         return document_ids
     
+    except HTTPException:
+        await run_in_threadpool(_mark_failed, document_ids, "Ingestion aborted")
+        raise
+    except Exception as e:
+        logger.exception("Error processing documents for user %s", user_id)
+        await run_in_threadpool(_mark_failed, document_ids, str(e))
+        raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
+
+def _document_position(doc: Document) -> int:
+    """Position of a document within its source: the page for PDFs, 0 for single-document sources"""
+    return (doc.metadata or {}).get("page", 0)
+
+def _source_records(docs_collection, user_id: str,
+                    source: str) -> Tuple[Dict[int, Dict[str, Any]], List[Dict[str, Any]]]:
+    """The user's stored documents for a source by position, and older duplicates to remove
+
+    Sources uploaded more than once before in-place updates existed have several
+    documents per position; the most recent one is updated and the rest are removed.
+    """
+    records = docs_collection.find(
+        {"user_id": user_id, "metadata.source": source},
+        {"content_sha256": 1, "metadata.page": 1, "chunk_count": 1, "chunk_start": 1,
+         "processing_status": 1, "date_added": 1}
+    ).sort("date_added", 1)
+    by_position, superseded = {}, []
+    for record in records:
+        position = record.get("metadata", {}).get("page", 0)
+        if position in by_position:
+            superseded.append(by_position[position])
+        by_position[position] = record
+    return by_position, superseded
+
+def _sync_batch(batch: List[Document], user_id: str, docs_collection, vector_store,
+                stored: Dict[int, Dict[str, Any]], document_ids: List[str], new_document_ids: List[str],
+                summary: Dict[str, int], chunk_offset: int) -> int:
+    """Diff one batch against the stored copy of its source, returning how many chunk indices new documents used"""
+    new_records, chunks_by_document, starts = [], {}, {}
+    used = 0
+    for doc in batch:
+        if not doc.metadata:
+            doc.metadata = {}
+        record = stored.pop(_document_position(doc), None)
+        if (record is not None and record.get("processing_status") == "completed"
+                and record.get("content_sha256") == _content_hash(doc.page_content)):
+            document_ids.append(record["_id"])
+            summary["documents_unchanged"] += 1
+            summary["chunks_kept"] += record.get("chunk_count", 0)
+            continue
+        
+        if record is None:
+            doc_id = str(uuid.uuid4())
+            new_records.append(_document_record(doc_id, doc, user_id))
+            new_document_ids.append(doc_id)
+            summary["documents_added"] += 1
+        else:
+            doc_id = record["_id"]
+            summary["documents_updated"] += 1
+        document_ids.append(doc_id)
+        doc.metadata["document_id"] = doc_id
+        
+        chunks = split_documents([doc])
+        if record is None:
+            starts[doc_id] = chunk_offset + used
+            used += len(chunks)
+        else:
+            # Keep the document's numbering so unchanged chunks keep their references
+            starts[doc_id] = record.get("chunk_start", 0)
+        assign_parent_documents(chunks, [doc], user_id, start_index=starts[doc_id])
+        chunks_by_document[doc_id] = chunks
+    
+    if new_records:
+        with trace_span("mongo.store_documents"):
+            docs_collection.insert_many(new_records, ordered=False)
+    if not chunks_by_document:
+        return used
+    
+    if hasattr(vector_store, "replace_document_chunks"):
+        changes = vector_store.replace_document_chunks(chunks_by_document, user_id)
+        for key, value in changes.items():
+            summary[f"chunks_{key}"] += value
+    else:
+        # Only new sources get here (update_source_documents refuses stored ones)
+        chunks = [chunk for document_chunks in chunks_by_document.values() for chunk in document_chunks]
+        vector_store.add_documents(chunks, user_id)
+        summary["chunks_written"] += len(chunks)
+    
+    completed_at = datetime.now()
+    updates = {doc.metadata["document_id"]: doc for doc in batch if doc.metadata.get("document_id") in chunks_by_document}
+    with trace_span("mongo.update_documents"):
+        docs_collection.bulk_write([
+            UpdateOne({"_id": doc_id}, {"$set": {
+                "content_sha256": _content_hash(doc.page_content),
+                "content_length": len(doc.page_content),
+                "metadata": {key: value for key, value in doc.metadata.items() if key != "document_id"},
+                "chunk_count": len(chunks_by_document[doc_id]),
+                "chunk_start": starts[doc_id],
+                "processing_status": "completed",
+                "processing_completed_at": completed_at
+            }})
+            for doc_id, doc in updates.items()
+        ], ordered=False)
+    return used
+
+def _acquire_source_lease(leases, user_id: str, source: str, owner: str) -> bool:
+    """Take the update lease of a source unless another update holds it"""
+    now = datetime.now()
+    key = {"user_id": user_id, "source": source}
+    try:
+        leases.update_one(key, {"$setOnInsert": {"lease_owner": None, "lease_expires": now}}, upsert=True)
+    except DuplicateKeyError:
+        pass  # Another update created it first
+    result = leases.update_one(
+        {**key, "$or": [{"lease_owner": None}, {"lease_expires": {"$lte": now}}]},
+        {"$set": {"lease_owner": owner, "lease_expires": now + timedelta(seconds=settings.SOURCE_UPDATE_LEASE_SECONDS)}}
+    )
+    return bool(result.matched_count)
+
+def _renew_source_lease(leases, user_id: str, source: str, owner: str):
+    result = leases.update_one(
+        {"user_id": user_id, "source": source, "lease_owner": owner},
+        {"$set": {"lease_expires": datetime.now() + timedelta(seconds=settings.SOURCE_UPDATE_LEASE_SECONDS)}}
+    )
+    if not result.matched_count:
+        raise HTTPException(status_code=409, detail=f"Another update of {source} took over")
+
+def _release_source_lease(leases, user_id: str, source: str, owner: str):
+    try:
+        leases.update_one(
+            {"user_id": user_id, "source": source, "lease_owner": owner},
+            {"$set": {"lease_owner": None, "lease_expires": datetime.now()}}
+        )
     except Exception as e:
-        import traceback
-        print(f"❌ ERROR in process_and_store_documents: {str(e)}")
-        print(f"Exception type: {type(e).__name__}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.warning("Could not release the update lease of %s: %s", source, e)
+
+async def update_source_documents(documents: Iterable[Document], user_id: str,
+                                  source: str) -> Tuple[List[str], Dict[str, int]]:
+    """Re-ingest a source (file name or URL) in place for a user
+
+    Documents are matched to the user's stored copy of the source by position (page).
+    Unchanged documents are skipped, changed ones only re-embed chunks not stored yet,
+    and documents the new version no longer has are deleted with their chunks.
+    Returns the document ids in order and a summary of what changed.
+    """
+    summary = {
+        key: 0 for key in (
+            "documents_unchanged", "documents_updated", "documents_added", "documents_removed",
+            "chunks_kept", "chunks_written", "chunks_embedded", "chunks_removed"
+        )
+    }
+    document_ids: List[str] = []
+    new_document_ids: List[str] = []
+    db = get_database()
+    leases = db[settings.SOURCE_UPDATES_COLLECTION]
+    owner = str(uuid.uuid4())
+    
+    # Two updates of one source at once (in any worker) would both see the same stored documents
+    if not await run_in_threadpool(_acquire_source_lease, leases, user_id, source, owner):
+        raise HTTPException(status_code=409, detail=f"An update of {source} is already in progress")
+    try:
+        docs_collection = db[settings.DOCUMENTS_COLLECTION]
+        vector_store = get_vector_store()
+        stored, superseded = await run_in_threadpool(_source_records, docs_collection, user_id, source)
+        if (stored or superseded) and not hasattr(vector_store, "replace_document_chunks"):
+            # Its earlier chunks could not be removed and would keep turning up in searches
+            raise HTTPException(
+                status_code=400,
+                detail=f"{source} is already stored and the {type(vector_store).__name__} cannot update it in place"
+            )
+        next_index = max((record.get("chunk_start", 0) + record.get("chunk_count", 0)
+                          for record in stored.values()), default=0)
         
-        # Update any documents that were created to show error status
-        try:
-            if 'document_ids' in locals() and document_ids:
-                db = get_database()
-                docs_collection = db[settings.DOCUMENTS_COLLECTION]
-                for doc_id in document_ids:
-                    docs_collection.update_one(
-                        {"_id": doc_id},
-                        {
-                            "$set": {
-                                "processing_status": "error",
-                                "processing_error": str(e),
-                                "processing_error_at": datetime.now()
-                            }
-                        }
-                    )
-        except Exception as cleanup_error:
-            print(f"⚠️ Could not update error status: {cleanup_error}")
-            
+        batches = _batched(documents, max(1, settings.INGEST_BATCH_DOCUMENTS))
+        while (batch := await run_in_threadpool(next, batches, None)) is not None:
+            next_index += await run_in_threadpool(
+                _sync_batch, batch, user_id, docs_collection, vector_store, stored,
+                document_ids, new_document_ids, summary, next_index
+            )
+            await run_in_threadpool(_renew_source_lease, leases, user_id, source, owner)
+        
+        if not document_ids:
+            raise ValueError("No content to process")
+        
+        # Whatever was not matched is gone from the new version
+        removed = list(stored.values()) + superseded
+        for record in removed:
+            summary["chunks_removed"] += await delete_document_vectors(record["_id"])
+        if removed:
+            await run_in_threadpool(
+                docs_collection.delete_many, {"_id": {"$in": [record["_id"] for record in removed]}}
+            )
+            summary["documents_removed"] = len(removed)
+        
+        logger.info("Updated %s for user %s: %s", source, user_id, summary)
+        return document_ids, summary
+    
+    except HTTPException:
+        await run_in_threadpool(_mark_failed, new_document_ids, "Ingestion aborted")
+        raise
+    except Exception as e:
+        logger.exception("Error updating %s for user %s", source, user_id)
+        await run_in_threadpool(_mark_failed, new_document_ids, str(e))
         raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
+    finally:
+        await run_in_threadpool(_release_source_lease, leases, user_id, source, owner)
+
+def _mark_failed(document_ids: List[str], error: str):
+    """Update any documents that were created to show error status"""
+    if not document_ids:
+        return
+    try:
+        db = get_database()
+        db[settings.DOCUMENTS_COLLECTION].update_many(
+            {"_id": {"$in": document_ids}, "processing_status": {"$ne": "completed"}},
+            {
+                "$set": {
+                    "processing_status": "error",
+                    "processing_error": error,
+                    "processing_error_at": datetime.now()
+                }
+            }
+        )
+    except Exception as cleanup_error:
+        logger.warning("Could not update error status: %s", cleanup_error)
 
 # Additional utility functions for MongoDB vector store
 
@@ -186,31 +397,16 @@ async def get_document_chunks(document_id: str, user_id: str = None) -> List[Doc
     try:
         vector_store = get_vector_store()
         
-        # For MongoDB vector store, we need to query by document_id
-        if hasattr(vector_store, 'collection'):
-            # MongoDB vector store
-            filter_query = {"metadata.document_id": document_id}
-            if user_id:
-                filter_query["metadata.user_id"] = user_id
-            
-            results = list(vector_store.collection.find(filter_query).sort("metadata.chunk_index", 1))
-            
-            documents = []
-            for result in results:
-                doc = Document(
-                    page_content=result["text"],
-                    metadata=result["metadata"]
-                )
-                documents.append(doc)
-            
-            return documents
+        if hasattr(vector_store, 'get_document_chunks'):
+            # MongoDB vector store: chunk references in order, joined to the canonical chunk text
+            return await run_in_threadpool(vector_store.get_document_chunks, document_id, user_id)
         else:
             # Fallback for other vector stores
-            print("⚠️ get_document_chunks not fully implemented for this vector store type")
+            logger.warning("get_document_chunks not fully implemented for this vector store type")
             return []
             
     except Exception as e:
-        print(f"Error retrieving document chunks: {str(e)}")
+        logger.error("Error retrieving document chunks: %s", e)
         return []
 
 async def delete_document_vectors(document_id: str, user_id: str = None) -> int:
@@ -220,15 +416,13 @@ async def delete_document_vectors(document_id: str, user_id: str = None) -> int:
         
         if hasattr(vector_store, 'delete_by_document'):
             # MongoDB vector store with delete method
-            deleted_count = vector_store.delete_by_document(document_id)
-            print(f"Deleted {deleted_count} vectors for document {document_id}")
-            return deleted_count
+            return await run_in_threadpool(vector_store.delete_by_document, document_id)
         else:
-            print("⚠️ delete_document_vectors not implemented for this vector store type")
+            logger.warning("delete_document_vectors not implemented for this vector store type")
             return 0
             
     except Exception as e:
-        print(f"Error deleting document vectors: {str(e)}")
+        logger.error("Error deleting document vectors: %s", e)
         raise
 
 async def get_user_vector_stats(user_id: str) -> dict:
@@ -236,32 +430,12 @@ async def get_user_vector_stats(user_id: str) -> dict:
     try:
         vector_store = get_vector_store()
         
-        if hasattr(vector_store, 'collection'):
+        if hasattr(vector_store, 'get_user_stats'):
             # MongoDB vector store
-            user_doc_count = vector_store.collection.count_documents({"metadata.user_id": user_id})
-            
-            # Get document breakdown
-            pipeline = [
-                {"$match": {"metadata.user_id": user_id}},
-                {"$group": {
-                    "_id": "$metadata.document_id",
-                    "chunk_count": {"$sum": 1},
-                    "latest_created": {"$max": "$created_at"}
-                }},
-                {"$sort": {"latest_created": -1}}
-            ]
-            
-            doc_breakdown = list(vector_store.collection.aggregate(pipeline))
-            
-            return {
-                "user_id": user_id,
-                "total_chunks": user_doc_count,
-                "unique_documents": len(doc_breakdown),
-                "document_breakdown": doc_breakdown
-            }
+            return await run_in_threadpool(vector_store.get_user_stats, user_id)
         else:
             return {"user_id": user_id, "error": "Stats not available for this vector store type"}
             
     except Exception as e:
-        print(f"Error getting user vector stats: {str(e)}")
-        return {"user_id": user_id, "error": str(e)}
\ No newline at end of file
+        logger.error("Error getting user vector stats: %s", e)
+        return {"user_id": user_id, "error": str(e)}
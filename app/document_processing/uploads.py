@@ -0,0 +1,65 @@
+# app/document_processing/uploads.py
+"""
+Streaming uploads to disk.
+
+Uploads are copied in UPLOAD_CHUNK_BYTES pieces to a named temporary file (loaders and
+PDF worker processes read it by path), hashed as they stream, and cut off with a 413 as
+soon as they pass MAX_UPLOAD_BYTES - the upload is never held in memory as one block.
+"""
+import hashlib
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..tracing import trace_span
+
+logger = get_logger(__name__)
+
+class SpooledUpload:
+    """An upload written to disk: its path, size and SHA-256"""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+def check_content_length(content_length: Optional[str]):
+    """Reject an upload up front when the declared request size is already too large"""
+    # Multipart framing and form fields add a little on top of the file itself
+    if content_length and content_length.isdigit() and int(content_length) > settings.MAX_UPLOAD_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {settings.MAX_UPLOAD_BYTES} byte limit")
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile):
+    """Stream an upload to a temporary file, deleting it when the block exits"""
+    suffix = os.path.splitext(file.filename or "")[1]
+    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=settings.UPLOAD_TMP_DIR or None)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        try:
+            with trace_span("upload.spool"):
+                while chunk := await file.read(settings.UPLOAD_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > settings.MAX_UPLOAD_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Upload exceeds the {settings.MAX_UPLOAD_BYTES} byte limit"
+                        )
+                    digest.update(chunk)
+                    await run_in_threadpool(tmp_file.write, chunk)
+        finally:
+            tmp_file.close()
+            await file.close()
+        
+        logger.debug("Spooled upload %s (%d bytes)", file.filename, size)
+        yield SpooledUpload(tmp_file.name, file.filename, size, digest.hexdigest())
+    finally:
+        os.unlink(tmp_file.name)
@@ -0,0 +1,114 @@
+# app/document_processing/url_ingest.py
+"""
+URL ingestion with conditional re-fetch.
+
+The ETag / Last-Modified / content hash of every ingested URL is kept per user in
+URL_CACHE_COLLECTION. Re-submitting a URL sends those validators; a 304, or a 200 whose
+body hashes the same as last time, returns the stored document ids without re-embedding.
+A changed page is updated in place, re-embedding only the chunks that changed.
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..db.mongodb import get_database
+from ..logging_config import get_logger
+from .fetcher import fetch_url
+from .loaders import page_documents
+from .processor import update_source_documents
+
+logger = get_logger(__name__)
+
+def _cached_fetch(db, url: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """The cache entry for a URL, if the documents it lists are all still stored"""
+    try:
+        cached = db[settings.URL_CACHE_COLLECTION].find_one({"url": url, "user_id": user_id})
+        if not cached or not cached.get("document_ids"):
+            return None
+        # The documents may have been deleted since; then the page is ingested again
+        stored = db[settings.DOCUMENTS_COLLECTION].count_documents({
+            "_id": {"$in": cached["document_ids"]}, "user_id": user_id, "processing_status": "completed"
+        })
+        return cached if stored == len(set(cached["document_ids"])) else None
+    except Exception as e:
+        logger.warning("Could not read URL cache for %s: %s", url, e)
+        return None
+
+def _save_fetch(db, url: str, user_id: str, fields: Dict[str, Any]):
+    try:
+        db[settings.URL_CACHE_COLLECTION].update_one(
+            {"url": url, "user_id": user_id},
+            {"$set": {**fields, "checked_at": datetime.now()}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning("Could not update URL cache for %s: %s", url, e)
+
+async def ingest_url(url: str, user_id: str, title: Optional[str] = None, db=None,
+                     host_limits: Optional[Dict[str, asyncio.Semaphore]] = None) -> Dict[str, Any]:
+    """Fetch and ingest a URL unless it is unchanged since this user last ingested it
+
+    A batch passes its database handle and per-host semaphores; a single URL opens its own.
+    """
+    if db is None:
+        db = await run_in_threadpool(get_database)
+    cached = await run_in_threadpool(_cached_fetch, db, url, user_id)
+
+    try:
+        page = await fetch_url(
+            url,
+            etag=cached.get("etag") if cached else None,
+            last_modified=cached.get("last_modified") if cached else None,
+            host_limits=host_limits
+        )
+    except Exception as e:
+        logger.warning("Failed to load URL %s: %s", url, e)
+        raise HTTPException(status_code=400, detail=f"Failed to load URL: {str(e)}")
+
+    if cached and (page.not_modified or page.sha256 == cached.get("sha256")):
+        logger.debug("URL %s unchanged (status %d) - skipping ingestion", url, page.status)
+        if not page.not_modified:
+            await run_in_threadpool(_save_fetch, db, url, user_id, {"etag": page.etag, "last_modified": page.last_modified})
+        return {
+            "url": url,
+            "status": "unchanged",
+            "document_ids": cached["document_ids"],
+            "title": cached.get("title") or title or url
+        }
+
+    # A changed page replaces this user's earlier copy of it instead of adding a second one
+    documents = page_documents(page, title)
+    document_ids, changes = await update_source_documents(documents, user_id, url)
+    doc_title = documents[0].metadata["title"]
+    await run_in_threadpool(_save_fetch, db, url, user_id, {
+        "etag": page.etag,
+        "last_modified": page.last_modified,
+        "sha256": page.sha256,
+        "document_ids": document_ids,
+        "title": doc_title,
+        "fetched_at": datetime.now()
+    })
+    return {"url": url, "status": "success", "document_ids": document_ids, "title": doc_title, "changes": changes}
+
+async def ingest_urls(urls: List[str], user_id: str) -> List[Dict[str, Any]]:
+    """Ingest many URLs concurrently, at most URL_FETCH_PER_HOST at a time from one host"""
+    limit = asyncio.Semaphore(settings.URL_BATCH_CONCURRENCY)
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+    db = await run_in_threadpool(get_database)
+
+    async def ingest_one(url: str) -> Dict[str, Any]:
+        async with limit:
+            try:
+                return await ingest_url(url, user_id, db=db, host_limits=host_limits)
+            except HTTPException as e:
+                return {"url": url, "status": "error", "document_ids": [], "error": str(e.detail)}
+            except Exception as e:
+                logger.exception("Error ingesting %s", url)
+                return {"url": url, "status": "error", "document_ids": [], "error": str(e)}
+
+    # Duplicates in one batch would race each other; ingest each URL once
+    return await asyncio.gather(*(ingest_one(url) for url in dict.fromkeys(urls)))
@@ -1,15 +1,26 @@
 # app/main.py - Fully fixed production-ready FastAPI application
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import uvicorn
+import asyncio
 import os
 from datetime import datetime
 
 from .config import settings
 from .db.mongodb import init_database
-from .api import chat, documents
+from .db.chat_history import chat_history
+from .db.maintenance import maintenance
+from .api import chat, documents, admin
 from .vector_store import get_vector_store
+from .metrics import HTTP_REQUEST_SECONDS, render_metrics, request_finished, request_started
+from .logging_config import get_logger, shutdown_logging
+from .tracing import start_trace, end_trace, save_slow_trace
+from .profiling import cpu_profiler
+from .document_processing.loaders import shutdown_pdf_executor
+from .document_processing.fetcher import close_http_client
+
+logger = get_logger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -40,6 +51,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Track in-flight requests, per-route latency and the stage timeline, and log one line per request"""
+    request_started()
+    trace, trace_token = start_trace(request.method, request.url.path)
+    profiled = cpu_profiler.should_profile(request.url.path)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if settings.ENABLE_SERVER_TIMING:
+            response.headers["Server-Timing"] = trace.server_timing(trace.elapsed_ms())
+        return response
+    finally:
+        end_trace(trace_token)
+        if profiled:
+            cpu_profiler.request_finished()
+        request_finished()
+        elapsed_ms = trace.elapsed_ms()
+        # Label by route template rather than raw path to keep cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_SECONDS.labels(method=request.method, route=route, status=str(status)).observe(elapsed_ms / 1000)
+        logger.info("request completed", extra={
+            "method": request.method,
+            "path": request.url.path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(elapsed_ms, 1)
+        })
+        
+        # Keep the full timeline of slow requests for later inspection
+        if 0 < settings.SLOW_REQUEST_THRESHOLD_MS <= elapsed_ms:
+            asyncio.get_running_loop().run_in_executor(
+                None, save_slow_trace, trace.to_document(status, route, elapsed_ms)
+            )
+
 # Global application state
 app.mongodb = None
 app.vector_store = None
@@ -48,86 +95,88 @@ app.vector_store = None
 @app.on_event("startup")
 async def startup():
     """Initialize services on startup"""
-    print("🚀 Starting Prenatal AI Clinic API...")
-    print(f"🌍 Environment: {os.getenv('NODE_ENV', 'development')}")
-    print(f"🔧 Debug mode: {settings.DEBUG}")
+    logger.info("Starting Prenatal AI Clinic API (environment=%s, debug=%s)",
+                os.getenv("NODE_ENV", "development"), settings.DEBUG)
     
     # Initialize MongoDB database and collections
-    print("📦 Initializing MongoDB database...")
     try:
         app.mongodb = init_database()
-        print("✅ MongoDB database initialized successfully")
         
         # Test database connection
         app.mongodb.command('ping')
-        print("✅ MongoDB connection verified")
+        logger.info("MongoDB database initialized and reachable")
         
     except Exception as e:
-        print(f"❌ MongoDB initialization failed: {str(e)}")
+        logger.error("MongoDB initialization failed: %s", e)
         app.mongodb = None
     
     # Initialize vector store
-    print(f"🔗 Initializing vector store ({settings.VECTOR_STORE_TYPE})...")
     try:
         vector_store = get_vector_store()
         app.vector_store = vector_store
         
-        # Get and display vector store statistics
+        # Log vector store statistics
         if hasattr(vector_store, 'get_stats'):
             try:
                 stats = vector_store.get_stats()
-                print(f"📊 Vector store statistics:")
-                print(f"   - Total documents: {stats.get('total_documents', 0)}")
-                print(f"   - Storage type: {stats.get('collection_name', 'Unknown')}")
-                print(f"   - Atlas enabled: {stats.get('is_atlas', False)}")
+                logger.info("Vector store ready: %d documents in %s (atlas=%s)",
+                            stats.get('total_documents', 0),
+                            stats.get('collection_name', 'unknown'),
+                            stats.get('is_atlas', False))
             except Exception as stats_error:
-                print(f"⚠️ Could not get vector store stats: {stats_error}")
+                logger.warning("Could not get vector store stats: %s", stats_error)
         
-        print("✅ Vector store initialized successfully")
-        
-    except Exception as e:
-        print(f"❌ Vector store initialization failed: {str(e)}")
-        import traceback
-        print(f"📋 Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Vector store initialization failed (%s)", settings.VECTOR_STORE_TYPE)
         app.vector_store = None
     
-    # Display configuration summary
-    print(f"\n📋 Configuration Summary:")
-    print(f"   - Vector Store: {settings.VECTOR_STORE_TYPE}")
-    print(f"   - Database: {settings.DB_NAME}")
-    print(f"   - OpenAI Model: {settings.LLM_MODEL}")
-    print(f"   - API Host: {settings.API_HOST}:{settings.API_PORT}")
+    if settings.WEB_WORKERS > 1 and settings.VECTOR_STORE_TYPE == "faiss" and not settings.FAISS_SHARED_DIR:
+        logger.warning("WEB_WORKERS=%d with an in-process FAISS index - set FAISS_SHARED_DIR so workers share uploads",
+                       settings.WEB_WORKERS)
+    
+    # Retention and orphan cleanup (one worker at a time runs each scheduled pass)
+    if app.mongodb is not None:
+        maintenance.start(app.vector_store)
+    
+    # Configuration summary
+    logger.info("Configuration: vector_store=%s database=%s model=%s graph_mode=%s api=%s:%s",
+                settings.VECTOR_STORE_TYPE, settings.DB_NAME, settings.LLM_MODEL,
+                settings.RAG_GRAPH_MODE, settings.API_HOST, settings.API_PORT)
     
     # Validate critical settings
     if not settings.OPENAI_API_KEY:
-        print("⚠️ WARNING: OPENAI_API_KEY not set - AI functionality will not work")
-    else:
-        print("✅ OpenAI API key configured")
-    
+        logger.warning("OPENAI_API_KEY not set - AI functionality will not work")
     if not settings.MONGODB_CONNECTION_STRING:
-        print("⚠️ WARNING: MONGODB_CONNECTION_STRING not set")
-    else:
-        print("✅ MongoDB connection string configured")
+        logger.warning("MONGODB_CONNECTION_STRING not set")
     
-    print("🎉 Startup completed!")
+    logger.info("Startup completed")
 
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown"""
-    print("🛑 Shutting down Prenatal AI Clinic API...")
+    logger.info("Shutting down Prenatal AI Clinic API")
     
     # Close MongoDB connections if needed - FIXED
     if app.mongodb is not None:
         try:
-            print("📦 MongoDB connections closed")
+            logger.debug("MongoDB connections closed")
         except Exception as e:
-            print(f"⚠️ Error closing MongoDB connections: {e}")
+            logger.warning("Error closing MongoDB connections: %s", e)
     
-    print("✅ Shutdown completed")
+    maintenance.stop()
+    
+    # Write the conversations and messages still queued
+    await asyncio.get_running_loop().run_in_executor(None, chat_history.close)
+    
+    shutdown_pdf_executor()
+    await close_http_client()
+    logger.info("Shutdown completed")
+    shutdown_logging()
 
 # Include API routers
 app.include_router(chat.router, tags=["chat"])
 app.include_router(documents.router, tags=["documents"])
+app.include_router(admin.router, tags=["admin"])
 
 @app.get("/")
 async def root():
@@ -191,9 +240,12 @@ async def root():
             "endpoints": {
                 "chat": "/chat",
                 "upload_url": "/upload-url", 
+                "upload_urls": "/upload-urls",
                 "upload_file": "/upload-file",
                 "conversations": "/conversations",
                 "health": "/health",
+                "rag_stats": "/rag-stats",
+                "metrics": "/metrics",
                 "docs": "/docs" if settings.DEBUG else "disabled"
             }
         }
@@ -319,6 +371,12 @@ async def vector_store_statistics():
             "timestamp": datetime.now().isoformat()
         }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for the request, retrieval, LLM and ingestion stages"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 # Production-specific error handlers
 @app.exception_handler(500)
 async def internal_server_error_handler(request, exc):
@@ -354,14 +412,14 @@ if __name__ == "__main__":
     # Determine if we're in production
     is_production = os.getenv("NODE_ENV") == "production"
     
-    print(f"🚀 Starting FastAPI server on port {port}")
-    print(f"🌍 Environment: {'production' if is_production else 'development'}")
+    logger.info("Starting FastAPI server on port %d (%s)", port, "production" if is_production else "development")
     
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",  # Bind to all interfaces for Render
         port=port,
         reload=not is_production,  # Disable reload in production
+        workers=settings.WEB_WORKERS if is_production else None,
         log_level="info" if is_production else "debug",
-        access_log=True
+        access_log=False  # The request logging middleware already emits one line per request
     )
\ No newline at end of file
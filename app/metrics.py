@@ -0,0 +1,159 @@
+# app/metrics.py
+"""
+Prometheus metrics for the RAG pipeline stages, exposed on /metrics.
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+from .tracing import current_trace
+
+# Latency buckets (seconds) shared by the pipeline stages
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Retrieval
+QUERY_EMBEDDING_SECONDS = Histogram(
+    "rag_query_embedding_seconds", "Time to embed search queries", buckets=STAGE_BUCKETS
+)
+VECTOR_SEARCH_SECONDS = Histogram(
+    "rag_vector_search_seconds", "Vector search time per backend", ["backend"], buckets=STAGE_BUCKETS
+)
+
+# Graph execution
+LLM_CALL_SECONDS = Histogram(
+    "rag_llm_call_seconds", "LLM call time per graph node", ["node"], buckets=STAGE_BUCKETS
+)
+LLM_CALLS_TOTAL = Counter(
+    "rag_llm_calls_total", "LLM calls per graph node and outcome", ["node", "status"]
+)
+TOOL_EXECUTION_SECONDS = Histogram(
+    "rag_tool_execution_seconds", "Tool execution time per tool", ["tool"], buckets=STAGE_BUCKETS
+)
+CHECKPOINTER_SECONDS = Histogram(
+    "rag_checkpointer_seconds", "LangGraph checkpointer read / write time", ["operation"], buckets=STAGE_BUCKETS
+)
+SPECULATIVE_RETRIEVAL_TOTAL = Counter(
+    "rag_speculative_retrieval_total", "Speculative retrieval outcomes", ["outcome"]
+)
+
+# Ingestion
+CHUNKING_SECONDS = Histogram(
+    "ingest_chunking_seconds", "Time to split documents into chunks", buckets=STAGE_BUCKETS
+)
+EMBEDDING_BATCH_SECONDS = Histogram(
+    "ingest_embedding_batch_seconds", "Time to embed a batch of chunks", ["backend"], buckets=STAGE_BUCKETS
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "ingest_embedding_batch_size", "Chunks per embedding batch", ["backend"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"], buckets=STAGE_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", multiprocess_mode="livesum"
+)
+RETRIEVAL_QUEUE_DEPTH = Gauge(
+    "rag_retrieval_queue_depth", "Retrieval tasks waiting for a worker thread", multiprocess_mode="livesum"
+)
+
+# Chat history write-behind
+CHAT_HISTORY_QUEUE_DEPTH = Gauge(
+    "chat_history_queue_depth", "Chat exchanges waiting to be written", multiprocess_mode="livesum"
+)
+CHAT_HISTORY_FLUSH_SECONDS = Histogram(
+    "chat_history_flush_seconds", "Time to write a batch of chat exchanges", buckets=STAGE_BUCKETS
+)
+CHAT_HISTORY_WRITES_TOTAL = Counter(
+    "chat_history_writes_total", "Conversation upserts and message inserts per outcome", ["kind", "outcome"]
+)
+
+# Maintenance
+MAINTENANCE_DELETED_TOTAL = Counter(
+    "maintenance_deleted_total", "Documents deleted by retention and orphan cleanup", ["job"]
+)
+MAINTENANCE_RUN_SECONDS = Histogram(
+    "maintenance_run_seconds", "Duration of a maintenance run", buckets=(1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+)
+
+# This process's own count; the gauge may be aggregated across worker processes
+_requests_in_flight = 0
+_requests_in_flight_lock = threading.Lock()
+
+def request_started():
+    global _requests_in_flight
+    with _requests_in_flight_lock:
+        _requests_in_flight += 1
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+
+def request_finished():
+    global _requests_in_flight
+    with _requests_in_flight_lock:
+        _requests_in_flight -= 1
+    HTTP_REQUESTS_IN_FLIGHT.dec()
+
+def requests_in_flight() -> int:
+    """HTTP requests this process is serving right now"""
+    return _requests_in_flight
+
+def stage_name(histogram, **labels) -> str:
+    """Span name for a stage histogram, e.g. rag_vector_search_seconds{backend="faiss"} -> vector_search.faiss"""
+    name = re.sub(r"^(rag|ingest)_|_seconds$", "", histogram._name)
+    return ".".join([name, *labels.values()])
+
+@contextmanager
+def track_stage(histogram, span: Optional[str] = None, **labels):
+    """Observe the duration of a block on a (labelled) histogram and the request trace"""
+    metric = histogram.labels(**labels) if labels else histogram
+    trace = current_trace()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metric.observe(duration)
+        if trace is not None:
+            trace.add_span(span or stage_name(histogram, **labels), start, duration)
+
+def instrument_checkpointer(checkpointer):
+    """Time the read / write methods of a LangGraph checkpointer instance in place"""
+    for operation in ("get_tuple", "put", "put_writes"):
+        method = getattr(checkpointer, operation, None)
+        if method is None:
+            continue
+
+        def timed(method=method, operation=operation):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                with track_stage(CHECKPOINTER_SECONDS, operation=operation):
+                    return method(*args, **kwargs)
+            return wrapper
+
+        setattr(checkpointer, operation, timed())
+    return checkpointer
+
+def render_metrics():
+    """Render all metrics in the Prometheus text format"""
+    # With several worker processes, PROMETHEUS_MULTIPROC_DIR aggregates the per-process files
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,26 +1,75 @@
 # app/models/api_models.py
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from pydantic import BaseModel, Field
 
+GraphMode = Literal["agentic", "retrieval_first"]
+
 class ChatRequest(BaseModel):
     message: str
     thread_id: Optional[str] = None
     user_id: str
+    graph_mode: Optional[GraphMode] = None  # Defaults to RAG_GRAPH_MODE
 
 class ChatResponse(BaseModel):
     response: str
     thread_id: str
 
+class ChatBatchMessage(BaseModel):
+    message: str
+    thread_id: Optional[str] = None
+    id: Optional[str] = None  # Caller's key, echoed back with the result
+
+class ChatBatchRequest(BaseModel):
+    messages: List[ChatBatchMessage] = Field(..., min_length=1)
+    user_id: str
+    graph_mode: Optional[GraphMode] = None  # Defaults to RAG_GRAPH_MODE
+    concurrency: Optional[int] = Field(None, ge=1)  # Capped at CHAT_BATCH_CONCURRENCY
+
 class DocumentUploadResponse(BaseModel):
     document_id: str
     title: str
     status: str
     message: str
+    size_bytes: Optional[int] = None
+    sha256: Optional[str] = None
+    changes: Optional[Dict[str, int]] = None  # In-place updates: documents / chunks kept, written, removed
 
 class URLUploadRequest(BaseModel):
     url: str
     title: Optional[str] = None
     user_id: str
 
+class URLBatchUploadRequest(BaseModel):
+    urls: List[str] = Field(..., min_length=1)
+    user_id: str
+
+class URLUploadResult(BaseModel):
+    url: str
+    status: str  # "success", "unchanged" or "error"
+    document_ids: List[str] = []
+    title: Optional[str] = None
+    error: Optional[str] = None
+    changes: Optional[Dict[str, int]] = None
+
+class URLBatchUploadResponse(BaseModel):
+    results: List[URLUploadResult]
+    succeeded: int
+    unchanged: int
+    failed: int
+
 class ConversationListResponse(BaseModel):
-    conversations: List[Dict[str, Any]]
\ No newline at end of file
+    conversations: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next page; None on the last page
+
+class CPUProfileRequest(BaseModel):
+    requests: int = Field(20, ge=1, description="Number of requests to profile")
+    sample_rate: float = Field(1.0, gt=0, le=1, description="Fraction of matching requests to profile")
+    interval_ms: float = Field(5.0, ge=1, description="Stack sampling interval")
+    route: Optional[str] = Field("/chat", description="Only profile requests whose path starts with this")
+
+class MemoryTracingRequest(BaseModel):
+    frames: int = Field(25, ge=1, le=100, description="Traceback depth recorded per allocation")
+
+class EmbeddingMigrationRequest(BaseModel):
+    model: str = Field(..., description="Embedding model to re-embed the collection with")
+    dimensions: Optional[int] = Field(None, ge=1, description="Shortened vector size (text-embedding-3-*); default native")
@@ -0,0 +1,212 @@
+# app/profiling.py
+"""
+On-demand profiling for live workers, driven from the admin API.
+
+- CPU: a sampling profiler that records the stacks of every thread (LangGraph nodes and
+  retrieval run off the event loop thread) while sampled requests are in flight, and
+  exports them as collapsed stacks for flamegraph / speedscope.
+- Memory: tracemalloc snapshots written to PROFILING_DIR for download, plus a report of the
+  memory held by the vector store, the FAISS index / docstore and the in-memory checkpointer.
+"""
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from .config import settings
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Leaf frames in these files are threads waiting for work, not CPU time
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py", os.path.join("logging", "handlers.py"))
+
+def deep_sizeof(obj, _seen: Optional[set] = None) -> int:
+    """Approximate retained size of an object graph in bytes"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size of this worker (Linux), None elsewhere"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class SamplingProfiler:
+    """Samples all thread stacks while at least one profiled request is running"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._active_requests = 0
+        self.session: Optional[Dict[str, Any]] = None
+        self.stacks: Counter = Counter()
+
+    def start(self, requests: int, sample_rate: float, interval_ms: float, route: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if self.session and self.session["status"] == "running":
+                raise RuntimeError("A CPU profiling session is already running")
+            self.stacks = Counter()
+            self.session = {
+                "id": uuid.uuid4().hex[:12],
+                "status": "running",
+                "started_at": datetime.now().isoformat(),
+                "requests": requests,
+                "sample_rate": sample_rate,
+                "interval_ms": interval_ms,
+                "route": route,
+                "profiled_requests": 0,
+                "samples": 0,
+            }
+            self._thread = threading.Thread(target=self._sample_loop, name="cpu-profiler", daemon=True)
+            self._thread.start()
+        logger.info("CPU profiling started", extra={"session": self.session["id"], "requests": requests})
+        return dict(self.session)
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self.session and self.session["status"] == "running":
+                self.session["status"] = "completed"
+                self.session["completed_at"] = datetime.now().isoformat()
+            return dict(self.session) if self.session else None
+
+    def should_profile(self, path: str) -> bool:
+        """Claim a slot for this request if a session is running and it is sampled"""
+        session = self.session
+        if not session or session["status"] != "running":
+            return False
+        if session["route"] and not path.startswith(session["route"]):
+            return False
+        if random.random() >= session["sample_rate"]:
+            return False
+        with self._lock:
+            if session["status"] != "running" or session["profiled_requests"] >= session["requests"]:
+                return False
+            session["profiled_requests"] += 1
+            self._active_requests += 1
+        return True
+
+    def request_finished(self):
+        with self._lock:
+            self._active_requests -= 1
+            session = self.session
+            if (session and session["status"] == "running" and not self._active_requests
+                    and session["profiled_requests"] >= session["requests"]):
+                session["status"] = "completed"
+                session["completed_at"] = datetime.now().isoformat()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while self.session and self.session["status"] == "running":
+            time.sleep(self.session["interval_ms"] / 1000)
+            if not self._active_requests:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+                self.session["samples"] += 1
+
+    def collapsed(self) -> str:
+        """Samples in collapsed-stack format ("frame;frame;frame count")"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_functions(self, limit: int = 25) -> List[Dict[str, Any]]:
+        """Functions by self (leaf) and total (anywhere on the stack) sample counts"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        samples = sum(self.stacks.values()) or 1
+        return [
+            {"function": frame, "self_pct": round(100 * own[frame] / samples, 1),
+             "total_pct": round(100 * total[frame] / samples, 1)}
+            for frame, _ in own.most_common(limit)
+        ]
+
+cpu_profiler = SamplingProfiler()
+
+def _snapshot_path(snapshot_id: str) -> str:
+    return os.path.join(settings.PROFILING_DIR, f"tracemalloc-{snapshot_id}.pickle")
+
+def start_memory_tracing(frames: int = 25) -> Dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+def stop_memory_tracing() -> Dict[str, Any]:
+    tracemalloc.stop()
+    return {"tracing": False}
+
+def take_memory_snapshot(compare_to: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+    """Dump a tracemalloc snapshot to disk and summarize its top allocation sites"""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running - start memory tracing first")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    snapshot_id = datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    snapshot.dump(_snapshot_path(snapshot_id))
+
+    current, peak = tracemalloc.get_traced_memory()
+    if compare_to:
+        baseline = tracemalloc.Snapshot.load(_snapshot_path(compare_to))
+        top = [
+            {"location": str(stat.traceback), "size_diff_bytes": stat.size_diff, "size_bytes": stat.size,
+             "count_diff": stat.count_diff}
+            for stat in snapshot.compare_to(baseline, "lineno")[:limit]
+        ]
+    else:
+        top = [
+            {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+
+    return {
+        "snapshot_id": snapshot_id,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "compared_to": compare_to,
+        "top": top,
+    }
+
+def memory_snapshot_path(snapshot_id: str) -> Optional[str]:
+    """Path of a stored snapshot, None if it does not exist"""
+    if not snapshot_id.replace("-", "").isalnum():
+        return None
+    path = _snapshot_path(snapshot_id)
+    return path if os.path.exists(path) else None
@@ -1,16 +1,114 @@
 # app/rag/engine.py - Updated to use MongoDB Vector Store
+import re
+import time
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextvars import Context, ContextVar, copy_context
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.checkpoint.mongodb import MongoDBSaver
 from langgraph.checkpoint.memory import InMemorySaver
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 from ..config import settings
 from ..vector_store import get_vector_store  # ✅ Use factory pattern
-from ..db.mongodb import get_database
-from typing import Optional, List
+from ..db.mongodb import get_mongodb_client
+from ..logging_config import get_logger
+from ..tracing import annotate, current_trace, traced_node
+from .query_batching import QueryEmbeddingBatcher
+from ..metrics import (
+    track_stage,
+    instrument_checkpointer,
+    QUERY_EMBEDDING_SECONDS,
+    LLM_CALL_SECONDS,
+    LLM_CALLS_TOTAL,
+    TOOL_EXECUTION_SECONDS,
+    RETRIEVAL_QUEUE_DEPTH,
+    SPECULATIVE_RETRIEVAL_TOTAL,
+)
+from typing import Optional, List, Iterator
+
+logger = get_logger(__name__)
+
+# Supported graph topologies:
+# - "agentic": the model decides whether to call the retrieve tool (two LLM calls per question)
+# - "retrieval_first": retrieval runs on the user message before a single LLM call
+GRAPH_MODES = ("agentic", "retrieval_first")
+
+# Background pool for retrieval work that overlaps with LLM calls
+_retrieval_executor = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# Per-request slot holding the speculative search started by call_model.
+# Graph nodes run in copies of the caller's context, so they share the dict set here.
+_speculation: ContextVar[Optional[dict]] = ContextVar("speculative_retrieval", default=None)
+
+# Query embedding batcher shared by the graph runs of one process_batch call
+_query_batcher: ContextVar[Optional[QueryEmbeddingBatcher]] = ContextVar("query_batcher", default=None)
+
+def _submit_retrieval(fn, *args, **kwargs):
+    """Run fn on the retrieval pool in a copy of the caller's context (keeps the request trace)"""
+    context = copy_context()
+    
+    def run():
+        RETRIEVAL_QUEUE_DEPTH.dec()  # Picked up by a worker
+        return context.run(fn, *args, **kwargs)
+    
+    RETRIEVAL_QUEUE_DEPTH.inc()
+    future = _retrieval_executor.submit(run)
+    # Only a task that never started can be cancelled
+    future.add_done_callback(lambda done: RETRIEVAL_QUEUE_DEPTH.dec() if done.cancelled() else None)
+    return future
+
+def _query_terms(query: str) -> set:
+    """Lowercased word set used to compare queries"""
+    return set(re.findall(r"\w+", query.lower()))
+
+def _queries_match(tool_query: str, speculative_query: str, threshold: float) -> bool:
+    """Check whether the model's tool query is close enough to the speculative one.
+    
+    The model usually rewrites the user message into a shorter search query, so we measure
+    how many of the tool query's terms already appear in the speculative query.
+    """
+    tool_terms = _query_terms(tool_query)
+    speculative_terms = _query_terms(speculative_query)
+    if not tool_terms or not speculative_terms:
+        return False
+    if tool_terms == speculative_terms:
+        return True
+    return len(tool_terms & speculative_terms) / len(tool_terms) >= threshold
+
+def _user_id(messages) -> Optional[str]:
+    """User the latest human message was sent by (process_message puts it in additional_kwargs)"""
+    human_message = next((msg for msg in reversed(messages) if msg.type == "human"), None)
+    return human_message.additional_kwargs.get("user_id") if human_message is not None else None
+
+def _expand_query(message: str, max_queries: int) -> List[str]:
+    """Split a multi-part user message into sub-questions to search alongside the full message"""
+    parts = [part.strip() for part in re.split(r"(?<=[?.!;])\s+|\n+", message)]
+    sub_questions = [part for part in parts if len(part.split()) >= 3 and part != message.strip()]
+    return sub_questions[:max(0, max_queries - 1)]
+
+def _fuse_results(result_lists: List[List], k: int, rrf_k: int = 60) -> List:
+    """Merge several ranked result lists with reciprocal rank fusion"""
+    if len(result_lists) == 1:
+        return result_lists[0][:k]
+    
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc.metadata.get("_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    
+    ranked_keys = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in ranked_keys]
+
+class RetrievalFirstState(MessagesState):
+    """Graph state for retrieval-first mode - carries the retrieved context to the model"""
+    context: str
 
 class RAGEngine:
     """RAG Engine using LangGraph with MongoDB Vector Store"""
@@ -18,101 +116,266 @@ class RAGEngine:
     def __init__(self):
         self.llm = ChatOpenAI(
             temperature=settings.LLM_TEMPERATURE, 
-            model=settings.LLM_MODEL
+            model=settings.LLM_MODEL,
+            base_url=settings.OPENAI_BASE_URL or None
         )
         
         # Use the factory pattern to get the correct vector store
-        print(f"🔗 Initializing RAG Engine with {settings.VECTOR_STORE_TYPE} vector store...")
         self.vector_store = get_vector_store()
-        print(f"✅ Vector store initialized: {type(self.vector_store).__name__}")
+        logger.info("Initializing RAG engine with %s", type(self.vector_store).__name__)
         
-        # Log vector store statistics if available
-        if hasattr(self.vector_store, 'get_stats'):
-            try:
-                stats = self.vector_store.get_stats()
-                print(f"📊 Vector store contains {stats.get('total_documents', 0)} documents")
-            except Exception as e:
-                print(f"⚠️ Could not get vector store stats: {e}")
+        # Choose the graph topology
+        self.graph_mode = settings.RAG_GRAPH_MODE
+        if self.graph_mode not in GRAPH_MODES:
+            logger.warning("Unknown RAG graph mode %s, falling back to agentic", self.graph_mode)
+            self.graph_mode = "agentic"
+        
+        # Latency samples (seconds) per graph mode
+        self._latencies = {mode: deque(maxlen=settings.RAG_LATENCY_WINDOW) for mode in GRAPH_MODES}
+        self._speculation_stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0}
         
-        self.graph = self._build_graph()
+        # All graph modes share one checkpointer so threads keep their history
+        self.checkpointer = self._create_checkpointer()
+        self.graphs = {}
+        self.graph = self._get_graph(self.graph_mode)
     
-    def _build_graph(self):
-        """Build the LangGraph for RAG with proper tool handling"""
-        # Create retrieval tool with enhanced user support
-        @tool()
-        def retrieve(query: str, user_id: Optional[str] = None):
-            """Retrieve information related to a query for a specific user."""
-            try:
-                print(f"🔍 Retrieve tool called with query: '{query}' for user: {user_id}")
-                
-                # Use user_id if provided, otherwise search all documents
-                retrieved_docs = self.vector_store.similarity_search(
-                    query, 
-                    k=settings.SIMILARITY_SEARCH_K, 
+    def _search_queries(self, searches: List[tuple]) -> dict:
+        """Run several (query, user_id) searches at once.
+        
+        Reuses the speculative search when it fits, embeds the remaining queries in one
+        batched request and runs the vector searches concurrently.
+        """
+        results = {}
+        pending = []
+        for query, user_id in dict.fromkeys(searches):
+            retrieved_docs = self._take_speculative_result(query, user_id)
+            if retrieved_docs is not None:
+                results[(query, user_id)] = retrieved_docs
+            else:
+                pending.append((query, user_id))
+        
+        # Whatever the speculative search was for, nobody asked for it
+        self._cancel_speculative_retrieval("misses")
+        
+        batcher = _query_batcher.get()
+        if len(pending) == 1 and batcher is None:
+            query, user_id = pending[0]
+            results[(query, user_id)] = self.vector_store.similarity_search(
+                query, k=settings.SIMILARITY_SEARCH_K, user_id=user_id
+            )
+        elif pending:
+            logger.debug("Searching %d queries concurrently", len(pending))
+            queries = [query for query, _ in pending]
+            if batcher is not None:
+                query_embeddings = batcher.embed_many(queries)
+            else:
+                with track_stage(QUERY_EMBEDDING_SECONDS):
+                    query_embeddings = self.vector_store.embeddings.embed_documents(queries)
+            futures = {
+                (query, user_id): _submit_retrieval(
+                    self.vector_store.similarity_search_by_vector,
+                    query_embedding,
+                    k=settings.SIMILARITY_SEARCH_K,
                     user_id=user_id
                 )
-                
-                if not retrieved_docs:
-                    print("❌ No documents found for query")
-                    if user_id:
-                        return f"No relevant documents found for this query in your personal knowledge base. You may want to upload some documents first."
-                    else:
-                        return "No relevant documents found for this query in the knowledge base."
-                
-                print(f"✅ Retrieved {len(retrieved_docs)} documents")
-                
-                # Format results with better structure
-                formatted_results = []
-                for i, doc in enumerate(retrieved_docs, 1):
-                    # Get similarity score if available
-                    score = doc.metadata.get('similarity_score', 'N/A')
-                    source = doc.metadata.get('title', doc.metadata.get('source', 'Unknown'))
-                    doc_id = doc.metadata.get('document_id', 'Unknown')
-                    
-                    result = f"Document {i}:\n"
-                    result += f"Source: {source}\n"
-                    result += f"Similarity: {score}\n"
-                    result += f"Content: {doc.page_content}\n"
-                    
-                    formatted_results.append(result)
-                
-                serialized = "\n" + "="*50 + "\n".join(formatted_results)
-                
-                print(f"📄 Sample content preview: {retrieved_docs[0].page_content[:100]}...")
-                return serialized
-                
-            except Exception as e:
-                print(f"❌ Error in retrieve tool: {str(e)}")
-                import traceback
-                print(f"📋 Traceback: {traceback.format_exc()}")
-                return f"Error retrieving documents: {str(e)}"
+                for (query, user_id), query_embedding in zip(pending, query_embeddings)
+            }
+            for search, future in futures.items():
+                results[search] = future.result()
+        
+        return results
+    
+    def _batched_similarity_search(self, query: str, k: int, user_id: Optional[str] = None):
+        """similarity_search with the query embedded through the batch's shared requests"""
+        return self.vector_store.similarity_search_by_vector(_query_batcher.get().embed(query), k=k, user_id=user_id)
+    
+    def _run_retrievals(self, calls: List[dict]) -> List[str]:
+        """Execute retrieval calls together and return the formatted context for each.
+        
+        Each call is a dict with "query", optional "user_id" and optional "alternative_queries".
+        """
+        try:
+            call_searches = []
+            for call in calls:
+                user_id = call.get("user_id")
+                queries = [call.get("query", "")]
+                if settings.ENABLE_MULTI_QUERY_RETRIEVAL:
+                    queries += list(call.get("alternative_queries") or [])
+                queries = [query for query in dict.fromkeys(queries) if query and query.strip()]
+                queries = queries[:max(1, settings.MULTI_QUERY_MAX_QUERIES)]
+                logger.debug("Retrieving context for %d queries (user_id=%s)", len(queries), user_id)
+                call_searches.append([(query, user_id) for query in queries])
+            
+            results = self._search_queries([search for searches in call_searches for search in searches])
+            
+            return [
+                self._format_retrieved_docs(
+                    _fuse_results([results[search] for search in searches], settings.SIMILARITY_SEARCH_K),
+                    call.get("user_id")
+                )
+                for call, searches in zip(calls, call_searches)
+            ]
+            
+        except Exception as e:
+            logger.exception("Error retrieving documents")
+            return [f"Error retrieving documents: {str(e)}" for _ in calls]
+    
+    def _format_retrieved_docs(self, retrieved_docs, user_id: Optional[str] = None) -> str:
+        """Format retrieved documents as context for the model"""
+        if not retrieved_docs:
+            logger.debug("No documents found for query")
+            if user_id:
+                return f"No relevant documents found for this query in your personal knowledge base. You may want to upload some documents first."
+            else:
+                return "No relevant documents found for this query in the knowledge base."
+        
+        logger.debug("Retrieved %d documents", len(retrieved_docs))
+        
+        # Format results with better structure
+        formatted_results = []
+        for i, doc in enumerate(retrieved_docs, 1):
+            # Get similarity score if available
+            score = doc.metadata.get('similarity_score', 'N/A')
+            source = doc.metadata.get('title', doc.metadata.get('source', 'Unknown'))
+            
+            result = f"Document {i}:\n"
+            result += f"Source: {source}\n"
+            result += f"Similarity: {score}\n"
+            result += f"Content: {doc.page_content}\n"
+            
+            formatted_results.append(result)
+        
+        return "\n" + "="*50 + "\n".join(formatted_results)
+    
+    def _start_speculative_retrieval(self, query: str, user_id: Optional[str] = None):
+        """Start a vector search on the raw user message in the background"""
+        slot = _speculation.get()
+        if slot is None or not settings.ENABLE_SPECULATIVE_RETRIEVAL:
+            return
+        
+        self._cancel_speculative_retrieval()
+        slot["query"] = query
+        slot["user_id"] = user_id
+        slot["future"] = _submit_retrieval(
+            self._batched_similarity_search if _query_batcher.get() else self.vector_store.similarity_search,
+            query,
+            k=settings.SIMILARITY_SEARCH_K,
+            user_id=user_id
+        )
+        self._count_speculation("started")
+        logger.debug("Speculative retrieval started")
+    
+    def _cancel_speculative_retrieval(self, reason: str = "cancelled"):
+        """Drop the pending speculative search, cancelling it if it has not started"""
+        slot = _speculation.get()
+        if not slot or slot.get("future") is None:
+            return
+        
+        slot.pop("future").cancel()
+        slot.pop("query", None)
+        slot.pop("user_id", None)
+        self._count_speculation(reason)
+        logger.debug("Speculative retrieval dropped (%s)", reason)
+    
+    def _take_speculative_result(self, query: str, user_id: Optional[str] = None):
+        """Return the speculative search results if they fit the tool query, else None"""
+        slot = _speculation.get()
+        if not slot or slot.get("future") is None:
+            return None
+        
+        if slot["user_id"] != user_id or not _queries_match(
+            query, slot["query"], settings.SPECULATIVE_MATCH_THRESHOLD
+        ):
+            return None
         
-        # Choose checkpointer based on configuration
-        if settings.VECTOR_STORE_TYPE == "mongodb":
+        future = slot.pop("future")
+        slot.pop("query")
+        slot.pop("user_id")
+        
+        try:
+            retrieved_docs = future.result()
+        except Exception as e:
+            logger.warning("Speculative retrieval failed, retrying: %s", e)
+            self._count_speculation("misses")
+            return None
+        
+        self._count_speculation("hits")
+        logger.debug("Speculative retrieval hit")
+        return retrieved_docs
+    
+    def _count_speculation(self, outcome: str):
+        """Record a speculative retrieval outcome for /rag-stats and /metrics"""
+        self._speculation_stats[outcome] += 1
+        SPECULATIVE_RETRIEVAL_TOTAL.labels(outcome=outcome).inc()
+    
+    def _invoke_llm(self, llm, messages, node: str):
+        """Invoke the model for a graph node, recording its latency and outcome"""
+        # Number the calls in the request trace so the first and final model calls stay apart
+        trace = current_trace()
+        span = f"llm_call.{node}.{trace.count_spans(f'llm_call.{node}') + 1}" if trace else None
+        try:
+            with track_stage(LLM_CALL_SECONDS, span=span, node=node):
+                response = llm.invoke(messages)
+        except Exception:
+            LLM_CALLS_TOTAL.labels(node=node, status="error").inc()
+            raise
+        LLM_CALLS_TOTAL.labels(node=node, status="success").inc()
+        return response
+    
+    def _create_checkpointer(self):
+        """Create the LangGraph checkpointer shared by all graph modes"""
+        # Thread state must live in MongoDB whenever more than one process serves chats
+        use_mongodb = settings.ENABLE_MONGODB_CHECKPOINTER and (
+            settings.VECTOR_STORE_TYPE == "mongodb" or settings.WEB_WORKERS > 1
+        )
+        if use_mongodb:
             try:
-                # Try to use MongoDB checkpointer for consistency
-                print("🔄 Attempting to initialize MongoDB checkpointer...")
-                
-                # Get MongoDB connection details
-                db = get_database()
-                
-                # Create MongoDB checkpointer
-                # Note: MongoDBSaver requires specific setup
                 checkpointer = MongoDBSaver(
-                    client=db,
-                    collection_name="langgraph_checkpoints"
+                    get_mongodb_client(),
+                    db_name=settings.DB_NAME,
+                    checkpoint_collection_name=settings.LANGGRAPH_CHECKPOINT_COLLECTION,
+                    writes_collection_name=settings.LANGGRAPH_WRITES_COLLECTION
                 )
 
-                print("✅ Using MongoDB checkpointer for LangGraph state persistence")
+                logger.info("Using MongoDB checkpointer for LangGraph state persistence")
                 
             except Exception as e:
-                print(f"⚠️ Could not initialize MongoDB checkpointer: {e}")
-                print("🔄 Falling back to InMemory checkpointer")
+                logger.warning("Could not initialize MongoDB checkpointer, falling back to InMemory: %s", e)
                 checkpointer = InMemorySaver()
         else:
-            # Use memory-based checkpointer for FAISS or other stores
+            # Use memory-based checkpointer for single-worker FAISS or other stores
             checkpointer = InMemorySaver()
-            print(f"💾 Using InMemory checkpointer")
+            logger.info("Using InMemory checkpointer")
+        
+        return instrument_checkpointer(checkpointer)
+    
+    def _get_graph(self, mode: str):
+        """Get the compiled graph for a mode, building it on first use"""
+        if mode not in self.graphs:
+            self.graphs[mode] = self._build_graph(mode)
+        return self.graphs[mode]
+    
+    def _build_graph(self, mode: str = "agentic"):
+        """Build the LangGraph for RAG in the requested topology"""
+        if mode == "retrieval_first":
+            return self._build_retrieval_first_graph()
+        return self._build_agentic_graph()
+    
+    def _build_agentic_graph(self):
+        """Build the tool-calling LangGraph: the model decides when to retrieve"""
+        # Retrieval tool; the search is scoped to the user of the conversation by tools_node,
+        # never to a user id the model writes into the call
+        if settings.ENABLE_MULTI_QUERY_RETRIEVAL:
+            @tool()
+            def retrieve(query: str, alternative_queries: Optional[List[str]] = None):
+                """Retrieve information related to a query from the user's documents.
+                Pass rephrasings or sub-questions as alternative_queries to search them at the same time."""
+                return self._run_retrievals([{"query": query, "alternative_queries": alternative_queries}])[0]
+        else:
+            @tool()
+            def retrieve(query: str):
+                """Retrieve information related to a query from the user's documents."""
+                return self._run_retrievals([{"query": query}])[0]
         
         # Create the LLM with tools
         llm_with_tools = self.llm.bind_tools([retrieve])
@@ -121,12 +384,7 @@ class RAGEngine:
         def call_model(state):
             """Process messages and generate a response"""
             messages = state["messages"]
-            print(f"🧠 call_model received {len(messages)} messages")
-            
-            # Debug: Log message types in current state
-            for i, msg in enumerate(messages[-3:]):  # Show last 3 messages
-                content_preview = str(msg.content)[:50] + "..." if len(str(msg.content)) > 50 else str(msg.content)
-                print(f"  📝 Message {i}: {msg.type.upper()} - {content_preview}")
+            logger.debug("call_model received %d messages", len(messages))
             
             # Enhanced system message with more context
             if not any(msg.type == "system" for msg in messages):
@@ -140,19 +398,48 @@ class RAGEngine:
                 )
                 messages = [system_message] + messages
             
+            # First model call of the turn: overlap a search on the raw user message
+            last_message = state["messages"][-1]
+            if last_message.type == "human":
+                self._start_speculative_retrieval(str(last_message.content), _user_id(state["messages"]))
+            
             # Generate response
-            response = llm_with_tools.invoke(messages)
+            response = self._invoke_llm(llm_with_tools, messages, "call_model")
+            
+            # The model answered directly - the speculative search is not needed
+            if not getattr(response, "tool_calls", None):
+                self._cancel_speculative_retrieval()
             
             # Return updated state (MessagesState automatically appends)
             return {"messages": [response]}
         
-        # Tool execution node
-        tools_node = ToolNode(tools=[retrieve])
+        # Tool execution node - all retrieve calls of a turn run together
+        def tools_node(state):
+            """Execute the tool calls of the last model message concurrently"""
+            tool_calls = state["messages"][-1].tool_calls
+            logger.debug("Executing %d tool calls", len(tool_calls))
+            
+            retrieve_calls = [tool_call for tool_call in tool_calls if tool_call["name"] == retrieve.name]
+            user_id = _user_id(state["messages"])
+            with track_stage(TOOL_EXECUTION_SECONDS, tool=retrieve.name):
+                contents = iter(self._run_retrievals([
+                    {**tool_call["args"], "user_id": user_id} for tool_call in retrieve_calls
+                ]))
+            
+            tool_messages = []
+            for tool_call in tool_calls:
+                if tool_call["name"] == retrieve.name:
+                    content = next(contents)
+                else:
+                    content = f"Error: {tool_call['name']} is not a valid tool, try {retrieve.name}."
+                tool_messages.append(ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"]))
+            
+            return {"messages": tool_messages}
         
         # Build the graph
         builder = StateGraph(MessagesState)
-        builder.add_node("call_model", call_model)
-        builder.add_node("tools", tools_node)
+        builder.add_node("call_model", traced_node("call_model", call_model))
+        builder.add_node("tools", traced_node("tools", tools_node))
         
         # Set entry point
         builder.set_entry_point("call_model")
@@ -171,73 +458,84 @@ class RAGEngine:
         builder.add_edge("tools", "call_model")
         
         # Compile graph with persistence
-        graph = builder.compile(checkpointer=checkpointer)
+        graph = builder.compile(checkpointer=self.checkpointer)
+        
+        logger.debug("LangGraph RAG engine compiled (agentic mode)")
+        return graph
+    
+    def _build_retrieval_first_graph(self):
+        """Build the retrieval-first LangGraph: retrieve on the user message, then one LLM call"""
+        def retrieve_context(state):
+            """Retrieve documents for the latest user message"""
+            human_message = next((msg for msg in reversed(state["messages"]) if msg.type == "human"), None)
+            if human_message is None:
+                return {"context": ""}
+            
+            query = str(human_message.content)
+            with track_stage(TOOL_EXECUTION_SECONDS, tool="retrieve"):
+                context = self._run_retrievals([{
+                    "query": query,
+                    "user_id": human_message.additional_kwargs.get("user_id"),
+                    "alternative_queries": _expand_query(query, settings.MULTI_QUERY_MAX_QUERIES)
+                }])[0]
+            return {"context": context}
+        
+        def generate(state):
+            """Answer the user from the retrieved context"""
+            messages = [msg for msg in state["messages"] if msg.type != "system"]
+            logger.debug("generate received %d messages", len(messages))
+            
+            system_message = SystemMessage(content=
+                "You are a helpful AI assistant with access to a knowledge base through document retrieval. "
+                f"You are using a {settings.VECTOR_STORE_TYPE} vector store for document search. "
+                "Documents relevant to the user's latest question have already been retrieved and are listed below. "
+                "If you find relevant documents, base your answer on that information and cite the sources. "
+                "If no relevant documents are found, let the user know no information is found in the database."
+                "Always be helpful, accurate, and cite your sources when using retrieved information.\n\n"
+                f"Retrieved documents:\n{state.get('context', '')}"
+            )
+            
+            # Single LLM call - no tools bound
+            response = self._invoke_llm(self.llm, [system_message] + messages, "generate")
+            return {"messages": [response]}
+        
+        # Build the graph
+        builder = StateGraph(RetrievalFirstState)
+        builder.add_node("retrieve_context", traced_node("retrieve_context", retrieve_context))
+        builder.add_node("generate", traced_node("generate", generate))
+        
+        builder.add_edge(START, "retrieve_context")
+        builder.add_edge("retrieve_context", "generate")
+        builder.add_edge("generate", END)
+        
+        # Compile graph with persistence
+        graph = builder.compile(checkpointer=self.checkpointer)
         
-        print("✅ LangGraph RAG engine compiled successfully")
+        logger.debug("LangGraph RAG engine compiled (retrieval_first mode)")
         return graph
     
-    def process_message(self, message: str, thread_id: Optional[str] = None, user_id: Optional[str] = None) -> tuple[str, str]:
+    def _resolve_graph_mode(self, graph_mode: Optional[str]) -> str:
+        """The topology to run: graph_mode if given, else the configured default"""
+        if graph_mode is None:
+            return self.graph_mode
+        if graph_mode not in GRAPH_MODES:
+            raise ValueError(f"Unknown graph mode {graph_mode!r}; expected one of {', '.join(GRAPH_MODES)}")
+        return graph_mode
+    
+    def process_message(self, message: str, thread_id: Optional[str] = None, user_id: Optional[str] = None,
+                        graph_mode: Optional[str] = None) -> tuple[str, str]:
         """
         Process message using LangGraph with user context
         Enhanced to support user-specific document retrieval
+        graph_mode overrides the configured topology ("agentic" or "retrieval_first")
         """
+        thread_id = thread_id or str(uuid.uuid4())
+        mode = self._resolve_graph_mode(graph_mode)
         try:
-            thread_id = thread_id or str(uuid.uuid4())
-            print(f"\n🆕 === LANGGRAPH RAG PROCESSING ===")
-            print(f"🔗 Thread ID: {thread_id}")
-            print(f"👤 User ID: {user_id}")
-            print(f"🏪 Vector Store: {settings.VECTOR_STORE_TYPE}")
-            print(f"📝 Message: {message[:100]}...")
-            
-            # Configuration with thread_id for LangGraph persistence
-            config = {"configurable": {"thread_id": thread_id}}
-            
-            # Add user context to the message if provided
-            if user_id:
-                # We can pass user context through the message or state
-                # For now, we'll add it as metadata in the human message
-                human_message = HumanMessage(
-                    content=message,
-                    additional_kwargs={"user_id": user_id}
-                )
-            else:
-                human_message = HumanMessage(content=message)
-            
-            input_state = {"messages": [human_message]}
-            print(f"📤 Sending to LangGraph with user context")
-            
-            # Process the message using LangGraph's state management
-            print(f"🚀 Invoking LangGraph RAG engine...")
-            result = self.graph.invoke(input_state, config=config)
-            print(f"✅ LangGraph processing completed")
-            print(f"📥 Result contains {len(result['messages'])} total messages")
-            
-            # Debug: Show the conversation flow
-            print(f"🔍 === CONVERSATION FLOW ===")
-            for i, msg in enumerate(result["messages"][-5:]):  # Show last 5 messages
-                content_preview = str(msg.content)[:80] + "..." if len(str(msg.content)) > 80 else str(msg.content)
-                tool_info = ""
-                if hasattr(msg, "tool_calls") and msg.tool_calls:
-                    tool_info = f" [🛠️ {len(msg.tool_calls)} tool calls]"
-                elif hasattr(msg, "tool_call_id"):
-                    tool_info = f" [🔧 tool response]"
-                print(f"  {i+1}: {msg.type.upper()}{tool_info} - {content_preview}")
-            
-            # Get the last AI message as the response
-            ai_message = result["messages"][-1]
-            response_text = ai_message.content
-            
-            print(f"💬 Final response length: {len(response_text)} characters")
-            print(f"📄 Response preview: {response_text[:150]}...")
-            print(f"✅ === RAG PROCESSING COMPLETED ===\n")
-            
-            return response_text, thread_id
+            return self._answer(message, thread_id, user_id, mode)
             
         except Exception as e:
-            print(f"❌ Error in RAG processing: {str(e)}")
-            import traceback
-            print(f"📋 Full traceback:")
-            print(traceback.format_exc())
+            logger.exception("Error in RAG processing", extra={"thread_id": thread_id})
             
             # Provide a helpful fallback response
             error_response = (
@@ -247,7 +545,131 @@ class RAGEngine:
             )
             
             return error_response, thread_id
-
+    
+    def _answer(self, message: str, thread_id: str, user_id: Optional[str] = None,
+                graph_mode: Optional[str] = None) -> tuple[str, str]:
+        """Run the graph for one message; errors propagate to the caller"""
+        mode = self._resolve_graph_mode(graph_mode)
+        annotate(thread_id=thread_id, user_id=user_id, graph_mode=mode)
+        
+        # Configuration with thread_id for LangGraph persistence
+        config = {"configurable": {"thread_id": thread_id}}
+        
+        # Add user context to the message if provided
+        if user_id:
+            # We can pass user context through the message or state
+            # For now, we'll add it as metadata in the human message
+            human_message = HumanMessage(
+                content=message,
+                additional_kwargs={"user_id": user_id}
+            )
+        else:
+            human_message = HumanMessage(content=message)
+        
+        input_state = {"messages": [human_message]}
+        
+        # Process the message using LangGraph's state management
+        start_time = time.perf_counter()
+        speculation_token = _speculation.set({})
+        try:
+            result = self._get_graph(mode).invoke(input_state, config=config)
+        finally:
+            self._cancel_speculative_retrieval()
+            _speculation.reset(speculation_token)
+        elapsed = time.perf_counter() - start_time
+        self._latencies[mode].append(elapsed)
+        
+        # Get the last AI message as the response
+        ai_message = result["messages"][-1]
+        response_text = ai_message.content
+        
+        logger.debug("RAG processing completed in %.0f ms", elapsed * 1000, extra={
+            "thread_id": thread_id,
+            "graph_mode": mode,
+            "message_count": len(result["messages"]),
+            "response_chars": len(response_text)
+        })
+        
+        return response_text, thread_id
+    
+    def process_batch(self, messages: List[dict], user_id: Optional[str] = None, graph_mode: Optional[str] = None,
+                      concurrency: Optional[int] = None) -> Iterator[dict]:
+        """Answer many independent messages, yielding each result as soon as it completes.
+        
+        messages are {"message", "thread_id"?, "id"?} dicts, all asked as user_id. At most `concurrency` graph runs are
+        in flight, and their query embeddings go through one QueryEmbeddingBatcher. Results are
+        {"index", "id", "thread_id", "response", "error", "latency_ms"}; a failed run has a null
+        response and the error message instead of the fallback text process_message returns.
+        """
+        concurrency = max(1, min(concurrency or settings.CHAT_BATCH_CONCURRENCY, settings.CHAT_BATCH_CONCURRENCY))
+        mode = self._resolve_graph_mode(graph_mode)
+        batcher = QueryEmbeddingBatcher(
+            self.vector_store.embeddings,
+            settings.CHAT_BATCH_EMBEDDING_SIZE,
+            settings.CHAT_BATCH_EMBEDDING_WAIT_MS / 1000
+        )
+        # Every run searches its raw message unless the model decides the search itself
+        prefetch = mode == "retrieval_first" or settings.ENABLE_SPECULATIVE_RETRIEVAL
+        prefetched = 0
+        
+        def run(index: int, item: dict) -> dict:
+            _query_batcher.set(batcher)
+            thread_id = item.get("thread_id") or str(uuid.uuid4())
+            result = {"index": index, "id": item.get("id"), "thread_id": thread_id, "response": None, "error": None}
+            start_time = time.perf_counter()
+            try:
+                result["response"], _ = self._answer(item["message"], thread_id, user_id, mode)
+            except Exception as e:
+                logger.warning("Batch message %d failed: %s", index, e, extra={"thread_id": thread_id})
+                result["error"] = str(e)
+            result["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 1)
+            return result
+        
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat-batch")
+        queue = iter(enumerate(messages))
+        running = set()
+        
+        def start_next() -> bool:
+            nonlocal prefetched
+            index, item = next(queue, (None, None))
+            if item is None:
+                return False
+            # Keep the embeddings of the next few hundred questions in flight, not all of them
+            if prefetch and index + concurrency >= prefetched:
+                window = messages[prefetched:prefetched + settings.CHAT_BATCH_EMBEDDING_SIZE]
+                batcher.prefetch(entry["message"] for entry in window)
+                prefetched += len(window)
+            # A fresh context per run: no request trace collecting thousands of runs' spans
+            running.add(executor.submit(Context().run, run, index, item))
+            return True
+        
+        logger.info("Processing a batch of %d messages (%s mode, concurrency %d)", len(messages), mode, concurrency)
+        start_time = time.perf_counter()
+        try:
+            for _ in range(concurrency):
+                if not start_next():
+                    break
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start_next()
+                    yield future.result()
+        finally:
+            # Stops the remaining work when the caller goes away mid-batch
+            executor.shutdown(wait=False, cancel_futures=True)
+            batcher.close()
+            logger.info("Batch of %d messages finished in %.1f s (%d embedding requests for %d queries)",
+                        len(messages), time.perf_counter() - start_time, batcher.calls, batcher.embedded)
+    
+    def delete_thread(self, thread_id: str):
+        """Drop the LangGraph state (checkpoints and pending writes) of a thread"""
+        if isinstance(self.checkpointer, MongoDBSaver):
+            # This MongoDBSaver version does not implement delete_thread
+            self.checkpointer.writes_collection.delete_many({"thread_id": thread_id})
+            self.checkpointer.checkpoint_collection.delete_many({"thread_id": thread_id})
+        else:
+            self.checkpointer.delete_thread(thread_id)
+    
     def get_vector_store_info(self) -> dict:
         """Get information about the current vector store"""
         try:
@@ -263,6 +685,52 @@ class RAGEngine:
             return info
         except Exception as e:
             return {"type": settings.VECTOR_STORE_TYPE, "error": str(e)}
+    
+    def get_memory_usage(self) -> dict:
+        """Approximate memory held by the checkpointer and latency windows"""
+        from ..profiling import deep_sizeof
+        
+        usage = {
+            "checkpointer": type(self.checkpointer).__name__,
+            "latency_samples": sum(len(samples) for samples in self._latencies.values())
+        }
+        if isinstance(self.checkpointer, InMemorySaver):
+            storage = self.checkpointer.storage
+            usage.update({
+                "threads": len(storage),
+                "checkpoints": sum(len(checkpoints) for namespaces in storage.values() for checkpoints in namespaces.values()),
+                "pending_writes": len(self.checkpointer.writes),
+                "blobs": len(self.checkpointer.blobs),
+                "checkpointer_bytes": deep_sizeof(storage) + deep_sizeof(self.checkpointer.writes)
+                                      + deep_sizeof(self.checkpointer.blobs)
+            })
+        return usage
+    
+    def get_latency_stats(self) -> dict:
+        """Get end-to-end graph latency (ms) per graph mode over the recent window"""
+        stats = {}
+        for mode, samples in self._latencies.items():
+            ordered = sorted(samples)
+            if not ordered:
+                stats[mode] = {"count": 0}
+                continue
+            
+            def percentile(p):
+                return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+            
+            stats[mode] = {
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "max_ms": round(ordered[-1] * 1000, 1)
+            }
+        
+        return {
+            "default_mode": self.graph_mode,
+            "modes": stats,
+            "speculative_retrieval": dict(self._speculation_stats)
+        }
 
 # Singleton pattern
 _rag_engine = None
@@ -0,0 +1,113 @@
+# app/rag/query_batching.py
+"""
+Shared query embedding requests for batched chat.
+
+The graph runs of one /chat/batch request embed their search queries through a
+QueryEmbeddingBatcher instead of one embeddings request per query: questions are prefetched in
+large embed_documents calls, and the queries the runs write later (tool calls, sub-questions)
+are collected for CHAT_BATCH_EMBEDDING_WAIT_MS so concurrent runs share a request.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List
+
+from ..logging_config import get_logger
+from ..metrics import track_stage, QUERY_EMBEDDING_SECONDS
+
+logger = get_logger(__name__)
+
+class QueryEmbeddingBatcher:
+    """Coalesces query embeddings from many threads into few embed_documents calls"""
+
+    def __init__(self, embeddings, max_batch: int, wait_seconds: float):
+        self.embeddings = embeddings
+        self.max_batch = max(1, max_batch)
+        self.wait_seconds = wait_seconds
+        self.calls = 0  # embed_documents requests made
+        self.embedded = 0  # texts embedded
+        self._futures: Dict[str, Future] = {}  # text -> embedding, until someone takes it
+        self._pending: List[str] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue text for the next embeddings request (identical texts share one future)"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Query embedding batcher is closed")
+            future = self._futures.get(text)
+            if future is None:
+                future = self._futures[text] = Future()
+                self._pending.append(text)
+                self._condition.notify()
+            return future
+
+    def prefetch(self, texts: Iterable[str]):
+        """Queue texts that runs are going to search for"""
+        for text in texts:
+            self.submit(text)
+
+    def embed(self, text: str) -> List[float]:
+        """Embedding of text; it is dropped from the batcher once taken"""
+        future = self.submit(text)
+        embedding = future.result()
+        with self._condition:
+            if self._futures.get(text) is future:
+                del self._futures[text]
+        return embedding
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings of several texts, queued together so they land in the same request"""
+        for text in texts:
+            self.submit(text)
+        return [self.embed(text) for text in texts]
+
+    def close(self):
+        """Embed what is still queued and stop the worker thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _next_batch(self) -> List[str]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            # Give concurrent runs a moment to add their queries to this request
+            deadline = time.monotonic() + self.wait_seconds
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            with self._condition:
+                futures = [self._futures[text] for text in batch]
+            try:
+                with track_stage(QUERY_EMBEDDING_SECONDS):
+                    embeddings = self.embeddings.embed_documents(batch)
+            except Exception as e:
+                logger.warning("Batched query embedding failed for %d queries: %s", len(batch), e)
+                with self._condition:
+                    # Let later searches for the same text try again
+                    for text, future in zip(batch, futures):
+                        if self._futures.get(text) is future:
+                            del self._futures[text]
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.calls += 1
+            self.embedded += len(batch)
+            for future, embedding in zip(futures, embeddings):
+                future.set_result(embedding)
@@ -0,0 +1,153 @@
+# app/tracing.py
+"""
+Per-request span timelines.
+
+The request middleware starts a RequestTrace and keeps it in a ContextVar; stages timed
+with metrics.track_stage (or trace_span directly) add spans to it. The trace becomes the
+Server-Timing header, and requests slower than SLOW_REQUEST_THRESHOLD_MS are saved with
+their full timeline to a capped collection.
+"""
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+from .config import settings
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+# Spans that overlap the stage spans they contain - kept in the timeline, left out of Server-Timing
+_TIMELINE_ONLY_PREFIXES = ("node.",)
+
+_trace_db = None
+
+class RequestTrace:
+    """Span timeline for a single request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []  # list.append is atomic, so worker threads can add spans
+        self.nodes: List[str] = []
+        self.attributes: Dict[str, Any] = {}
+
+    def add_span(self, name: str, start: float, duration: float):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+        })
+
+    def count_spans(self, name: str) -> int:
+        return sum(1 for span in self.spans if span["name"] == name or span["name"].startswith(name + "."))
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self, total_ms: float) -> str:
+        """Stage durations in Server-Timing syntax, summed per span name in first-seen order"""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans:
+            if span["name"].startswith(_TIMELINE_ONLY_PREFIXES):
+                continue
+            entry = totals.setdefault(span["name"], [0.0, 0])
+            entry[0] += span["duration_ms"]
+            entry[1] += 1
+
+        metrics = []
+        for name, (duration, count) in totals.items():
+            metric = f"{_timing_token(name)};dur={duration:.1f}"
+            if count > 1:
+                metric += f';desc="{count}x"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(metrics)
+
+    def to_document(self, status: int, route: str, total_ms: float) -> Dict[str, Any]:
+        return {
+            "timestamp": self.started_at,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(total_ms, 1),
+            "nodes": list(self.nodes),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+            "attributes": dict(self.attributes),
+        }
+
+def _timing_token(name: str) -> str:
+    """Server-Timing metric names must be HTTP tokens"""
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name)
+
+def start_trace(method: str, path: str):
+    """Start a trace for the current request, returning (trace, token) for end_trace"""
+    trace = RequestTrace(method, path)
+    return trace, _current_trace.set(trace)
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+def annotate(**attributes):
+    """Attach attributes (thread id, user id, ...) to the current request trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+@contextmanager
+def trace_span(name: str):
+    """Record a span on the current request trace (no-op outside a request)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter() - start)
+
+def traced_node(name: str, fn):
+    """Wrap a LangGraph node so it appears in the trace's node sequence and timeline"""
+    def node(state):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.nodes.append(name)
+        with trace_span(f"node.{name}"):
+            return fn(state)
+    node.__name__ = getattr(fn, "__name__", name)
+    node.__doc__ = fn.__doc__
+    return node
+
+def ensure_trace_collection(db):
+    """Create the capped collection for slow request traces if it does not exist"""
+    if settings.REQUEST_TRACES_COLLECTION not in db.list_collection_names():
+        db.create_collection(
+            settings.REQUEST_TRACES_COLLECTION,
+            capped=True,
+            size=settings.REQUEST_TRACES_MAX_BYTES
+        )
+
+def save_slow_trace(document: Dict[str, Any]):
+    """Persist a slow request trace (runs off the event loop; failures are only logged)"""
+    global _trace_db
+    try:
+        if _trace_db is None:
+            from .db.mongodb import get_database
+            db = get_database()
+            # Create the capped collection before the first insert would create a plain one
+            ensure_trace_collection(db)
+            _trace_db = db
+        _trace_db[settings.REQUEST_TRACES_COLLECTION].insert_one(document)
+    except Exception as e:
+        logger.warning("Could not save slow request trace: %s", e)
@@ -0,0 +1,52 @@
+# app/vector_store/embeddings.py
+from typing import Optional
+
+from langchain_openai import OpenAIEmbeddings
+
+from ..config import settings
+
+# Native output size of the OpenAI embedding models
+MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Only these models accept a shorter `dimensions`
+SHORTENABLE_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+
+def get_embeddings(model: Optional[str] = None, dimensions: Optional[int] = None):
+    """Create an embedding model: the configured one, or `model` at `dimensions` (None = native size)"""
+    if model is None:
+        model, dimensions = settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS
+    if dimensions == MODEL_DIMENSIONS.get(model):
+        dimensions = None
+    if dimensions and model not in SHORTENABLE_MODELS:
+        raise ValueError(f"Embedding dimensions are not supported by {model}")
+    # OPENAI_BASE_URL points the client at any OpenAI-compatible server (e.g. the load-test stub)
+    return OpenAIEmbeddings(
+        model=model,
+        dimensions=dimensions or None,
+        base_url=settings.OPENAI_BASE_URL or None,
+        check_embedding_ctx_length=settings.EMBEDDING_CHECK_CTX_LENGTH
+    )
+
+def configured_dimensions() -> int:
+    """Vector size the configured model produces"""
+    return settings.EMBEDDING_DIMENSIONS or MODEL_DIMENSIONS.get(settings.EMBEDDING_MODEL, 1536)
+
+def embedding_model_name(embeddings) -> str:
+    return getattr(embeddings, "model", None) or settings.EMBEDDING_MODEL
+
+def embedding_dimensions(embeddings) -> Optional[int]:
+    """Vector size of an embedding model: its requested dimensions, else the model's native size (None if unknown)"""
+    return getattr(embeddings, "dimensions", None) or MODEL_DIMENSIONS.get(embedding_model_name(embeddings))
+
+def embedding_space(model: str, dimensions: Optional[int]) -> str:
+    """Name of the vector space a model + size produce: the model name, suffixed when shortened
+
+    Vectors from different spaces are not comparable, so chunk ids and search filters use it.
+    """
+    if dimensions is None or dimensions == MODEL_DIMENSIONS.get(model, dimensions):
+        return model
+    return f"{model}@{dimensions}"
@@ -0,0 +1,359 @@
+# app/vector_store/faiss_shared.py
+"""
+FAISS store for multi-worker deployments.
+
+The index lives in FAISS_SHARED_DIR as immutable segments: a float32 vector matrix and
+a JSON-lines docstore with its row offsets. Every worker memory-maps the segments
+read-only, so the page cache holds one copy however many workers run. manifest.json
+lists the live segments; writers hold an exclusive file lock while they add a segment
+(ingestion from any worker goes through one writer at a time), and readers pick up a
+new manifest within FAISS_REFRESH_SECONDS. With VECTOR_QUANTIZATION set, segments also
+carry int8 or binary codes that are screened first, so only candidate rows of the full
+vectors are paged in for exact rescoring.
+"""
+import fcntl
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ..config import settings
+from .embeddings import get_embeddings, embedding_model_name, embedding_dimensions, embedding_space
+from .quantization import quantize_int8, pack_bits, int8_dot, hamming_distances, smallest, candidate_count
+from ..logging_config import get_logger
+from ..metrics import (
+    track_stage,
+    QUERY_EMBEDDING_SECONDS,
+    VECTOR_SEARCH_SECONDS,
+    EMBEDDING_BATCH_SECONDS,
+    EMBEDDING_BATCH_SIZE,
+)
+
+logger = get_logger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "writer.lock"
+FILTER_FETCH_K = 20  # Candidates per segment when filtering, as langchain's FAISS fetch_k
+SEGMENT_CODE_FILES = {"int8": ("int8", "scales"), "binary": ("bits",)}
+SEGMENT_FILE_SUFFIXES = (".vectors.npy", ".norms.npy", ".offsets.npy", ".docs.jsonl",
+                         ".int8.npy", ".scales.npy", ".bits.npy")
+
+class _Segment:
+    """One immutable segment, memory-mapped read-only"""
+
+    def __init__(self, folder: str, entry: Dict[str, Any]):
+        self.name = entry["name"]
+        self.user_ids = set(entry.get("user_ids", []))
+        base = os.path.join(folder, self.name)
+        self.vectors = np.load(f"{base}.vectors.npy", mmap_mode="r")
+        self.norms = np.load(f"{base}.norms.npy", mmap_mode="r")
+        self.offsets = np.load(f"{base}.offsets.npy", mmap_mode="r")
+        # Screening codes, present when the segment was written with quantization on
+        self.codes = {
+            mode: tuple(np.load(f"{base}.{part}.npy", mmap_mode="r") for part in parts)
+            for mode, parts in SEGMENT_CODE_FILES.items()
+            if all(os.path.exists(f"{base}.{part}.npy") for part in parts)
+        }
+        with open(f"{base}.docs.jsonl", "rb") as docs_file:
+            self.docs = mmap.mmap(docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.norms)
+
+    def search(self, query: np.ndarray, fetch_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows nearest to the query by squared L2 distance (as the flat index langchain builds)"""
+        mode = settings.VECTOR_QUANTIZATION
+        candidates = candidate_count(mode, fetch_k)
+        if mode in self.codes and candidates < len(self):
+            # Screen the codes, then rescore only the candidate rows at full precision
+            if mode == "int8":
+                codes, scales = self.codes[mode]
+                rows = smallest(self.norms - 2.0 * int8_dot(codes, scales, query), candidates)
+            else:
+                rows = smallest(hamming_distances(self.codes[mode][0], pack_bits(query)[0]), candidates)
+            rows = np.sort(rows)  # Ascending rows read the mapped vectors sequentially
+            scores = self.norms[rows] - 2.0 * (self.vectors[rows] @ query)
+            best = smallest(scores, fetch_k)
+            return scores[best] + float(query @ query), rows[best]
+
+        scores = self.norms - 2.0 * (self.vectors @ query)
+        rows = smallest(scores, fetch_k)
+        return scores[rows] + float(query @ query), rows
+
+    def document(self, row: int) -> Document:
+        record = json.loads(self.docs[self.offsets[row]:self.offsets[row + 1]])
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    def file_bytes(self) -> Dict[str, int]:
+        return {
+            "vectors": self.vectors.nbytes + self.norms.nbytes,
+            "codes": sum(part.nbytes for parts in self.codes.values() for part in parts),
+            "docstore": len(self.docs) + self.offsets.nbytes
+        }
+
+def _write_segment(folder: str, name: str, vectors: np.ndarray, docs: bytes, offsets: np.ndarray):
+    base = os.path.join(folder, name)
+    np.save(f"{base}.vectors.npy", vectors)
+    np.save(f"{base}.norms.npy", np.einsum("ij,ij->i", vectors, vectors))
+    np.save(f"{base}.offsets.npy", offsets)
+    if settings.VECTOR_QUANTIZATION == "int8":
+        codes, scales = quantize_int8(vectors)
+        np.save(f"{base}.int8.npy", codes)
+        np.save(f"{base}.scales.npy", scales)
+    elif settings.VECTOR_QUANTIZATION == "binary":
+        np.save(f"{base}.bits.npy", pack_bits(vectors))
+    with open(f"{base}.docs.jsonl", "wb") as docs_file:
+        docs_file.write(docs)
+
+def _encode_documents(documents: List[Document]) -> Tuple[bytes, np.ndarray]:
+    """JSON lines for the documents and the byte offset of each line (plus the end)"""
+    lines = [
+        (json.dumps({"text": doc.page_content, "metadata": doc.metadata}, default=str) + "\n").encode("utf-8")
+        for doc in documents
+    ]
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(line) for line in lines], out=offsets[1:])
+    return b"".join(lines), offsets
+
+class SharedFAISSVectorStore:
+    """FAISS vector store whose index is shared by all worker processes through memory-mapped segments"""
+
+    def __init__(self, folder: Optional[str] = None, embeddings=None):
+        # embeddings can be injected (benchmarks, local stand-ins); default to OpenAI
+        self.embeddings = embeddings or get_embeddings()
+        self.embedding_model = embedding_model_name(self.embeddings)
+        self.embedding_dimensions = embedding_dimensions(self.embeddings)
+        self.folder = folder or settings.FAISS_SHARED_DIR
+        os.makedirs(self.folder, exist_ok=True)
+        self._segments: List[_Segment] = []
+        self._version = None
+        self._space = (None, None)  # (model, dimensions) the shared index was built with
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.refresh(force=True)
+        logger.info("Initialized shared FAISS vector store in %s (%d segments)", self.folder, len(self._segments))
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.folder, MANIFEST_FILE)) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {"version": 0, "embedding_model": None, "dimensions": None, "segments": []}
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        # Readers see the old or the new manifest, never a partial one
+        path = os.path.join(self.folder, MANIFEST_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(tmp_path, path)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reopen the segments if another worker changed the manifest, returning whether it had"""
+        if not force and time.monotonic() - self._checked_at < settings.FAISS_REFRESH_SECONDS:
+            return False
+
+        with self._refresh_lock:
+            for attempt in range(3):
+                manifest = self._read_manifest()
+                if manifest["version"] == self._version:
+                    self._checked_at = time.monotonic()
+                    return False
+                try:
+                    opened = {segment.name: segment for segment in self._segments}
+                    segments = [opened.get(entry["name"]) or _Segment(self.folder, entry)
+                                for entry in manifest["segments"]]
+                    break
+                except FileNotFoundError:
+                    # A merge removed a segment between reading the manifest and opening it
+                    logger.debug("Segment vanished while refreshing (attempt %d), re-reading manifest", attempt + 1)
+            else:
+                logger.warning("Could not open the segments of %s, keeping the current ones", self.folder)
+                return False
+
+            # Searches in flight keep the list they started with
+            self._segments = segments
+            self._version = manifest["version"]
+            self._space = (manifest.get("embedding_model"), manifest.get("dimensions"))
+            self._checked_at = time.monotonic()
+
+        logger.info("Opened FAISS manifest version %d (%d segments, %d vectors)",
+                    manifest["version"], len(segments), sum(len(segment) for segment in segments))
+        return True
+
+    @contextmanager
+    def _writer(self) -> Iterator[Dict[str, Any]]:
+        """Exclusive write access across all workers, yielding the current manifest"""
+        with self._write_lock, open(os.path.join(self.folder, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self._read_manifest()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _check_space(self, model: Optional[str], dimensions: Optional[int], vector_dimensions: int):
+        """Refuse to mix vectors from another model or size into (or against) the shared index"""
+        if model not in (None, self.embedding_model) or dimensions not in (None, vector_dimensions):
+            raise ValueError(
+                f"The shared index holds {embedding_space(model or self.embedding_model, dimensions)} vectors; "
+                f"got {embedding_space(self.embedding_model, vector_dimensions)}"
+            )
+
+    def add_documents(self, documents: List[Document], user_id: Optional[str] = None):
+        """Embed documents and publish them to every worker as a new segment"""
+        if not documents:
+            return
+
+        logger.debug("Adding %d documents to shared FAISS store (user_id=%s)", len(documents), user_id)
+
+        # Add user_id to metadata if provided
+        if user_id:
+            for doc in documents:
+                if not doc.metadata:
+                    doc.metadata = {}
+                doc.metadata["user_id"] = user_id
+
+        # Embedding happens outside the writer lock so workers can embed concurrently
+        texts = [doc.page_content for doc in documents]
+        EMBEDDING_BATCH_SIZE.labels(backend="faiss").observe(len(texts))
+        with track_stage(EMBEDDING_BATCH_SECONDS, backend="faiss"):
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        docs, offsets = _encode_documents(documents)
+        user_ids = sorted({doc.metadata.get("user_id") for doc in documents if doc.metadata.get("user_id")})
+
+        with self._writer() as manifest:
+            # One index holds one vector space; a worker with another model must not write into it
+            self._check_space(manifest.get("embedding_model"), manifest["dimensions"], vectors.shape[1])
+            name = f"seg-{manifest['version'] + 1:08d}-{uuid.uuid4().hex[:8]}"
+            _write_segment(self.folder, name, vectors, docs, offsets)
+            manifest["segments"].append({"name": name, "count": len(documents), "user_ids": user_ids})
+            manifest["dimensions"] = vectors.shape[1]
+            manifest["embedding_model"] = self.embedding_model
+
+            removed = self._merge_small_segments(manifest) if len(manifest["segments"]) > settings.FAISS_MAX_SEGMENTS else []
+            manifest["version"] += 1
+            self._write_manifest(manifest)
+
+        # Workers that still map a merged segment keep reading it until they refresh
+        for old_name in removed:
+            for suffix in SEGMENT_FILE_SUFFIXES:
+                try:
+                    os.unlink(os.path.join(self.folder, old_name + suffix))
+                except FileNotFoundError:
+                    pass
+
+        self.refresh(force=True)
+        logger.debug("Published segment %s (%d documents)", name, len(documents))
+
+    def _merge_small_segments(self, manifest: Dict[str, Any]) -> List[str]:
+        """Merge the smaller half of the segments into one, returning the merged segment names"""
+        entries = sorted(manifest["segments"], key=lambda entry: entry["count"])
+        merging = entries[:max(2, len(entries) // 2)]
+        segments = [_Segment(self.folder, entry) for entry in merging]
+
+        vectors = np.concatenate([np.asarray(segment.vectors) for segment in segments])
+        # Docstores are concatenated as raw bytes, shifting each segment's offsets
+        docs = b"".join(segment.docs[:] for segment in segments)
+        offsets, base = [np.zeros(1, dtype=np.int64)], 0
+        for segment in segments:
+            offsets.append(np.asarray(segment.offsets[1:]) + base)
+            base += int(segment.offsets[-1])
+
+        name = f"seg-{manifest['version'] + 1:08d}-{uuid.uuid4().hex[:8]}-merged"
+        _write_segment(self.folder, name, vectors, docs, np.concatenate(offsets))
+        merged_names = {entry["name"] for entry in merging}
+        manifest["segments"] = [entry for entry in manifest["segments"] if entry["name"] not in merged_names] + [{
+            "name": name,
+            "count": len(vectors),
+            "user_ids": sorted(set().union(*(entry.get("user_ids", []) for entry in merging)))
+        }]
+        logger.info("Merged %d FAISS segments (%d vectors) into %s", len(merging), len(vectors), name)
+        return list(merged_names)
+
+    def similarity_search(self, query: str, k: int = 4, user_id: Optional[str] = None,
+                          filters: Optional[Dict[str, Any]] = None):
+        """Search for similar documents"""
+        self.refresh()
+        if not self._segments:
+            logger.debug("Shared FAISS index is empty, returning no results")
+            return []
+
+        try:
+            with track_stage(QUERY_EMBEDDING_SECONDS):
+                query_embedding = self.embeddings.embed_query(query)
+        except Exception as e:
+            logger.error("Error embedding query: %s", e)
+            return []
+
+        return self.similarity_search_by_vector(query_embedding, k=k, user_id=user_id, filters=filters)
+
+    def similarity_search_by_vector(self, query_embedding: List[float], k: int = 4, user_id: Optional[str] = None,
+                                    filters: Optional[Dict[str, Any]] = None):
+        """Search for documents similar to an already computed query embedding
+
+        filters: extra equality filters on metadata fields, e.g. {"document_id": "..."}
+        """
+        self.refresh()
+        self._check_space(*self._space, len(query_embedding))
+        segments = self._segments
+        if user_id:
+            # Segments record their users, so other users' segments are skipped outright
+            segments = [segment for segment in segments if user_id in segment.user_ids]
+        if not segments:
+            return []
+
+        filter_dict = dict(filters or {})
+        if user_id:
+            filter_dict["user_id"] = user_id
+        fetch_k = max(k, FILTER_FETCH_K) if filter_dict else k
+
+        try:
+            with track_stage(VECTOR_SEARCH_SECONDS, backend="faiss"):
+                query = np.asarray(query_embedding, dtype=np.float32)
+                candidates = []
+                for segment in segments:
+                    distances, rows = segment.search(query, fetch_k)
+                    candidates.extend((float(distance), segment, int(row)) for distance, row in zip(distances, rows))
+                candidates.sort(key=lambda candidate: candidate[0])
+
+                docs = []
+                for _, segment, row in candidates:
+                    doc = segment.document(row)
+                    if all(doc.metadata.get(field) == value for field, value in filter_dict.items()):
+                        docs.append(doc)
+                        if len(docs) == k:
+                            break
+
+            logger.debug("Found %d similar documents", len(docs))
+            return docs
+        except Exception:
+            logger.exception("Error in similarity_search_by_vector")
+            return []  # Return empty list on error
+
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """Mapped segment sizes - file-backed pages shared by every worker, not per-process memory"""
+        self.refresh()
+        segments = self._segments
+        sizes = [segment.file_bytes() for segment in segments]
+        return {
+            "shared": True,
+            "segments": len(segments),
+            "manifest_version": self._version,
+            "embedding_model": self._space[0],
+            "index_vectors": sum(len(segment) for segment in segments),
+            "index_dimensions": segments[0].vectors.shape[1] if segments else 0,
+            "quantization": settings.VECTOR_QUANTIZATION,
+            "mapped_index_bytes": sum(size["vectors"] for size in sizes),
+            "mapped_code_bytes": sum(size["codes"] for size in sizes),
+            "mapped_docstore_bytes": sum(size["docstore"] for size in sizes)
+        }
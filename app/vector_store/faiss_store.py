@@ -1,22 +1,42 @@
 # app/vector_store/faiss_store.py
+import json
 import os
 import pickle
+import threading
 import uuid
 from typing import List, Dict, Any, Optional
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
 from ..config import settings
+from .embeddings import get_embeddings, embedding_model_name, embedding_dimensions
+from ..logging_config import get_logger
+from ..metrics import (
+    track_stage,
+    QUERY_EMBEDDING_SECONDS,
+    VECTOR_SEARCH_SECONDS,
+    EMBEDDING_BATCH_SECONDS,
+    EMBEDDING_BATCH_SIZE,
+)
+
+logger = get_logger(__name__)
+
+# Written next to a saved index: the embedding model and size of its vectors
+EMBEDDING_INFO_FILE = "embedding.json"
 
 class FAISSVectorStore:
     """FAISS-backed vector store for document retrieval"""
     
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
+    def __init__(self, embeddings=None):
+        # embeddings can be injected (benchmarks, local stand-ins); default to OpenAI
+        self.embeddings = embeddings or get_embeddings()
+        # The index holds a single vector space: one model at one size
+        self.embedding_model = embedding_model_name(self.embeddings)
+        self.embedding_dimensions = embedding_dimensions(self.embeddings)
         self._vector_store = None
+        self._write_lock = threading.Lock()  # Concurrent ingestion batches must not interleave index updates
         self._initialize_store()
-        print("Initialized FAISS vector store")
+        logger.info("Initialized FAISS vector store")
         
     def _initialize_store(self):
         """Initialize an empty FAISS vector store"""
@@ -32,92 +52,159 @@ class FAISSVectorStore:
     def add_documents(self, documents: List[Document], user_id: Optional[str] = None):
         """Add documents to the FAISS vector store"""
         if not documents:
-            print("No documents to add")
             return
-            
-        print(f"Adding {len(documents)} documents to FAISS store")
-        print(f"User ID: {user_id}")
+        
+        logger.debug("Adding %d documents to FAISS store (user_id=%s)", len(documents), user_id)
         
         # Add user_id to metadata if provided
         if user_id:
-            for i, doc in enumerate(documents):
+            for doc in documents:
                 if not doc.metadata:
                     doc.metadata = {}
                 doc.metadata["user_id"] = user_id
-                print(f"Added user_id to document {i+1} metadata")
         
-        # If this is the first addition, create the store
-        # FIXED: Check docstore.dict instead of using len()
-        if self._vector_store.index is None or not self._vector_store.docstore._dict:
-            print("Creating new FAISS index")
-            self._vector_store = FAISS.from_documents(documents, self.embeddings)
-            print("Created new FAISS index")
-        else:
-            # Add documents to existing store
-            print("Adding to existing FAISS index")
-            self._vector_store.add_documents(documents)
+        # Embed explicitly so the batch can be timed separately from indexing
+        texts = [doc.page_content for doc in documents]
+        EMBEDDING_BATCH_SIZE.labels(backend="faiss").observe(len(texts))
+        with track_stage(EMBEDDING_BATCH_SECONDS, backend="faiss"):
+            text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
+        self._check_dimensions(len(text_embeddings[0][1]))
+        metadatas = [doc.metadata for doc in documents]
+        
+        with self._write_lock:
+            # If this is the first addition, create the store
+            # FIXED: Check docstore.dict instead of using len()
+            if self._vector_store.index is None or not self._vector_store.docstore._dict:
+                self._vector_store = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas)
+            else:
+                # Add documents to existing store
+                self._vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
         
-        # Better way to report the size of the index
-        print(f"FAISS index now contains {len(self._vector_store.docstore._dict)} documents")
+        logger.debug("FAISS index now contains %d documents", len(self._vector_store.docstore._dict))
     
-    def similarity_search(self, query: str, k: int = 4, user_id: Optional[str] = None):
+    def similarity_search(self, query: str, k: int = 4, user_id: Optional[str] = None,
+                          filters: Optional[Dict[str, Any]] = None):
         """Search for similar documents"""
-        print(f"Searching FAISS for: '{query}' (k={k}, user_id={user_id})")
+        logger.debug("Searching FAISS (k=%d, user_id=%s)", k, user_id)
+        
+        # If the index is empty, return empty results
+        if self._vector_store.index is None or len(self._vector_store.docstore._dict) == 0:
+            logger.debug("FAISS index is empty, returning no results")
+            return []
+        
+        try:
+            with track_stage(QUERY_EMBEDDING_SECONDS):
+                query_embedding = self.embeddings.embed_query(query)
+        except Exception as e:
+            logger.error("Error embedding query: %s", e)
+            return []
+        
+        return self.similarity_search_by_vector(query_embedding, k=k, user_id=user_id, filters=filters)
+    
+    def similarity_search_by_vector(self, query_embedding: List[float], k: int = 4, user_id: Optional[str] = None,
+                                    filters: Optional[Dict[str, Any]] = None):
+        """Search for documents similar to an already computed query embedding
         
+        filters: extra equality filters on metadata fields, e.g. {"document_id": "..."}
+        """
         # If the index is empty, return empty results
         if self._vector_store.index is None or len(self._vector_store.docstore._dict) == 0:
-            print("FAISS index is empty, returning no results")
+            logger.debug("FAISS index is empty, returning no results")
             return []
+        self._check_dimensions(len(query_embedding))
         
         # Perform search
         try:
-            if user_id:
-                # Filter by user_id
-                filter_dict = {"user_id": user_id}
-                try:
-                    docs = self._vector_store.similarity_search(
-                        query, k=k, filter=filter_dict
-                    )
-                except Exception as e:
-                    print(f"Error in FAISS search with filter: {str(e)}")
-                    # Fall back to unfiltered search
-                    docs = self._vector_store.similarity_search(query, k=k)
-                    # Manually filter results
-                    docs = [doc for doc in docs if doc.metadata.get("user_id") == user_id][:k]
-            else:
-                # No filter
-                docs = self._vector_store.similarity_search(query, k=k)
-            
-            print(f"Found {len(docs)} similar documents")
-            # Debug: Log the first document content to verify retrieval is working
-            if docs:
-                print(f"First document excerpt: {docs[0].page_content[:100]}...")
+            with track_stage(VECTOR_SEARCH_SECONDS, backend="faiss"):
+                docs = self._search(query_embedding, k, filters, user_id)
             
+            logger.debug("Found %d similar documents", len(docs))
             return docs
-        except Exception as e:
-            print(f"Error in similarity_search: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+        except Exception:
+            logger.exception("Error in similarity_search_by_vector")
             return []  # Return empty list on error
     
+    def _search(self, query_embedding: List[float], k: int, filters: Optional[Dict[str, Any]] = None,
+                user_id: Optional[str] = None) -> List[Document]:
+        """Run the FAISS search with metadata filters, falling back to manual filtering"""
+        filter_dict = dict(filters or {})
+        if user_id:
+            filter_dict["user_id"] = user_id
+        
+        if filter_dict:
+            # Filter by user_id and metadata
+            try:
+                docs = self._vector_store.similarity_search_by_vector(
+                    query_embedding, k=k, filter=filter_dict
+                )
+            except Exception as e:
+                logger.warning("Error in FAISS search with filter, filtering manually: %s", e)
+                # Fall back to unfiltered search
+                docs = self._vector_store.similarity_search_by_vector(query_embedding, k=k)
+                # Manually filter results
+                docs = [
+                    doc for doc in docs
+                    if all(doc.metadata.get(field) == value for field, value in filter_dict.items())
+                ][:k]
+        else:
+            # No filter
+            docs = self._vector_store.similarity_search_by_vector(query_embedding, k=k)
+        return docs
+    
+    def _check_dimensions(self, dimensions: int):
+        """Refuse vectors whose size differs from the index's (learning it for unknown models)"""
+        if self.embedding_dimensions is None:
+            self.embedding_dimensions = dimensions
+        elif dimensions != self.embedding_dimensions:
+            raise ValueError(
+                f"Got {dimensions}-dimension vectors, but this {self.embedding_model} index has "
+                f"{self.embedding_dimensions} dimensions"
+            )
+    
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """Approximate memory held by the FAISS index and docstore"""
+        from ..profiling import deep_sizeof
+        
+        index = self._vector_store.index
+        docstore = getattr(self._vector_store.docstore, "_dict", {})
+        return {
+            "index_vectors": index.ntotal if index is not None else 0,
+            "index_dimensions": index.d if index is not None else 0,
+            # Flat indexes store float32 vectors
+            "index_bytes": index.ntotal * index.d * 4 if index is not None else 0,
+            "docstore_documents": len(docstore),
+            "docstore_bytes": deep_sizeof(docstore),
+            "id_map_bytes": deep_sizeof(self._vector_store.index_to_docstore_id)
+        }
+    
     def save_local(self, folder_path: str = "faiss_index"):
         """Save the FAISS index locally"""
         # Create folder if it doesn't exist
         os.makedirs(folder_path, exist_ok=True)
         
-        # Save the index
+        # Save the index, with the model that produced its vectors
         self._vector_store.save_local(folder_path)
-        print(f"FAISS index saved to {folder_path}")
+        with open(os.path.join(folder_path, EMBEDDING_INFO_FILE), "w") as info_file:
+            json.dump({"embedding_model": self.embedding_model, "dimensions": self.embedding_dimensions}, info_file)
+        logger.info("FAISS index saved to %s", folder_path)
     
     def load_local(self, folder_path: str = "faiss_index"):
         """Load the FAISS index from disk"""
         try:
-            self._vector_store = FAISS.load_local(folder_path, self.embeddings, allow_dangerous_deserialization=True)
-            print(f"FAISS index loaded from {folder_path}")
+            info_path = os.path.join(folder_path, EMBEDDING_INFO_FILE)
+            if os.path.exists(info_path):
+                with open(info_path) as info_file:
+                    info = json.load(info_file)
+                if info.get("embedding_model") != self.embedding_model:
+                    raise ValueError(f"index was built with {info.get('embedding_model')}, not {self.embedding_model}")
+            vector_store = FAISS.load_local(folder_path, self.embeddings, allow_dangerous_deserialization=True)
+            if vector_store.index is not None:
+                self._check_dimensions(vector_store.index.d)
+            self._vector_store = vector_store
             docstore_size = len(self._vector_store.docstore._dict) if hasattr(self._vector_store.docstore, '_dict') else 0
-            print(f"Index contains {docstore_size} documents")
+            logger.info("FAISS index loaded from %s (%d documents)", folder_path, docstore_size)
         except Exception as e:
-            print(f"Error loading FAISS index: {str(e)}")
+            logger.error("Error loading FAISS index: %s", e)
             # Initialize a new one
             self._initialize_store()
 
@@ -126,8 +213,12 @@ _vector_store = None
 
 # Factory function
 def get_vector_store():
-    """Get FAISS vector store singleton"""
+    """Get FAISS vector store singleton (shared across workers when FAISS_SHARED_DIR is set)"""
     global _vector_store
     if _vector_store is None:
-        _vector_store = FAISSVectorStore()
-    return _vector_store
\ No newline at end of file
+        if settings.FAISS_SHARED_DIR:
+            from .faiss_shared import SharedFAISSVectorStore
+            _vector_store = SharedFAISSVectorStore()
+        else:
+            _vector_store = FAISSVectorStore()
+    return _vector_store
@@ -0,0 +1,353 @@
+# app/vector_store/migration.py
+"""
+Online re-embedding of the MongoDB vectors collection with another embedding model.
+
+Every canonical chunk holds its serving vector in one slot (see VECTOR_SLOTS). A migration
+embeds each chunk with the target model into the other slot, in throttled batches, while
+searches keep reading the serving slot and chunks added meanwhile are embedded into both.
+A sample of searches is also run in the target space (dual read), and the overlap of the two
+top-k lists is recorded, so the new model can be judged before it takes over.
+
+Once every chunk has a target vector, one update of the state document makes the target the
+serving space for every worker; the retired slot is cleared afterwards. The state document
+also holds the progress and a lease: one worker runs the job, and if it dies another resumes
+after EMBEDDING_MIGRATION_LEASE_SECONDS. Batches select chunks still lacking a target vector,
+so a resumed job never redoes work.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import track_stage, requests_in_flight, EMBEDDING_BATCH_SECONDS
+from .embeddings import get_embeddings, embedding_dimensions, embedding_space
+from .mongodb_store import (
+    MIGRATION_STATE_ID,
+    VECTOR_SLOTS,
+    ensure_vector_search_index,
+    model_path,
+    slot_fields,
+    space_filter,
+    vector_fields,
+    vector_index_name,
+)
+
+logger = get_logger(__name__)
+
+# Statuses a worker runs the job for
+JOB_STATUSES = ("running", "cleaning", "cancelling")
+# While a migration is in one of these, another cannot start
+OPEN_STATUSES = (*JOB_STATUSES, "paused")
+
+# Clearing a slot is a cheap $unset, so it goes in larger batches than embedding
+CLEAR_BATCH_FACTOR = 10
+
+def pending_filter(migration: Dict[str, Any]) -> Dict[str, Any]:
+    """Chunks of the source space without a vector of the target space yet"""
+    target = migration["target"]
+    return {
+        **space_filter(migration["source"]),
+        "$or": [
+            {model_path(target["slot"]): {"$ne": target["model"]}},
+            {f"{target['slot']}_dimensions": {"$ne": target["dimensions"]}}
+        ]
+    }
+
+class EmbeddingMigration:
+    """Starts, runs and reports on the re-embedding of a MongoDBVectorStore's collection"""
+
+    def __init__(self, store):
+        self.store = store
+        self.state_collection = store.state_collection
+        # Lease holder: unique per process, since several uvicorn workers share a host
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, model: str, dimensions: Optional[int] = None, embeddings=None) -> Dict[str, Any]:
+        """Begin re-embedding every chunk with `model` (injected `embeddings` stand in for it in this process)"""
+        if embeddings is None:
+            embeddings = get_embeddings(model, dimensions)
+        dimensions = dimensions or embedding_dimensions(embeddings)
+        if dimensions is None:
+            dimensions = len(embeddings.embed_query("dimension probe"))
+
+        state = self.state_collection.find_one({"_id": MIGRATION_STATE_ID})
+        source = state["active"] if state else self.store.space
+        if (model, dimensions) == (source["model"], source["dimensions"]):
+            raise ValueError(f"The collection is already embedded with {embedding_space(model, dimensions)}")
+        target = {
+            "slot": next(slot for slot in VECTOR_SLOTS if slot != source["slot"]),
+            "model": model,
+            "dimensions": dimensions
+        }
+        self.store._embeddings[embedding_space(model, dimensions)] = embeddings
+
+        if self.store._is_atlas_available() and settings.ATLAS_CREATE_SEARCH_INDEX:
+            ensure_vector_search_index(self.store.collection, num_dimensions=dimensions, slot=target["slot"])
+
+        now = datetime.now()
+        migration = {
+            "id": uuid.uuid4().hex,
+            "status": "running",
+            "source": {key: source[key] for key in ("slot", "model", "dimensions")},
+            "target": target,
+            "total": self.store.collection.count_documents(space_filter(source)),
+            "migrated": 0,
+            "cleared": 0,
+            "chunks_per_second": 0.0,
+            "shadow_reads": 0,
+            "shadow_overlap": 0.0,
+            "started_at": now,
+            "updated_at": now,
+            "switched_at": None,
+            "finished_at": None,
+            "error": None,
+            "lease_owner": None,
+            "lease_expires": now
+        }
+        try:
+            # Matches unless a migration is open; the upsert then collides on _id instead of starting a second one
+            self.state_collection.update_one(
+                {"_id": MIGRATION_STATE_ID, "migration.status": {"$nin": list(OPEN_STATUSES)}},
+                {"$set": {"migration": migration}, "$setOnInsert": {"active": dict(self.store.space)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            raise RuntimeError("Another embedding migration is in progress")
+
+        logger.info("Started embedding migration %s: %s -> %s (%d chunks)", migration["id"],
+                    embedding_space(source["model"], source["dimensions"]), embedding_space(model, dimensions),
+                    migration["total"])
+        self.store._refresh_space(force=True)
+        return self.status()
+
+    def pause(self) -> Dict[str, Any]:
+        return self._set_status(("running",), "paused")
+
+    def resume(self) -> Dict[str, Any]:
+        return self._set_status(("paused", "failed"), "running")
+
+    def cancel(self) -> Dict[str, Any]:
+        """Stop before the switch and clear the target slot (searches never left the source space)"""
+        return self._set_status(("running", "paused", "failed"), "cancelling")
+
+    def _set_status(self, current, status: str) -> Dict[str, Any]:
+        now = datetime.now()
+        result = self.state_collection.update_one(
+            {"_id": MIGRATION_STATE_ID, "migration.status": {"$in": list(current)}},
+            # Expiring the lease lets any worker pick the job up again
+            {"$set": {
+                "migration.status": status,
+                "migration.error": None,
+                "migration.updated_at": now,
+                "migration.lease_expires": now
+            }}
+        )
+        if not result.matched_count:
+            raise RuntimeError(f"No embedding migration that is {' or '.join(current)}")
+        self.store._refresh_space(force=True)
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        """Serving space and the current (or last) migration with its progress"""
+        # Also revives a job whose worker died, should no search have done so yet
+        self.store._refresh_space(force=True)
+        state = self.state_collection.find_one({"_id": MIGRATION_STATE_ID}) or {}
+        active = state.get("active") or self.store.space
+        report = {
+            "active": {**active, "space": embedding_space(active["model"], active["dimensions"])},
+            "migration": None
+        }
+        migration = state.get("migration")
+        if migration is None:
+            return report
+
+        progress = {key: value for key, value in migration.items() if key != "lease_expires"}
+        remaining = 0
+        if migration["status"] in ("running", "paused", "failed"):
+            remaining = self.store.collection.count_documents(pending_filter(migration))
+        done = migration["migrated"]
+        progress["remaining"] = remaining
+        progress["progress"] = round(done / (done + remaining), 4) if done + remaining else 1.0
+        rate = migration.get("chunks_per_second") or 0
+        progress["eta_seconds"] = round(remaining / rate) if migration["status"] == "running" and rate else None
+        reads = migration.get("shadow_reads") or 0
+        progress["shadow_overlap"] = round(migration["shadow_overlap"] / reads, 4) if reads else None
+        report["migration"] = progress
+        return report
+
+    def record_shadow_read(self, migration_id: str, overlap: float):
+        """Add one dual read's top-k overlap (0-1) to the migration's running average"""
+        self.state_collection.update_one(
+            {"_id": MIGRATION_STATE_ID, "migration.id": migration_id},
+            {"$inc": {"migration.shadow_reads": 1, "migration.shadow_overlap": overlap}}
+        )
+
+    def resume_if_abandoned(self, migration: Optional[Dict[str, Any]]):
+        """Run the job in this worker if it needs running and nobody holds its lease"""
+        if not migration or migration["status"] not in JOB_STATUSES:
+            return
+        if migration.get("lease_owner") != self.owner and migration["lease_expires"] > datetime.now():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self.run, name="embedding-migration", daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Work through the migration while this worker holds its lease"""
+        migration = None
+        try:
+            while True:
+                migration = self._renew_lease()
+                if migration is None:
+                    return
+                status = migration["status"]
+                if status == "running":
+                    if not self._embed_batch(migration):
+                        self._switch(migration)
+                elif status == "cleaning":
+                    # Workers that have not seen the switch yet may still write to the old slot
+                    grace = timedelta(seconds=2 * settings.EMBEDDING_SPACE_REFRESH_SECONDS)
+                    if datetime.now() < migration["switched_at"] + grace:
+                        time.sleep(1)
+                    elif not self._embed_batch(migration) and not self._clear_batch(migration, migration["source"]["slot"]):
+                        self._finish(migration, "completed")
+                elif not self._clear_batch(migration, migration["target"]["slot"]):
+                    self._finish(migration, "cancelled")
+        except Exception as e:
+            logger.exception("Embedding migration failed")
+            if migration is not None:
+                self._update(migration, {"status": "failed", "error": str(e), "lease_expires": datetime.now()})
+
+    def _renew_lease(self) -> Optional[Dict[str, Any]]:
+        """Take or extend the lease, returning the migration (None when there is nothing for this worker to do)"""
+        now = datetime.now()
+        result = self.state_collection.update_one(
+            {
+                "_id": MIGRATION_STATE_ID,
+                "migration.status": {"$in": list(JOB_STATUSES)},
+                "$or": [{"migration.lease_owner": self.owner}, {"migration.lease_expires": {"$lt": now}}]
+            },
+            {"$set": {
+                "migration.lease_owner": self.owner,
+                "migration.lease_expires": now + timedelta(seconds=settings.EMBEDDING_MIGRATION_LEASE_SECONDS)
+            }}
+        )
+        if not result.matched_count:
+            return None
+        return self.state_collection.find_one({"_id": MIGRATION_STATE_ID})["migration"]
+
+    def _wait_for_capacity(self):
+        """Hold back while this worker is busy serving requests
+
+        Gives way for at most half a lease, so the job keeps its lease and still finishes under constant load.
+        """
+        waited = 0.0
+        while (requests_in_flight() > settings.EMBEDDING_MIGRATION_MAX_IN_FLIGHT
+               and waited < settings.EMBEDDING_MIGRATION_LEASE_SECONDS / 2):
+            time.sleep(0.5)
+            waited += 0.5
+
+    def _embed_batch(self, migration: Dict[str, Any]) -> bool:
+        """Embed one batch of pending chunks into the target slot; False when none are left"""
+        started = time.monotonic()
+        self._wait_for_capacity()
+        target = migration["target"]
+        batch = list(
+            self.store.collection.find(pending_filter(migration), {"text": 1})
+            .limit(settings.EMBEDDING_MIGRATION_BATCH_SIZE)
+        )
+        if not batch:
+            return False
+
+        with track_stage(EMBEDDING_BATCH_SECONDS, backend="mongodb_migration"):
+            vectors = self.store.embeddings_for(target).embed_documents([doc["text"] for doc in batch])
+        if any(len(vector) != target["dimensions"] for vector in vectors):
+            raise ValueError(f"{target['model']} returned vectors of other than {target['dimensions']} dimensions")
+        # Chunks deleted since the read are not recreated (no upsert)
+        self.store.collection.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": vector_fields(vector, target["model"], target["slot"])})
+            for doc, vector in zip(batch, vectors)
+        ], ordered=False)
+
+        # Hold the job to EMBEDDING_MIGRATION_CHUNKS_PER_SECOND
+        if settings.EMBEDDING_MIGRATION_CHUNKS_PER_SECOND > 0:
+            time.sleep(max(0.0, len(batch) / settings.EMBEDDING_MIGRATION_CHUNKS_PER_SECOND - (time.monotonic() - started)))
+        rate = len(batch) / max(time.monotonic() - started, 1e-6)
+        previous = migration.get("chunks_per_second") or rate
+        self._update(migration, {"chunks_per_second": round(0.7 * previous + 0.3 * rate, 2)},
+                     increments={"migrated": len(batch)})
+        logger.debug("Embedded %d chunks for migration %s", len(batch), migration["id"])
+        return True
+
+    def _clear_batch(self, migration: Dict[str, Any], slot: str) -> bool:
+        """Remove one batch of vectors from a slot nobody reads; False when the slot is empty"""
+        self._wait_for_capacity()
+        batch = [
+            doc["_id"] for doc in self.store.collection.find({slot: {"$exists": True}}, {"_id": 1})
+            .limit(settings.EMBEDDING_MIGRATION_BATCH_SIZE * CLEAR_BATCH_FACTOR)
+        ]
+        if not batch:
+            return False
+        self.store.collection.update_many(
+            {"_id": {"$in": batch}}, {"$unset": {field: "" for field in slot_fields(slot)}}
+        )
+        self._update(migration, {}, increments={"cleared": len(batch)})
+        return True
+
+    def _switch(self, migration: Dict[str, Any]):
+        """Make the target the serving space for every worker, in one update"""
+        target = migration["target"]
+        if self.store._is_atlas_available() and not self._index_queryable(target["slot"]):
+            logger.info("Waiting for the Atlas index %s before switching", vector_index_name(target["slot"]))
+            time.sleep(5)
+            return
+        now = datetime.now()
+        result = self.state_collection.update_one(
+            {
+                "_id": MIGRATION_STATE_ID,
+                "migration.id": migration["id"],
+                "migration.status": "running",
+                "migration.lease_owner": self.owner
+            },
+            {"$set": {
+                "active.slot": target["slot"],
+                "active.model": target["model"],
+                "active.dimensions": target["dimensions"],
+                "migration.status": "cleaning",
+                "migration.switched_at": now,
+                "migration.updated_at": now
+            }}
+        )
+        if result.matched_count:
+            logger.info("Embedding migration %s switched searches to %s", migration["id"],
+                        embedding_space(target["model"], target["dimensions"]))
+            self.store._refresh_space(force=True)
+
+    def _index_queryable(self, slot: str) -> bool:
+        for index in self.store.collection.list_search_indexes(vector_index_name(slot)):
+            return bool(index.get("queryable"))
+        return False
+
+    def _finish(self, migration: Dict[str, Any], status: str):
+        now = datetime.now()
+        self._update(migration, {"status": status, "finished_at": now, "lease_expires": now})
+        logger.info("Embedding migration %s %s", migration["id"], status)
+        self.store._refresh_space(force=True)
+
+    def _update(self, migration: Dict[str, Any], fields: Dict[str, Any], increments: Optional[Dict[str, int]] = None):
+        update = {"$set": {f"migration.{key}": value for key, value in {**fields, "updated_at": datetime.now()}.items()}}
+        if increments:
+            update["$inc"] = {f"migration.{key}": value for key, value in increments.items()}
+        self.state_collection.update_one({"_id": MIGRATION_STATE_ID, "migration.id": migration["id"]}, update)
@@ -1,66 +1,364 @@
 # app/vector_store/mongodb_store.py
+import hashlib
 import os
+import random
+import threading
+import time
 import uuid
-from typing import List, Dict, Any, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 import numpy as np
 from datetime import datetime
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
-from pymongo import MongoClient
+from bson import Binary
+from pymongo import MongoClient, UpdateOne, ReplaceOne
 from pymongo.errors import DuplicateKeyError
+from pymongo.operations import SearchIndexModel
 
 from ..config import settings
+from .embeddings import (
+    get_embeddings,
+    configured_dimensions,
+    embedding_model_name,
+    embedding_dimensions,
+    embedding_space,
+    MODEL_DIMENSIONS,
+)
+from .quantization import quantize_int8, pack_bits, int8_dot, hamming_distances, smallest, candidate_count
 from ..db.mongodb import get_database
+from ..logging_config import get_logger
+from ..metrics import (
+    track_stage,
+    QUERY_EMBEDDING_SECONDS,
+    VECTOR_SEARCH_SECONDS,
+    EMBEDDING_BATCH_SECONDS,
+    EMBEDDING_BATCH_SIZE,
+)
+
+logger = get_logger(__name__)
+
+# Id of the stats document holding the collection-wide vector count
+TOTAL_STATS_ID = "__total__"
+
+# Id of the document (EMBEDDING_MIGRATIONS_COLLECTION) holding the serving space and the current migration
+MIGRATION_STATE_ID = "vectors"
+
+# Shadow reads run one at a time off the request path; searches arriving meanwhile skip them
+_shadow_read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-read")
+_shadow_read_slot = threading.Semaphore(1)
+
+# Metadata fields indexed as Atlas $vectorSearch filters - only these can be pre-filtered
+ATLAS_FILTER_FIELDS = ["user_id", "document_id", "source", "type"]
+
+# Each chunk holds its serving vector in one slot; a re-embedding migration fills the other one
+# (slot fields: <slot>, <slot>_model, <slot>_dimensions and the screening codes)
+VECTOR_SLOTS = ("embedding", "shadow_embedding")
+
+# Canonical chunks list the values all their references give these fields (multikey arrays), so a
+# filter matches a shared chunk whichever user / document it came from; other filters use the chunk's metadata
+REFERENCE_FILTER_PATHS = {
+    "user_id": "user_ids",
+    "document_id": "document_ids",
+    "source": "sources",
+    "type": "types",
+    "title": "titles"
+}
+
+# Fields chunk references hold at the top level; the rest of their metadata is under "metadata"
+REFERENCE_FIELDS = ("user_id", "document_id")
+
+# Metadata kept on the canonical chunk (from its first reference) - everything else is per reference
+CANONICAL_METADATA_FIELDS = ("source", "type", "title")
+
+def filter_path(field: str) -> str:
+    """Document path a metadata filter field is matched against on canonical chunks"""
+    return REFERENCE_FILTER_PATHS.get(field, f"metadata.{field}")
+
+def reference_path(field: str) -> str:
+    """Document path a metadata filter field is matched against on chunk references"""
+    return field if field in REFERENCE_FIELDS else f"metadata.{field}"
+
+def reference_value(ref: Dict[str, Any], field: str):
+    return ref.get(field) if field in REFERENCE_FIELDS else (ref.get("metadata") or {}).get(field)
+
+# Suffix of the field holding a slot's screening code, by VECTOR_QUANTIZATION mode
+QUANTIZED_SUFFIXES = {"int8": "int8", "binary": "bits"}
+SLOT_SUFFIXES = ("", "_model", "_dimensions", "_int8", "_scale", "_bits")
+WINNER_PROJECTION = {
+    f"{slot}{suffix}": 0 for slot in VECTOR_SLOTS for suffix in ("", "_int8", "_scale", "_bits")
+}
+
+def model_path(slot: str) -> str:
+    """Chunk field naming the model behind a slot's vector; always filtered on, so models never mix in a search"""
+    return f"{slot}_model"
+
+def quantized_field(slot: str, mode: str) -> str:
+    return f"{slot}_{QUANTIZED_SUFFIXES[mode]}"
+
+def slot_fields(slot: str) -> List[str]:
+    """Every field a slot occupies on a chunk"""
+    return [f"{slot}{suffix}" for suffix in SLOT_SUFFIXES]
+
+def quantized_fields(embedding: List[float], mode: str, slot: str = VECTOR_SLOTS[0]) -> Dict[str, Any]:
+    """Screening code fields for a chunk (int8 codes are of the unit vector, so they rank by cosine)"""
+    if mode not in QUANTIZED_SUFFIXES:
+        return {}
+    vector = np.asarray(embedding, dtype=np.float32)
+    if mode == "binary":
+        return {f"{slot}_bits": Binary(pack_bits(vector)[0].tobytes())}
+    norm = np.linalg.norm(vector)
+    codes, scales = quantize_int8(vector / norm if norm else vector)
+    return {f"{slot}_int8": Binary(codes[0].tobytes()), f"{slot}_scale": float(scales[0])}
+
+def vector_fields(embedding: List[float], model: str, slot: str = VECTOR_SLOTS[0]) -> Dict[str, Any]:
+    """A chunk's fields for one slot: the vector, the model and size that produced it, and its screening code"""
+    return {
+        slot: embedding,  # Store as list for MongoDB
+        model_path(slot): model,
+        f"{slot}_dimensions": len(embedding),
+        **quantized_fields(embedding, settings.VECTOR_QUANTIZATION, slot)
+    }
+
+def space_filter(space: Dict[str, Any]) -> Dict[str, Any]:
+    """Only chunks holding a vector of the space's model and size in the space's slot"""
+    slot, dimensions = space["slot"], space["dimensions"]
+    conditions = {model_path(slot): space["model"]}
+    if dimensions is not None:
+        if dimensions == MODEL_DIMENSIONS.get(space["model"]):
+            # Chunks stored before sizes were recorded are the model's native size
+            conditions[f"{slot}_dimensions"] = {"$in": [dimensions, None]}
+        else:
+            conditions[f"{slot}_dimensions"] = dimensions
+    return conditions
+
+def vector_index_name(slot: str) -> str:
+    """Atlas vector search index over a slot"""
+    if slot == VECTOR_SLOTS[0]:
+        return settings.ATLAS_VECTOR_INDEX_NAME
+    return f"{settings.ATLAS_VECTOR_INDEX_NAME}_{slot}"
+
+def chunk_id(text: str, space: str) -> str:
+    """Content address of a chunk: the same text embedded in the same vector space (see embedding_space) is stored once"""
+    return hashlib.sha256(f"{space}\n{text}".encode("utf-8")).hexdigest()
+
+def vector_search_index_definition(num_dimensions: Optional[int] = None,
+                                   slot: str = VECTOR_SLOTS[0]) -> Dict[str, Any]:
+    """Atlas Vector Search index definition for a slot of the vectors collection"""
+    num_dimensions = num_dimensions or configured_dimensions()
+    return {
+        "fields": [
+            {
+                "type": "vector",
+                "path": slot,
+                "numDimensions": num_dimensions,
+                "similarity": "cosine"
+            },
+            *[{"type": "filter", "path": filter_path(field)} for field in ATLAS_FILTER_FIELDS],
+            # Both slots' models, so a search can be limited to chunks a migration has reached
+            *[{"type": "filter", "path": model_path(each)} for each in VECTOR_SLOTS]
+        ]
+    }
+
+def validate_vector_search_index(index_info: Dict[str, Any], expected: Dict[str, Any]) -> List[str]:
+    """Compare an existing search index against the expected definition, returning the problems found"""
+    problems = []
+    if index_info.get("type") not in (None, "vectorSearch"):
+        problems.append(f"index type is {index_info.get('type')}, expected vectorSearch")
+    
+    definition = index_info.get("latestDefinition") or index_info.get("definition") or {}
+    current_fields = {(field.get("type"), field.get("path")): field for field in definition.get("fields", [])}
+    for field in expected["fields"]:
+        current = current_fields.get((field["type"], field["path"]))
+        if current is None:
+            problems.append(f"missing {field['type']} field {field['path']}")
+        elif field["type"] == "vector":
+            for key in ("numDimensions", "similarity"):
+                if current.get(key) != field[key]:
+                    problems.append(f"{field['path']} {key} is {current.get(key)}, expected {field[key]}")
+    
+    return problems
+
+def ensure_vector_search_index(collection, index_name: Optional[str] = None,
+                               num_dimensions: Optional[int] = None, slot: str = VECTOR_SLOTS[0]) -> Dict[str, Any]:
+    """Create the Atlas vector search index if missing, or update it if its definition drifted"""
+    index_name = index_name or vector_index_name(slot)
+    expected = vector_search_index_definition(num_dimensions, slot)
+    
+    existing = {idx["name"]: idx for idx in collection.list_search_indexes()}
+    if index_name not in existing:
+        logger.info("Creating Atlas vector search index %s", index_name)
+        collection.create_search_index(SearchIndexModel(definition=expected, name=index_name, type="vectorSearch"))
+        return {"name": index_name, "status": "created", "problems": []}
+    
+    problems = validate_vector_search_index(existing[index_name], expected)
+    if problems:
+        logger.warning("Atlas vector search index %s does not match the expected definition: %s", index_name, problems)
+        collection.update_search_index(index_name, expected)
+        return {"name": index_name, "status": "updated", "problems": problems}
+    
+    logger.info("Atlas vector search index %s is valid (queryable: %s)", index_name, existing[index_name].get("queryable"))
+    return {
+        "name": index_name,
+        "status": existing[index_name].get("status", "unknown"),
+        "queryable": existing[index_name].get("queryable"),
+        "problems": []
+    }
 
 class MongoDBVectorStore:
-    """MongoDB-backed vector store for document retrieval"""
+    """MongoDB-backed vector store for document retrieval
+    
+    Chunks are content-addressed: the vectors collection holds one canonical record (text +
+    embedding) per unique chunk, listing the users and documents that reference it, and
+    CHUNK_REFS_COLLECTION holds a small reference per (document, chunk position) with the
+    uploader's metadata. Re-uploading a shared handout costs references, not embeddings.
+    
+    The serving vector space (slot, model, size) comes from the migration state document once
+    an embedding migration has run, so every worker switches when a migration completes.
+    """
     
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        self.db = get_database()
+    def __init__(self, embeddings=None, db=None):
+        # embeddings / db can be injected (benchmarks, local stand-ins); default to OpenAI and the configured database
+        embeddings = embeddings or get_embeddings()
+        model, dimensions = embedding_model_name(embeddings), embedding_dimensions(embeddings)
+        # Every chunk records the model and size that produced it; searches only compare like with like.
+        # Replaced as a whole (never mutated), so a search reads one consistent space.
+        self.space = {
+            "slot": VECTOR_SLOTS[0],
+            "model": model,
+            "dimensions": dimensions,
+            "id_space": embedding_space(model, dimensions)
+        }
+        self._embeddings = {embedding_space(model, dimensions): embeddings}
+        self.db = db if db is not None else get_database()
         self.collection = self.db.vectors
+        self.refs_collection = self.db[settings.CHUNK_REFS_COLLECTION]
+        self.stats_collection = self.db[settings.VECTOR_STATS_COLLECTION]
+        self.state_collection = self.db[settings.EMBEDDING_MIGRATIONS_COLLECTION]
+        self._stats_cache = None
+        self._stats_cache_time = 0.0
+        self._migration = None  # Running migration, whose target space new chunks are embedded into as well
+        self._space_checked = 0.0
+        from .migration import EmbeddingMigration
+        self.embedding_migration = EmbeddingMigration(self)
+        self._refresh_space(force=True)
+        if (model, dimensions) != (self.embedding_model, self.embedding_dimensions):
+            logger.warning("Configured for %s, but an embedding migration switched the collection to %s - "
+                           "update EMBEDDING_MODEL / EMBEDDING_DIMENSIONS to match",
+                           embedding_space(model, dimensions), self.embedding_space)
         self._initialize_collection()
-        print("Initialized MongoDB vector store")
+        self._start_legacy_migration()
+        self._start_filter_backfill()
+        self._start_code_backfill()
+        logger.info("Initialized MongoDB vector store")
         
     def _initialize_collection(self):
         """Initialize the vectors collection with proper indexes"""
         try:
             # Create indexes for better performance
-            # Text search index for metadata
-            self.collection.create_index([("metadata.user_id", 1)])
-            self.collection.create_index([("metadata.document_id", 1)])
+            # Visibility of canonical chunks (multikey)
+            self.collection.create_index([("user_ids", 1)])
+            self.collection.create_index([("document_ids", 1)])
             self.collection.create_index([("created_at", -1)])
             
-            # For MongoDB Atlas, you would create a vector search index here
+            # Chunk references: by document (ordered), by user, and chunk -> referencing users
+            self.refs_collection.create_index([("document_id", 1), ("metadata.chunk_index", 1)])
+            self.refs_collection.create_index([("user_id", 1), ("document_id", 1)])
+            self.refs_collection.create_index([("chunk_id", 1), ("user_id", 1)])
+            self.stats_collection.create_index([("kind", 1), ("count", -1)])
             
-
             # For local MongoDB, we'll use cosine similarity calculation
-            print("✅ Vector collection indexes created")
+            logger.debug("Vector collection indexes created")
             
         except Exception as e:
-            print(f"⚠️ Warning: Could not create vector indexes: {e}")
+            logger.warning("Could not create vector indexes: %s", e)
+        
+        # For MongoDB Atlas, create and validate the vector search index
+        if self._is_atlas_available() and settings.ATLAS_CREATE_SEARCH_INDEX:
+            try:
+                ensure_vector_search_index(self.collection, num_dimensions=self.embedding_dimensions,
+                                           slot=self.space["slot"])
+            except Exception as e:
+                logger.warning("Could not ensure Atlas vector search index: %s", e)
+    
+    def _chunk_reference(self, chunk: str, doc: Document) -> Dict[str, Any]:
+        """Reference from a document position to a canonical chunk"""
+        document_id = doc.metadata.get("document_id")
+        chunk_index = doc.metadata.get("chunk_index")
+        # Deterministic ids make re-adding the same chunk of the same document idempotent
+        ref_id = f"{document_id}:{chunk_index}" if document_id is not None and chunk_index is not None else str(uuid.uuid4())
+        return {
+            "_id": ref_id,
+            "chunk_id": chunk,
+            "user_id": doc.metadata.get("user_id"),
+            "document_id": document_id,
+            "metadata": doc.metadata,
+            "created_at": datetime.now()
+        }
+    
+    def _canonical_chunk(self, doc: Document, embedding: List[float], embedding_model: str,
+                         slot: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "text": doc.page_content,
+            "metadata": {field: doc.metadata[field] for field in CANONICAL_METADATA_FIELDS if field in doc.metadata},
+            "created_at": datetime.now(),
+            "text_length": len(doc.page_content),
+            **vector_fields(embedding, embedding_model, slot or self.space["slot"])
+        }
+    
+    def _link_references(self, refs: List[Dict[str, Any]], new_chunks: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Store references and add their users / documents / filter values to the canonical chunks
+        
+        Returns the chunks that were expected to be stored but are gone (deleted by a concurrent
+        relink after the caller looked them up); their references need the chunk re-created.
+        """
+        self.refs_collection.bulk_write(
+            [ReplaceOne({"_id": ref["_id"]}, ref, upsert=True) for ref in refs], ordered=False
+        )
+        
+        values: Dict[str, Dict[str, list]] = {}
+        for ref in refs:
+            chunk_values = values.setdefault(ref["chunk_id"], {path: [] for path in REFERENCE_FILTER_PATHS.values()})
+            for field, path in REFERENCE_FILTER_PATHS.items():
+                value = reference_value(ref, field)
+                if value is not None and value not in chunk_values[path]:
+                    chunk_values[path].append(value)
+        
+        operations = []
+        for chunk, chunk_values in values.items():
+            update = {
+                "$addToSet": {path: {"$each": each} for path, each in chunk_values.items()},
+                # Tells a concurrent _relink_chunks that the chunk was linked after it looked
+                "$inc": {"link_version": 1}
+            }
+            if chunk in new_chunks:
+                # Upsert: a concurrent upload of the same chunk may have inserted it first
+                update["$setOnInsert"] = new_chunks[chunk]
+            operations.append(UpdateOne({"_id": chunk}, update, upsert=chunk in new_chunks))
+        self.collection.bulk_write(operations, ordered=False)
+        
+        linked = [chunk for chunk in values if chunk not in new_chunks]
+        if not linked:
+            return []
+        present = {doc["_id"] for doc in self.collection.find({"_id": {"$in": linked}}, {"_id": 1})}
+        return [chunk for chunk in linked if chunk not in present]
     
     def add_documents(self, documents: List[Document], user_id: Optional[str] = None):
-        """Add documents to the MongoDB vector store"""
-        if not documents:
-            print("No documents to add")
-            return
-            
-        print(f"Adding {len(documents)} documents to MongoDB vector store")
-        print(f"User ID: {user_id}")
+        """Add documents to the MongoDB vector store, embedding only chunks not stored yet"""
+        if documents:
+            self._add_chunks(documents, user_id)
+    
+    def _add_chunks(self, documents: List[Document], user_id: Optional[str] = None) -> int:
+        """Store references for the chunks, returning how many chunks had to be embedded"""
+        logger.debug("Adding %d documents to MongoDB vector store (user_id=%s)", len(documents), user_id)
         
         try:
-            # Generate embeddings for all documents
-            texts = [doc.page_content for doc in documents]
-            print(f"Generating embeddings for {len(texts)} documents...")
-            
-            # Get embeddings from OpenAI
-            embeddings_list = self.embeddings.embed_documents(texts)
-            print(f"✅ Generated {len(embeddings_list)} embeddings")
-            
-            # Prepare documents for insertion
-            vector_docs = []
-            for i, (doc, embedding) in enumerate(zip(documents, embeddings_list)):
+            # Writes always see the current space: a chunk embedded into a retired slot would be unsearchable
+            self._refresh_space(force=True)
+            space, migration = self.space, self._migration
+            refs = []
+            unique_chunks: Dict[str, Document] = {}
+            for doc in documents:
                 # Ensure metadata exists
                 if not doc.metadata:
                     doc.metadata = {}
@@ -69,80 +367,96 @@ class MongoDBVectorStore:
                 if user_id:
                     doc.metadata["user_id"] = user_id
                 
-                vector_doc = {
-                    "_id": str(uuid.uuid4()),
-                    "text": doc.page_content,
-                    "embedding": embedding,  # Store as list for MongoDB
-                    "metadata": doc.metadata,
-                    "created_at": datetime.now(),
-                    "embedding_model": "text-embedding-ada-002",  # Track which model was used
-                    "text_length": len(doc.page_content)
-                }
-                vector_docs.append(vector_doc)
-                
-                if i < 3 or i == len(documents) - 1:
-                    print(f"  Document {i+1}/{len(documents)} - Length: {len(doc.page_content)}, Metadata: {doc.metadata}")
+                chunk = chunk_id(doc.page_content, space["id_space"])
+                unique_chunks.setdefault(chunk, doc)
+                refs.append(self._chunk_reference(chunk, doc))
             
-            # Insert documents into MongoDB
-            result = self.collection.insert_many(vector_docs)
-            print(f"✅ Successfully inserted {len(result.inserted_ids)} vector documents")
+            # Only chunks no one has stored before need embedding
+            stored = {
+                doc["_id"] for doc in self.collection.find({"_id": {"$in": list(unique_chunks)}}, {"_id": 1})
+            }
+            missing = [chunk for chunk in unique_chunks if chunk not in stored]
             
-            # Log collection stats
-            total_docs = self.collection.count_documents({})
-            print(f"📊 Total vectors in collection: {total_docs}")
+            new_chunks, space = self._embed_chunks(missing, unique_chunks, space, migration)
+            vanished = self._link_references(refs, new_chunks)
+            if vanished:
+                # Their last references were deleted between the lookup and the linking
+                logger.debug("Re-creating %d chunks deleted while they were being linked", len(vanished))
+                recreated, space = self._embed_chunks(vanished, unique_chunks, space, migration)
+                self._link_references([ref for ref in refs if ref["chunk_id"] in recreated], recreated)
+                new_chunks.update(recreated)
+            logger.debug("Stored %d chunk references (%d new chunks, %d already stored)",
+                         len(refs), len(new_chunks), len(unique_chunks) - len(new_chunks))
             
-        except Exception as e:
-            import traceback
-            print(f"❌ Error adding documents to MongoDB vector store: {str(e)}")
-            print(f"❌ Traceback: {traceback.format_exc()}")
+            # Keep the stats documents in step with the collections
+            self._apply_stats_changes(Counter(ref["user_id"] for ref in refs), latest=datetime.now(),
+                                      total_change=len(new_chunks))
+            return len(new_chunks)
+            
+        except Exception:
+            logger.exception("Error adding documents to MongoDB vector store")
             raise
     
-    def similarity_search(self, query: str, k: int = 4, user_id: Optional[str] = None) -> List[Document]:
+    def _embed_chunks(self, chunks: List[str], unique_chunks: Dict[str, Document], space: Dict[str, Any],
+                      migration: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+        """Canonical records for chunks that are not stored, and the space they were embedded in"""
+        if not chunks:
+            return {}, space
+        texts = [unique_chunks[chunk].page_content for chunk in chunks]
+        # Get embeddings from OpenAI
+        EMBEDDING_BATCH_SIZE.labels(backend="mongodb").observe(len(texts))
+        with track_stage(EMBEDDING_BATCH_SECONDS, backend="mongodb"):
+            embeddings_list = self.embeddings_for(space).embed_documents(texts)
+        space = self._check_dimensions(len(embeddings_list[0]), space)
+        new_chunks = {
+            chunk: self._canonical_chunk(unique_chunks[chunk], embedding, space["model"], space["slot"])
+            for chunk, embedding in zip(chunks, embeddings_list)
+        }
+        if migration is not None:
+            self._add_target_vectors(new_chunks, texts, migration["target"])
+        return new_chunks, space
+    
+    def similarity_search(self, query: str, k: int = 4, user_id: Optional[str] = None,
+                          filters: Optional[Dict[str, Any]] = None) -> List[Document]:
         """Search for similar documents using MongoDB"""
-        print(f"Searching MongoDB for: '{query}' (k={k}, user_id={user_id})")
+        logger.debug("Searching MongoDB (k=%d, user_id=%s)", k, user_id)
+        self._refresh_space()
+        space, migration = self.space, self._migration
         
         try:
             # Generate embedding for the query
-            query_embedding = self.embeddings.embed_query(query)
-            print(f"✅ Generated query embedding")
-            
-            # Build MongoDB aggregation pipeline
-            pipeline = []
-            
-            # Match stage - filter by user_id if provided
-            match_stage = {}
-            if user_id:
-                match_stage["metadata.user_id"] = user_id
-            
-            if match_stage:
-                pipeline.append({"$match": match_stage})
-            
-            # Add vector similarity stage
-            # For MongoDB Atlas, you would use $vectorSearch here
-            # For local MongoDB, we'll use a custom similarity calculation
-            if self._is_atlas_available():
-                # MongoDB Atlas Vector Search
-                vector_search_stage = {
-                    "$vectorSearch": {
-                        "index": "vector_index",  # You need to create this in Atlas
-                        "path": "embedding",
-                        "queryVector": query_embedding,
-                        "numCandidates": k * 10,
-                        "limit": k
-                    }
-                }
-                pipeline.insert(0, vector_search_stage)  # Insert at beginning
-            else:
-                # Local MongoDB: Add all documents and calculate similarity in Python
-                print("Using local similarity calculation (not optimized for large datasets)")
+            with track_stage(QUERY_EMBEDDING_SECONDS):
+                query_embedding = self.embeddings_for(space).embed_query(query)
+        except Exception as e:
+            logger.error("Error embedding query: %s", e)
+            return []
+        
+        if migration is not None and random.random() < settings.EMBEDDING_MIGRATION_SHADOW_READ_RATE:
+            self._submit_shadow_read(query, query_embedding, k, user_id, filters, space, migration)
+        
+        return self.similarity_search_by_vector(query_embedding, k=k, user_id=user_id, filters=filters, space=space)
+    
+    def similarity_search_by_vector(self, query_embedding: List[float], k: int = 4, user_id: Optional[str] = None,
+                                    filters: Optional[Dict[str, Any]] = None,
+                                    space: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Search for documents similar to an already computed query embedding
+        
+        filters: extra equality filters on metadata fields, e.g. {"document_id": "..."}
+        space: the vector space the query was embedded in (default: the serving space)
+        """
+        if space is None:
+            self._refresh_space()
+            space = self.space
+        if space["dimensions"] is not None and len(query_embedding) != space["dimensions"]:
+            raise ValueError(
+                f"Query vector has {len(query_embedding)} dimensions; this store searches "
+                f"{embedding_space(space['model'], space['dimensions'])} vectors ({space['dimensions']} dimensions)"
+            )
+        try:
+            results = self._search_chunks(query_embedding, k, user_id, filters, space)
             
-            # Execute query
-            if self._is_atlas_available():
-                # Use MongoDB Atlas vector search
-                results = list(self.collection.aggregate(pipeline))
-            else:
-                # Fallback: Get all documents and calculate similarity locally
-                results = self._local_similarity_search(query_embedding, k, user_id)
+            # The searching user's own reference supplies document id, title, position, ...
+            references = self._user_references([result["_id"] for result in results], user_id, filters)
             
             # Convert results to LangChain Documents
             documents = []
@@ -153,25 +467,34 @@ class MongoDBVectorStore:
                 doc = Document(
                     page_content=result["text"],
                     metadata={
-                        **result["metadata"],
+                        **result.get("metadata", {}),
+                        **references.get(result["_id"], {}),
                         "similarity_score": score,
                         "_id": result["_id"]
                     }
                 )
                 documents.append(doc)
             
-            print(f"Found {len(documents)} similar documents")
-            if documents:
-                print(f"Top result preview: {documents[0].page_content[:100]}...")
-            
+            logger.debug("Found %d similar documents", len(documents))
             return documents
             
-        except Exception as e:
-            print(f"❌ Error in similarity_search: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+        except Exception:
+            logger.exception("Error in similarity_search_by_vector")
             return []
     
+    def _search_chunks(self, query_embedding: List[float], k: int, user_id: Optional[str],
+                       filters: Optional[Dict[str, Any]], space: Dict[str, Any],
+                       conditions: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Top k canonical chunks in a space (conditions: extra equality filters on chunk fields)"""
+        if self._is_atlas_available():
+            # MongoDB Atlas Vector Search - filters are applied inside $vectorSearch
+            pipeline = self._build_vector_search_pipeline(query_embedding, k, user_id, filters, space, conditions)
+            with track_stage(VECTOR_SEARCH_SECONDS, backend="atlas"):
+                return list(self.collection.aggregate(pipeline))
+        # Local MongoDB: calculate similarity in Python
+        with track_stage(VECTOR_SEARCH_SECONDS, backend="mongodb_local"):
+            return self._local_similarity_search(query_embedding, k, user_id, filters, space, conditions)
+    
     def _is_atlas_available(self) -> bool:
         """Check if we're using MongoDB Atlas with vector search capabilities"""
         try:
@@ -181,95 +504,662 @@ class MongoDBVectorStore:
         except:
             return False
     
-    def _local_similarity_search(self, query_embedding: List[float], k: int, user_id: Optional[str] = None) -> List[Dict]:
-        """Fallback similarity search for local MongoDB without vector search"""
-        # Build filter
-        filter_query = {}
+    @property
+    def embeddings(self):
+        """Embedding model of the serving space"""
+        return self.embeddings_for(self.space)
+    
+    @property
+    def embedding_model(self) -> str:
+        return self.space["model"]
+    
+    @property
+    def embedding_dimensions(self) -> Optional[int]:
+        return self.space["dimensions"]
+    
+    @property
+    def embedding_space(self) -> str:
+        return embedding_space(self.space["model"], self.space["dimensions"])
+    
+    def embeddings_for(self, space: Dict[str, Any]):
+        """Embedding model producing a space's vectors (created on first use unless injected)"""
+        name = embedding_space(space["model"], space["dimensions"])
+        embeddings = self._embeddings.get(name)
+        if embeddings is None:
+            embeddings = self._embeddings[name] = get_embeddings(space["model"], space["dimensions"])
+        return embeddings
+    
+    def _refresh_space(self, force: bool = False):
+        """Pick up a switched serving space or a started / finished migration, at most every EMBEDDING_SPACE_REFRESH_SECONDS"""
+        now = time.monotonic()
+        if not force and now - self._space_checked < settings.EMBEDDING_SPACE_REFRESH_SECONDS:
+            return
+        self._space_checked = now
+        try:
+            state = self.state_collection.find_one({"_id": MIGRATION_STATE_ID})
+        except Exception as e:
+            logger.warning("Could not read the embedding migration state: %s", e)
+            return
+        if state is None:
+            return
+        
+        active = state["active"]
+        if active != self.space:
+            if (active["model"], active["dimensions"]) != (self.space["model"], self.space["dimensions"]):
+                logger.info("Serving %s vectors (slot %s)", embedding_space(active["model"], active["dimensions"]),
+                            active["slot"])
+            self.space = active
+        
+        migration = state.get("migration")
+        self._migration = migration if migration and migration["status"] == "running" else None
+        self.embedding_migration.resume_if_abandoned(migration)
+    
+    def _check_dimensions(self, dimensions: int, space: Dict[str, Any]) -> Dict[str, Any]:
+        """Refuse vectors whose size differs from the space's model (learning it for unknown models)"""
+        if space["dimensions"] is None:
+            space = {**space, "dimensions": dimensions}
+            if self.space["model"] == space["model"] and self.space["dimensions"] is None:
+                self.space = space
+        elif dimensions != space["dimensions"]:
+            raise ValueError(
+                f"Got {dimensions}-dimension vectors, but {space['model']} vectors here have "
+                f"{space['dimensions']} dimensions"
+            )
+        return space
+    
+    def _add_target_vectors(self, new_chunks: Dict[str, Dict[str, Any]], texts: List[str], target: Dict[str, Any]):
+        """Embed new chunks into a running migration's target slot too, so it never has to revisit them"""
+        try:
+            with track_stage(EMBEDDING_BATCH_SECONDS, backend="mongodb_migration"):
+                vectors = self.embeddings_for(target).embed_documents(texts)
+        except Exception as e:
+            # The migration picks up chunks without a target vector later
+            logger.warning("Could not embed new chunks for the %s migration: %s", target["model"], e)
+            return
+        for chunk, vector in zip(new_chunks, vectors):
+            new_chunks[chunk].update(vector_fields(vector, target["model"], target["slot"]))
+    
+    def _submit_shadow_read(self, query: str, query_embedding: List[float], k: int, user_id: Optional[str],
+                            filters: Optional[Dict[str, Any]], space: Dict[str, Any], migration: Dict[str, Any]):
+        """Compare a search against the migration's target space in the background (dropped when one is running)"""
+        if not _shadow_read_slot.acquire(blocking=False):
+            return
+        future = _shadow_read_executor.submit(
+            self._shadow_read, query, query_embedding, k, user_id, filters, space, migration
+        )
+        future.add_done_callback(lambda _: _shadow_read_slot.release())
+    
+    def _shadow_read(self, query: str, query_embedding: List[float], k: int, user_id: Optional[str],
+                     filters: Optional[Dict[str, Any]], space: Dict[str, Any], migration: Dict[str, Any]):
+        """Overlap of the top k in both spaces, among the chunks the migration has already embedded"""
+        target = migration["target"]
+        try:
+            target_embedding = self.embeddings_for(target).embed_query(query)
+            migrated = {model_path(target["slot"]): target["model"]}
+            served = self._search_chunks(query_embedding, k, user_id, filters, space, migrated)
+            shadow = self._search_chunks(target_embedding, k, user_id, filters, target)
+            if served or shadow:
+                overlap = len({doc["_id"] for doc in served} & {doc["_id"] for doc in shadow}) / max(len(served), len(shadow))
+                self.embedding_migration.record_shadow_read(migration["id"], overlap)
+        except Exception as e:
+            logger.debug("Shadow read failed: %s", e)
+    
+    def _metadata_filter(self, user_id: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Equality filters on metadata fields, keyed by canonical chunk path"""
+        conditions = {filter_path(field): value for field, value in (filters or {}).items()}
         if user_id:
-            filter_query["metadata.user_id"] = user_id
+            conditions[filter_path("user_id")] = user_id
+        return conditions
+    
+    def _user_references(self, chunk_ids: List[str], user_id: Optional[str],
+                         filters: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """Metadata of the user's reference to each chunk (first matching one if the user has several)"""
+        if not chunk_ids or not user_id:
+            return {}
+        ref_filter = {reference_path(field): value for field, value in (filters or {}).items()}
+        ref_filter.update({"chunk_id": {"$in": chunk_ids}, "user_id": user_id})
+        references = {}
+        for ref in self.refs_collection.find(ref_filter, {"chunk_id": 1, "metadata": 1}):
+            references.setdefault(ref["chunk_id"], ref.get("metadata", {}))
+        return references
+    
+    def _build_vector_search_pipeline(self, query_embedding: List[float], k: int, user_id: Optional[str] = None,
+                                      filters: Optional[Dict[str, Any]] = None,
+                                      space: Optional[Dict[str, Any]] = None,
+                                      extra_conditions: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Build the Atlas $vectorSearch pipeline with user and metadata pre-filtering"""
+        space = space or self.space
+        vector_search = {
+            "index": vector_index_name(space["slot"]),
+            "path": space["slot"],
+            "queryVector": query_embedding,
+            "numCandidates": max(k * settings.ATLAS_NUM_CANDIDATES_MULTIPLIER, k),
+            "limit": k
+        }
         
-        # Get all documents (not efficient for large datasets)
-        all_docs = list(self.collection.find(filter_query))
+        # Pre-filter inside $vectorSearch so Atlas returns the top k among the matching vectors
+        # (the index only holds vectors of its numDimensions, so the model is the only space filter needed)
+        conditions = {
+            **self._metadata_filter(user_id, filters),
+            **(extra_conditions or {}),
+            model_path(space["slot"]): space["model"]
+        }
+        indexed = {filter_path(field) for field in ATLAS_FILTER_FIELDS} | {model_path(slot) for slot in VECTOR_SLOTS}
+        unindexed = [path for path in conditions if path not in indexed]
+        if unindexed:
+            raise ValueError(f"Fields are not indexed as vector search filters: {unindexed}")
         
-        if not all_docs:
-            return []
+        if len(conditions) == 1:
+            path, value = next(iter(conditions.items()))
+            vector_search["filter"] = {path: {"$eq": value}}
+        elif conditions:
+            vector_search["filter"] = {"$and": [{path: {"$eq": value}} for path, value in conditions.items()]}
         
-        # Calculate cosine similarity
-        similarities = []
-        query_vector = np.array(query_embedding)
+        return [
+            {"$vectorSearch": vector_search},
+            {"$set": {"score": {"$meta": "vectorSearchScore"}}},
+            {"$unset": list(WINNER_PROJECTION)}
+        ]
+    
+    def _local_similarity_search(self, query_embedding: List[float], k: int, user_id: Optional[str] = None,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 space: Optional[Dict[str, Any]] = None,
+                                 extra_conditions: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Fallback similarity search for local MongoDB without vector search"""
+        space = space or self.space
+        # Build filter
+        filter_query = {**self._metadata_filter(user_id, filters), **(extra_conditions or {}), **space_filter(space)}
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        slot = space["slot"]
         
-        for doc in all_docs:
-            doc_vector = np.array(doc["embedding"])
-            
-            # Cosine similarity
-            dot_product = np.dot(query_vector, doc_vector)
-            norm_query = np.linalg.norm(query_vector)
-            norm_doc = np.linalg.norm(doc_vector)
-            
-            if norm_query == 0 or norm_doc == 0:
-                similarity = 0
-            else:
-                similarity = dot_product / (norm_query * norm_doc)
-            
-            similarities.append((doc, similarity))
+        # Phase 1: score ids and embeddings (or compact codes first, when quantization is on)
+        if settings.VECTOR_QUANTIZATION in QUANTIZED_SUFFIXES:
+            scores = self._quantized_scores(query_vector, k, filter_query, settings.VECTOR_QUANTIZATION, slot)
+        else:
+            scores = self._exact_scores(
+                list(self.collection.find(filter_query, {"_id": 1, slot: 1})), query_vector, k, slot
+            )
+        
+        if not scores:
+            return []
         
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        top_results = similarities[:k]
+        # Phase 2: fetch text and metadata for the winners only
+        winners = {
+            doc["_id"]: doc
+            for doc in self.collection.find({"_id": {"$in": list(scores)}}, WINNER_PROJECTION)
+        }
         
-        # Format results
+        # Format results in score order
         results = []
-        for doc, score in top_results:
-            doc["score"] = float(score)
+        for doc_id, score in scores.items():
+            doc = winners.get(doc_id)
+            if doc is None:  # Deleted between the two phases
+                continue
+            doc["score"] = score
             results.append(doc)
         
         return results
     
+    def _exact_scores(self, candidates: List[Dict[str, Any]], query_vector: np.ndarray, k: int,
+                      slot: str = VECTOR_SLOTS[0]) -> Dict[str, float]:
+        """Cosine similarity of the top k candidates, best first"""
+        if not candidates:
+            return {}
+        
+        # Calculate cosine similarity for all candidates at once
+        doc_vectors = np.asarray([doc[slot] for doc in candidates], dtype=np.float32)
+        
+        norms = np.linalg.norm(doc_vectors, axis=1) * np.linalg.norm(query_vector)
+        dot_products = doc_vectors @ query_vector
+        similarities = np.divide(dot_products, norms, out=np.zeros_like(dot_products), where=norms != 0)
+        
+        # Select top k without sorting every candidate
+        top_indices = smallest(-similarities, min(k, len(candidates)))
+        return {candidates[i]["_id"]: float(similarities[i]) for i in top_indices}
+    
+    def _quantized_scores(self, query_vector: np.ndarray, k: int, filter_query: Dict[str, Any],
+                          mode: str, slot: str = VECTOR_SLOTS[0]) -> Dict[str, float]:
+        """Screen every matching chunk by its compact code, then rescore the best candidates exactly"""
+        field = quantized_field(slot, mode)
+        projection = {"_id": 1, field: 1}
+        if mode == "int8":
+            projection[f"{slot}_scale"] = 1
+        docs = list(self.collection.find(filter_query, projection))
+        coded = [doc for doc in docs if field in doc]
+        # Chunks stored before quantization was enabled (or mid-backfill) are scored exactly
+        candidate_ids = [doc["_id"] for doc in docs if field not in doc]
+        
+        if coded:
+            count = candidate_count(mode, k)
+            codes = b"".join(bytes(doc[field]) for doc in coded)
+            if mode == "int8":
+                codes = np.frombuffer(codes, dtype=np.int8).reshape(len(coded), -1)
+                scales = np.asarray([doc[f"{slot}_scale"] for doc in coded], dtype=np.float32)
+                order = smallest(-int8_dot(codes, scales, query_vector), count)
+            else:
+                codes = np.frombuffer(codes, dtype=np.uint8).reshape(len(coded), -1)
+                order = smallest(hamming_distances(codes, pack_bits(query_vector)[0]), count)
+            candidate_ids.extend(coded[i]["_id"] for i in order)
+        
+        if not candidate_ids:
+            return {}
+        candidates = list(self.collection.find({"_id": {"$in": candidate_ids}}, {"_id": 1, slot: 1}))
+        return self._exact_scores(candidates, query_vector, k, slot)
+    
     def delete_by_user(self, user_id: str):
-        """Delete all vectors for a specific user"""
+        """Delete all chunk references for a specific user (and chunks no one references any more)"""
         try:
-            result = self.collection.delete_many({"metadata.user_id": user_id})
-            print(f"Deleted {result.deleted_count} vectors for user {user_id}")
-            return result.deleted_count
+            deleted = self._delete_references({"user_id": user_id})
+            logger.info("Deleted %d chunk references for user %s", deleted, user_id)
+            return deleted
         except Exception as e:
-            print(f"Error deleting vectors for user {user_id}: {str(e)}")
+            logger.error("Error deleting vectors for user %s: %s", user_id, e)
             raise
     
     def delete_by_document(self, document_id: str):
-        """Delete all vectors for a specific document"""
+        """Delete all chunk references for a specific document (and chunks no one references any more)"""
+        try:
+            deleted = self._delete_references({"document_id": document_id})
+            logger.info("Deleted %d chunk references for document %s", deleted, document_id)
+            return deleted
+        except Exception as e:
+            logger.error("Error deleting vectors for document %s: %s", document_id, e)
+            raise
+    
+    def delete_by_documents(self, document_ids: List[str]) -> int:
+        """Delete the chunk references of several documents (and chunks no one references any more)"""
+        deleted = self._delete_references({"document_id": {"$in": list(document_ids)}})
+        logger.info("Deleted %d chunk references for %d documents", deleted, len(document_ids))
+        return deleted
+    
+    def referenced_document_ids(self, batch_size: int = 500) -> Iterator[str]:
+        """Ids of the documents that have chunk references, streamed (distinct() is capped at 16 MB)"""
+        groups = self.refs_collection.aggregate(
+            [{"$group": {"_id": "$document_id"}}],
+            allowDiskUse=True,
+            batchSize=batch_size
+        )
+        return (group["_id"] for group in groups if group["_id"] is not None)
+    
+    def delete_unreferenced_chunks(self, after: Optional[str] = None, limit: int = 500) -> Tuple[int, Optional[str]]:
+        """Check one page of canonical chunks (in _id order, after `after`) and delete those without references
+        
+        References are written before their chunk and deleted before it is relinked, so a chunk
+        without any is left over from an interrupted delete. Returns the number deleted and the
+        `after` of the next page (None once the collection has been covered).
+        """
+        query = {"user_ids": {"$exists": True}}  # Legacy vector documents have no references yet
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        chunk_ids = [chunk["_id"] for chunk in self.collection.find(query, {"_id": 1}).sort("_id", 1).limit(limit)]
+        if not chunk_ids:
+            return 0, None
+        referenced = set(self.refs_collection.distinct("chunk_id", {"chunk_id": {"$in": chunk_ids}}))
+        orphaned = self._relink_chunks([chunk for chunk in chunk_ids if chunk not in referenced])
+        self._apply_stats_changes({}, total_change=-orphaned)
+        return orphaned, chunk_ids[-1] if len(chunk_ids) == limit else None
+    
+    def _delete_references(self, ref_filter: Dict[str, Any]) -> int:
+        """Delete references, then re-derive the users / documents of the chunks they pointed at"""
+        refs = list(self.refs_collection.find(ref_filter, {"chunk_id": 1, "user_id": 1}))
+        if not refs:
+            return 0
+        self.refs_collection.delete_many({"_id": {"$in": [ref["_id"] for ref in refs]}})
+        
+        orphaned = self._relink_chunks({ref["chunk_id"] for ref in refs})
+        self._apply_stats_changes(
+            {user: -count for user, count in Counter(ref.get("user_id") for ref in refs).items()},
+            total_change=-orphaned
+        )
+        return len(refs)
+    
+    def _relink_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """Re-derive the users / documents / filter values of chunks from their references, deleting unreferenced ones"""
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return 0
+        # Read before the references: an upload linking a chunk from now on bumps its link_version
+        versions = {
+            chunk["_id"]: chunk.get("link_version")
+            for chunk in self.collection.find({"_id": {"$in": chunk_ids}}, {"link_version": 1})
+        }
+        remaining = {
+            group["_id"]: group
+            for group in self.refs_collection.aggregate([
+                {"$match": {"chunk_id": {"$in": chunk_ids}}},
+                {"$group": {
+                    "_id": "$chunk_id",
+                    **{path: {"$addToSet": f"${reference_path(field)}"} for field, path in REFERENCE_FILTER_PATHS.items()}
+                }}
+            ])
+        }
+        
+        if remaining:
+            self.collection.bulk_write([
+                UpdateOne({"_id": chunk}, {"$set": {
+                    path: [value for value in group[path] if value is not None] for path in REFERENCE_FILTER_PATHS.values()
+                }})
+                for chunk, group in remaining.items()
+            ], ordered=False)
+        
+        # Only chunks nobody linked since the versions were read (None matches chunks never versioned);
+        # an upload that links after the delete finds its chunk gone and re-creates it
+        orphaned = [chunk for chunk in versions if chunk not in remaining]
+        if not orphaned:
+            return 0
+        return self.collection.delete_many(
+            {"$or": [{"_id": chunk, "link_version": versions[chunk]} for chunk in orphaned]}
+        ).deleted_count
+    
+    def replace_document_chunks(self, chunks_by_document: Dict[str, List[Document]],
+                                user_id: Optional[str] = None) -> Dict[str, int]:
+        """Make each document's references match a new set of chunks
+        
+        References whose position and content are unchanged are left alone; only chunks
+        not stored anywhere yet are embedded, and chunks no longer referenced are removed.
+        """
+        existing = {
+            ref["_id"]: ref
+            for ref in self.refs_collection.find(
+                {"document_id": {"$in": list(chunks_by_document)}}, {"chunk_id": 1, "user_id": 1}
+            )
+        }
+        
+        changed, written, kept = [], set(), 0
+        for document_id, chunks in chunks_by_document.items():
+            for doc in chunks:
+                if not doc.metadata:
+                    doc.metadata = {}
+                doc.metadata["document_id"] = document_id
+                ref_id = f"{document_id}:{doc.metadata.get('chunk_index')}"
+                previous = existing.pop(ref_id, None)
+                if previous is not None and previous["chunk_id"] == chunk_id(doc.page_content, self.space["id_space"]):
+                    kept += 1
+                    continue
+                changed.append(doc)
+                if previous is not None:
+                    written.add(ref_id)
+                    existing[ref_id] = previous
+        
+        embedded = self._add_chunks(changed, user_id) if changed else 0
+        
+        # Overwritten references were counted as new by _add_chunks; the rest of `existing` is gone
+        removed = [ref for ref_id, ref in existing.items() if ref_id not in written]
+        if removed:
+            self.refs_collection.delete_many({"_id": {"$in": [ref["_id"] for ref in removed]}})
+        orphaned = self._relink_chunks({ref["chunk_id"] for ref in existing.values()})
+        self._apply_stats_changes(
+            {user: -count for user, count in Counter(ref.get("user_id") for ref in existing.values()).items()},
+            total_change=-orphaned
+        )
+        
+        logger.debug("Replaced chunks of %d documents: %d kept, %d written (%d embedded), %d removed",
+                     len(chunks_by_document), kept, len(changed), embedded, len(removed))
+        return {"kept": kept, "written": len(changed), "embedded": embedded, "removed": len(removed)}
+    
+    def _apply_stats_changes(self, user_counts: Dict[Optional[str], int], latest: Optional[datetime] = None,
+                             total_change: int = 0):
+        """Apply per-user reference count deltas and the canonical chunk count delta to the stats documents"""
+        user_counts = {user: count for user, count in user_counts.items() if count}
+        if not user_counts and not total_change:
+            return
+        
         try:
-            result = self.collection.delete_many({"metadata.document_id": document_id})
-            print(f"Deleted {result.deleted_count} vectors for document {document_id}")
-            return result.deleted_count
+            operations = [UpdateOne(
+                {"_id": TOTAL_STATS_ID},
+                {"$inc": {"total_documents": total_change, "total_references": sum(user_counts.values())}},
+                upsert=True
+            )]
+            for user, count in user_counts.items():
+                update = {"$inc": {"count": count}, "$setOnInsert": {"kind": "user", "user_id": user}}
+                if latest is not None:
+                    update["$max"] = {"latest": latest}
+                operations.append(UpdateOne({"_id": f"user:{user}"}, update, upsert=True))
+            
+            self.stats_collection.bulk_write(operations, ordered=False)
+            self._stats_cache = None
         except Exception as e:
-            print(f"Error deleting vectors for document {document_id}: {str(e)}")
+            logger.warning("Could not update vector store stats: %s", e)
+    
+    def rebuild_stats(self) -> Dict[str, Any]:
+        """Recompute the stats documents with a full scan of the chunk references"""
+        logger.info("Rebuilding vector store stats from the chunk references")
+        user_groups = list(self.refs_collection.aggregate([
+            {"$group": {
+                "_id": "$user_id",
+                "count": {"$sum": 1},
+                "latest": {"$max": "$created_at"}
+            }}
+        ]))
+        
+        # Replace each document in place rather than clearing the collection: other workers may be
+        # rebuilding or applying $inc deltas at the same time, and must never find __total__ missing
+        stats = [
+            {
+                "_id": TOTAL_STATS_ID,
+                "total_documents": self.collection.count_documents({}),
+                "total_references": sum(group["count"] for group in user_groups)
+            },
+            *[
+                {
+                    "_id": f"user:{group['_id']}",
+                    "kind": "user",
+                    "user_id": group["_id"],
+                    "count": group["count"],
+                    "latest": group["latest"]
+                }
+                for group in user_groups
+            ]
+        ]
+        self.stats_collection.bulk_write(
+            [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in stats],
+            ordered=False
+        )
+        # Users left without references
+        self.stats_collection.delete_many({"kind": "user", "_id": {"$nin": [document["_id"] for document in stats]}})
+        self._stats_cache = None
+        return self.get_stats()
+    
+    def _start_filter_backfill(self):
+        """Add the per-reference filter values to chunks linked before they were kept, in the background"""
+        try:
+            if self.collection.find_one(
+                {"user_ids": {"$exists": True}, "sources": {"$exists": False}}, {"_id": 1}
+            ) is None:
+                return
+        except Exception as e:
+            logger.warning("Could not check for chunks without reference filter values: %s", e)
+            return
+        logger.info("Chunks without reference filter values found - relinking them")
+        threading.Thread(target=self.backfill_reference_filters, name="vector-filter-backfill", daemon=True).start()
+    
+    def backfill_reference_filters(self, batch_size: int = 500) -> Dict[str, int]:
+        """Relink every chunk from its references, in _id order (idempotent)
+        
+        A full pass rather than only chunks missing the arrays: an upload sharing an old chunk adds
+        its own values before the backfill gets there, and the chunk needs the other references' too.
+        """
+        relinked = orphaned = 0
+        after = None
+        while True:
+            query = {"user_ids": {"$exists": True}}
+            if after is not None:
+                query["_id"] = {"$gt": after}
+            chunk_ids = [chunk["_id"] for chunk in self.collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+            if not chunk_ids:
+                break
+            count = self._relink_chunks(chunk_ids)
+            self._apply_stats_changes({}, total_change=-count)
+            relinked += len(chunk_ids) - count
+            orphaned += count
+            after = chunk_ids[-1]
+            logger.debug("Relinked %d chunks so far", relinked)
+        logger.info("Relinked %d chunks (%d without references removed)", relinked, orphaned)
+        return {"relinked": relinked, "orphaned": orphaned}
+    
+    def _start_code_backfill(self):
+        """Add screening codes for VECTOR_QUANTIZATION to chunks stored without them, in the background"""
+        if settings.VECTOR_QUANTIZATION not in QUANTIZED_SUFFIXES:
+            return
+        slot = self.space["slot"]
+        try:
+            if self.collection.find_one(
+                {slot: {"$exists": True}, quantized_field(slot, settings.VECTOR_QUANTIZATION): {"$exists": False}},
+                {"_id": 1}
+            ) is None:
+                return
+        except Exception as e:
+            logger.warning("Could not check for chunks without %s codes: %s", settings.VECTOR_QUANTIZATION, e)
+            return
+        logger.info("Chunks without %s codes found - backfilling them", settings.VECTOR_QUANTIZATION)
+        threading.Thread(target=self.backfill_quantized_codes, name="vector-code-backfill", daemon=True).start()
+    
+    def backfill_quantized_codes(self, batch_size: int = 500) -> Dict[str, int]:
+        """Compute screening codes from the stored embeddings of chunks that have none (idempotent)"""
+        mode = settings.VECTOR_QUANTIZATION
+        if mode not in QUANTIZED_SUFFIXES:
+            return {"coded": 0}
+        coded = 0
+        while True:
+            # A migration may switch slots midway; the next pass of the loop follows it
+            slot = self.space["slot"]
+            batch = list(self.collection.find(
+                {slot: {"$exists": True}, quantized_field(slot, mode): {"$exists": False}}, {slot: 1}
+            ).limit(batch_size))
+            if not batch:
+                break
+            self.collection.bulk_write([
+                UpdateOne({"_id": doc["_id"], slot: {"$exists": True}}, {"$set": quantized_fields(doc[slot], mode, slot)})
+                for doc in batch
+            ], ordered=False)
+            coded += len(batch)
+            logger.debug("Added %s codes to %d chunks so far", mode, coded)
+        if coded:
+            logger.info("Added %s codes to %d chunks", mode, coded)
+        return {"coded": coded}
+    
+    def _start_legacy_migration(self):
+        """Convert per-user vector documents from before content addressing, in the background"""
+        try:
+            if self.collection.find_one({"user_ids": {"$exists": False}}, {"_id": 1}) is None:
+                return
+        except Exception as e:
+            logger.warning("Could not check for legacy vectors: %s", e)
+            return
+        logger.warning("Legacy per-user vectors found - migrating them to content-addressed chunks")
+        threading.Thread(target=self.migrate_legacy_vectors, name="vector-migration", daemon=True).start()
+    
+    def migrate_legacy_vectors(self, batch_size: int = 500) -> Dict[str, int]:
+        """Fold legacy vector documents into canonical chunks + references, reusing their embeddings
+        
+        Idempotent, so several workers running it at once (or a restart midway) is harmless.
+        """
+        migrated = 0
+        try:
+            while True:
+                legacy = list(self.collection.find({"user_ids": {"$exists": False}}).limit(batch_size))
+                if not legacy:
+                    break
+                
+                refs, new_chunks = [], {}
+                for vector_doc in legacy:
+                    doc = Document(page_content=vector_doc["text"], metadata=vector_doc.get("metadata") or {})
+                    model = vector_doc.get("embedding_model") or self.embedding_model
+                    chunk = chunk_id(doc.page_content, embedding_space(model, len(vector_doc["embedding"])))
+                    new_chunks.setdefault(chunk, self._canonical_chunk(doc, vector_doc["embedding"], model))
+                    ref = self._chunk_reference(chunk, doc)
+                    if ref["document_id"] is None or doc.metadata.get("chunk_index") is None:
+                        ref["_id"] = vector_doc["_id"]
+                    refs.append(ref)
+                
+                self._link_references(refs, new_chunks)
+                self.collection.delete_many({"_id": {"$in": [vector_doc["_id"] for vector_doc in legacy]}})
+                migrated += len(legacy)
+                logger.info("Migrated %d legacy vectors so far", migrated)
+        except Exception:
+            logger.exception("Legacy vector migration stopped after %d vectors", migrated)
             raise
+        finally:
+            if migrated:
+                self.rebuild_stats()
+        return {"migrated": migrated}
+    
+    def get_document_chunks(self, document_id: str, user_id: Optional[str] = None) -> List[Document]:
+        """Chunks of a document in order, with the document's own metadata"""
+        ref_filter = {"document_id": document_id}
+        if user_id:
+            ref_filter["user_id"] = user_id
+        refs = list(self.refs_collection.find(ref_filter).sort("metadata.chunk_index", 1))
+        texts = {
+            chunk["_id"]: chunk["text"]
+            for chunk in self.collection.find({"_id": {"$in": list({ref["chunk_id"] for ref in refs})}}, {"text": 1})
+        }
+        return [
+            Document(page_content=texts[ref["chunk_id"]], metadata=ref.get("metadata", {}))
+            for ref in refs if ref["chunk_id"] in texts
+        ]
+    
+    def get_user_stats(self, user_id: str) -> Dict[str, Any]:
+        """Chunk counts for a user, broken down by document"""
+        doc_breakdown = list(self.refs_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {
+                "_id": "$document_id",
+                "chunk_count": {"$sum": 1},
+                "latest_created": {"$max": "$created_at"}
+            }},
+            {"$sort": {"latest_created": -1}}
+        ]))
+        return {
+            "user_id": user_id,
+            "total_chunks": sum(group["chunk_count"] for group in doc_breakdown),
+            "unique_documents": len(doc_breakdown),
+            "document_breakdown": doc_breakdown
+        }
+    
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """Approximate in-process memory held by the store (vectors themselves live in MongoDB)"""
+        from ..profiling import deep_sizeof
+        return {"stats_cache_bytes": deep_sizeof(self._stats_cache) if self._stats_cache else 0}
     
     def get_stats(self) -> Dict[str, Any]:
-        """Get statistics about the vector store"""
+        """Get statistics about the vector store
+        
+        Served from the stats documents, cached in-process for VECTOR_STATS_CACHE_TTL seconds.
+        """
+        now = time.monotonic()
+        if self._stats_cache is not None and now - self._stats_cache_time < settings.VECTOR_STATS_CACHE_TTL:
+            return dict(self._stats_cache)
+        
         try:
-            total_docs = self.collection.count_documents({})
+            total = self.stats_collection.find_one({"_id": TOTAL_STATS_ID})
+            if total is None:
+                # First run against an existing collection - seed the stats once
+                return self.rebuild_stats()
             
             # Get user statistics
-            user_stats = list(self.collection.aggregate([
-                {"$group": {
-                    "_id": "$metadata.user_id",
-                    "count": {"$sum": 1},
-                    "latest": {"$max": "$created_at"}
-                }},
-                {"$sort": {"count": -1}},
-                {"$limit": 10}
-            ]))
+            user_stats = [
+                {"_id": user["user_id"], "count": user["count"], "latest": user.get("latest")}
+                for user in self.stats_collection.find({"kind": "user", "count": {"$gt": 0}})
+                .sort("count", -1)
+                .limit(10)
+            ]
             
-            return {
-                "total_documents": total_docs,
+            self._stats_cache = {
+                "total_documents": total.get("total_documents", 0),
+                "total_references": total.get("total_references", 0),
                 "user_statistics": user_stats,
                 "collection_name": self.collection.name,
-                "is_atlas": self._is_atlas_available()
+                "is_atlas": self._is_atlas_available(),
+                "embedding_model": self.embedding_model,
+                "embedding_dimensions": self.embedding_dimensions,
+                "embedding_slot": self.space["slot"]
             }
+            self._stats_cache_time = now
+            return dict(self._stats_cache)
             
         except Exception as e:
-            print(f"Error getting vector store stats: {str(e)}")
+            logger.error("Error getting vector store stats: %s", e)
             return {"error": str(e)}
 
 # Singleton instance
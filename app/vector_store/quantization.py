@@ -0,0 +1,73 @@
+# app/vector_store/quantization.py
+"""
+Compact vector codes for screening local searches.
+
+int8: each vector scaled by its largest absolute component into [-127, 127] (4x smaller).
+binary: one sign bit per dimension, compared by Hamming distance (32x smaller).
+
+Codes only pick a candidate set (k * QUANTIZATION_CANDIDATES, or k *
+BINARY_QUANTIZATION_CANDIDATES for sign bits); the candidates are rescored exactly
+against the full-precision vectors, which stay on disk / in MongoDB.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from ..config import settings
+
+# Rows scored per step, so screening never materializes a float copy of every code
+SCREEN_BLOCK_ROWS = 8192
+
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def candidate_count(mode: str, k: int) -> int:
+    """How many screened candidates are rescored at full precision for a top-k search"""
+    multiplier = settings.BINARY_QUANTIZATION_CANDIDATES if mode == "binary" else settings.QUANTIZATION_CANDIDATES
+    return max(k * multiplier, k)
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 codes and per-vector scales (vector ~= code * scale)"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def pack_bits(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits of each vector, packed eight dimensions per byte"""
+    return np.packbits(np.atleast_2d(np.asarray(vectors)) > 0, axis=1)
+
+def int8_dot(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Approximate dot products of the quantized vectors with a float query"""
+    query = np.asarray(query, dtype=np.float32)
+    out = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCREEN_BLOCK_ROWS):
+        block = slice(start, start + SCREEN_BLOCK_ROWS)
+        out[block] = (codes[block].astype(np.float32) @ query) * scales[block]
+    return out
+
+def hamming_distances(bits: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Hamming distance from each packed code to the packed query"""
+    out = np.empty(len(bits), dtype=np.int32)
+    for start in range(0, len(bits), SCREEN_BLOCK_ROWS):
+        block = slice(start, start + SCREEN_BLOCK_ROWS)
+        out[block] = _POPCOUNT[np.bitwise_xor(bits[block], query_bits)].sum(axis=1, dtype=np.int32)
+    return out
+
+def smallest(values: np.ndarray, count: int) -> np.ndarray:
+    """Indices of the `count` smallest values, in ascending order"""
+    if count <= 0 or len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    if count < len(values):
+        indices = np.argpartition(values, count - 1)[:count]
+    else:
+        indices = np.arange(len(values))
+    return indices[np.argsort(values[indices], kind="stable")]
+
+def code_bytes(mode: str, count: int, dimensions: int) -> int:
+    """Bytes needed to screen `count` vectors of `dimensions` in a mode"""
+    if mode == "int8":
+        return count * (dimensions + 4)
+    if mode == "binary":
+        return count * ((dimensions + 7) // 8)
+    return count * dimensions * 4
@@ -0,0 +1,6 @@
+# benchmarks/__init__.py
+"""
+Offline micro-benchmarks for the retrieval and ingestion hot paths.
+
+Run with: python -m benchmarks --output bench.json
+"""
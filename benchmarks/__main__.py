@@ -0,0 +1,106 @@
+# benchmarks/__main__.py
+"""
+Command line entry point for the offline benchmark suite.
+
+    python -m benchmarks --sizes 500 2000 --output bench.json
+    python -m benchmarks --compare bench.json --threshold 1.25
+"""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from app.config import settings
+from .suite import BENCHMARKS, run_benchmarks
+
+RECALL_TOLERANCE = 0.02
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+def compare_results(results, baseline_path: str, threshold: float) -> bool:
+    """Print p50 ratios against a baseline run, returning False if any benchmark regressed"""
+    with open(baseline_path) as baseline_file:
+        baseline = {
+            (entry["benchmark"], entry["size"]): entry
+            for entry in json.load(baseline_file)["results"]
+        }
+
+    ok = True
+    print(f"\n📊 Comparison against {baseline_path} (threshold {threshold:.2f}x)")
+    for entry in results:
+        previous = baseline.get((entry["benchmark"], entry["size"]))
+        if previous is None or not previous["p50_ms"]:
+            print(f"   {entry['benchmark']} (size={entry['size']}): no baseline")
+            continue
+
+        ratio = entry["p50_ms"] / previous["p50_ms"]
+        regressed = ratio > threshold
+        # Quantized searches also regress by losing recall
+        if "recall_at_k" in entry and "recall_at_k" in previous:
+            regressed = regressed or entry["recall_at_k"] < previous["recall_at_k"] - RECALL_TOLERANCE
+        ok = ok and not regressed
+        marker = "❌ REGRESSION" if regressed else "✅"
+        recall = (f", recall {previous['recall_at_k']:.3f} -> {entry['recall_at_k']:.3f}"
+                  if "recall_at_k" in entry and "recall_at_k" in previous else "")
+        print(f"   {marker} {entry['benchmark']} (size={entry['size']}): "
+              f"{previous['p50_ms']:.3f} -> {entry['p50_ms']:.3f} ms ({ratio:.2f}x){recall}")
+    return ok
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline retrieval and ingestion benchmarks")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[500, 2000, 5000],
+                        help="Corpus sizes in chunks")
+    parser.add_argument("--dims", type=int, default=1536, help="Embedding dimensions")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per repetition for search benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="p50 slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    # Keep store / engine info logs out of the timing output
+    logging.getLogger("app").setLevel(logging.WARNING)
+    results = run_benchmarks(args.benchmarks, args.sizes, args.dims, args.queries, args.repeat)
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "dims": args.dims,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+            "similarity_search_k": settings.SIMILARITY_SEARCH_K,
+            "quantization_candidates": settings.QUANTIZATION_CANDIDATES,
+            "binary_quantization_candidates": settings.BINARY_QUANTIZATION_CANDIDATES,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare and not compare_results(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+# benchmarks/fakes.py
+"""
+Offline stand-ins for the benchmark suite: a deterministic embedding model and an
+in-memory MongoDB database implementing the subset of pymongo the vector store uses.
+"""
+import copy
+import re
+import zlib
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words embeddings - texts sharing words get similar vectors"""
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+        self.model = f"fake-hashing-{dimensions}"
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            token_hash = zlib.crc32(token.encode("utf-8"))
+            vector[token_hash % self.dimensions] += 1.0 if token_hash & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        return self._embed(text)
+
+def _copy(value):
+    """Copy a stored value - flat lists (embeddings) are sliced instead of deep-copied"""
+    if isinstance(value, list) and not any(isinstance(item, (dict, list)) for item in value[:1]):
+        return value[:]
+    return copy.deepcopy(value)
+
+def _get_path(doc: Dict[str, Any], path: str):
+    """Resolve a dotted field path, returning None when missing"""
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _set_path(doc: Dict[str, Any], path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def _unset_path(doc: Dict[str, Any], path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+def _values(doc: Dict[str, Any], path: str) -> list:
+    """Candidate values for matching - array fields match on any element"""
+    value = _get_path(doc, path)
+    return list(value) + [value] if isinstance(value, list) else [value]
+
+def _matches_condition(doc: Dict[str, Any], path: str, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        values = _values(doc, path)
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                ok = operand in values
+            elif operator == "$ne":
+                ok = operand not in values
+            elif operator == "$in":
+                ok = any(value in operand for value in values)
+            elif operator == "$nin":
+                ok = not any(value in operand for value in values)
+            elif operator == "$exists":
+                ok = (_get_path(doc, path) is not None) == bool(operand)
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                compare = {
+                    "$gt": lambda a, b: a > b,
+                    "$gte": lambda a, b: a >= b,
+                    "$lt": lambda a, b: a < b,
+                    "$lte": lambda a, b: a <= b,
+                }[operator]
+                ok = any(value is not None and compare(value, operand) for value in values)
+            else:
+                raise NotImplementedError(f"Operator {operator} is not supported by the in-memory stand-in")
+            if not ok:
+                return False
+        return True
+    return condition in _values(doc, path)
+
+def matches(doc: Dict[str, Any], filter_query: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a MongoDB filter document against a document"""
+    for key, condition in (filter_query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _matches_condition(doc, key, condition):
+            return False
+    return True
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return {key: _copy(value) for key, value in doc.items()}
+
+    included = [path for path, flag in projection.items() if flag and path != "_id"]
+    if included:
+        result = {}
+        if projection.get("_id", 1):
+            result["_id"] = doc.get("_id")
+        for path in included:
+            value = _get_path(doc, path)
+            if value is not None:
+                _set_path(result, path, _copy(value))
+        return result
+
+    result = {key: _copy(value) for key, value in doc.items()}
+    for path, flag in projection.items():
+        if not flag:
+            _unset_path(result, path)
+    return result
+
+class InMemoryCursor:
+    """Minimal cursor supporting sort / limit / batch_size and iteration"""
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self._docs = docs
+
+    def sort(self, key_or_list, direction: int = 1):
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        for key, key_direction in reversed(keys):
+            self._docs.sort(
+                key=lambda doc: (_get_path(doc, key) is not None, _get_path(doc, key)),
+                reverse=key_direction < 0
+            )
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def skip(self, count: int):
+        self._docs = self._docs[count:]
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+class _Result:
+    def __init__(self, **kwargs):
+        self.acknowledged = True
+        self.__dict__.update(kwargs)
+
+class InMemoryCollection:
+    """Subset of pymongo.collection.Collection backed by a dict"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+
+    def create_index(self, keys, **kwargs):
+        return "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    def list_indexes(self):
+        return []
+
+    def insert_one(self, doc: Dict[str, Any]):
+        doc.setdefault("_id", len(self._docs) + 1)
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error: {doc['_id']}")
+        self._docs[doc["_id"]] = {key: _copy(value) for key, value in doc.items()}
+        return _Result(inserted_id=doc["_id"])
+
+    def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        inserted_ids = []
+        write_errors = []
+        for index, doc in enumerate(docs):
+            try:
+                inserted_ids.append(self.insert_one(doc).inserted_id)
+            except DuplicateKeyError as e:
+                write_errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(inserted_ids)})
+        return _Result(inserted_ids=inserted_ids)
+
+    def find(self, filter_query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs):
+        return InMemoryCursor([
+            _project(doc, projection) for doc in self._docs.values() if matches(doc, filter_query)
+        ])
+
+    def find_one(self, filter_query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None):
+        return next(iter(self.find(filter_query, projection)), None)
+
+    def count_documents(self, filter_query: Dict[str, Any]) -> int:
+        return sum(1 for doc in self._docs.values() if matches(doc, filter_query))
+
+    def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    def distinct(self, path: str, filter_query: Optional[Dict[str, Any]] = None) -> list:
+        values = []
+        for doc in self._docs.values():
+            if matches(doc, filter_query):
+                value = _get_path(doc, path)
+                for value in value if isinstance(value, list) else [value]:
+                    if value is not None and value not in values:
+                        values.append(value)
+        return values
+
+    def _apply_update(self, doc: Dict[str, Any], update: Dict[str, Any], inserting: bool):
+        for operator, fields in update.items():
+            for path, value in fields.items() if isinstance(fields, dict) else []:
+                current = _get_path(doc, path)
+                if operator == "$set" or (operator == "$setOnInsert" and inserting):
+                    _set_path(doc, path, copy.deepcopy(value))
+                elif operator == "$inc":
+                    _set_path(doc, path, (current or 0) + value)
+                elif operator == "$max":
+                    if current is None or value > current:
+                        _set_path(doc, path, value)
+                elif operator == "$min":
+                    if current is None or value < current:
+                        _set_path(doc, path, value)
+                elif operator == "$addToSet":
+                    items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    current = list(current or [])
+                    current.extend(item for item in items if item not in current)
+                    _set_path(doc, path, current)
+                elif operator == "$pull":
+                    _set_path(doc, path, [item for item in (current or []) if item != value])
+                elif operator == "$unset":
+                    _unset_path(doc, path)
+                elif operator != "$setOnInsert":
+                    raise NotImplementedError(f"Update operator {operator} is not supported by the in-memory stand-in")
+
+    def update_many(self, filter_query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        matched = [doc for doc in self._docs.values() if matches(doc, filter_query)]
+        for doc in matched:
+            self._apply_update(doc, update, inserting=False)
+
+        upserted_id = None
+        if not matched and upsert:
+            doc = {key: value for key, value in filter_query.items() if not key.startswith("$") and not isinstance(value, dict)}
+            self._apply_update(doc, update, inserting=True)
+            upserted_id = self.insert_one(doc).inserted_id
+
+        return _Result(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    def _first_match(self, filter_query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Plain _id lookups use the dict key, like the _id index would
+        if list(filter_query) == ["_id"] and not isinstance(filter_query["_id"], dict):
+            return self._docs.get(filter_query["_id"])
+        return next((doc for doc in self._docs.values() if matches(doc, filter_query)), None)
+
+    def update_one(self, filter_query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        doc = self._first_match(filter_query)
+        if doc is not None:
+            self._apply_update(doc, update, inserting=False)
+            return _Result(matched_count=1, modified_count=1, upserted_id=None)
+        return self.update_many(filter_query, update, upsert=upsert)
+
+    def replace_one(self, filter_query: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False):
+        doc = self._first_match(filter_query)
+        if doc is None and not upsert:
+            return _Result(matched_count=0, modified_count=0, upserted_id=None)
+        replacement = copy.deepcopy(replacement)
+        replacement["_id"] = doc["_id"] if doc is not None else filter_query.get("_id", replacement.get("_id"))
+        self._docs.pop(replacement["_id"], None)
+        self.insert_one(replacement)
+        return _Result(matched_count=int(doc is not None), modified_count=int(doc is not None), upserted_id=None)
+
+    def delete_many(self, filter_query: Dict[str, Any]):
+        doomed = [key for key, doc in self._docs.items() if matches(doc, filter_query)]
+        for key in doomed:
+            del self._docs[key]
+        return _Result(deleted_count=len(doomed))
+
+    def delete_one(self, filter_query: Dict[str, Any]):
+        key = next((key for key, doc in self._docs.items() if matches(doc, filter_query)), None)
+        if key is not None:
+            del self._docs[key]
+        return _Result(deleted_count=int(key is not None))
+
+    def bulk_write(self, operations, ordered: bool = True):
+        # pymongo operation objects keep their arguments in private attributes
+        for operation in operations:
+            name = type(operation).__name__
+            if name == "UpdateOne":
+                self.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+            elif name == "UpdateMany":
+                self.update_many(operation._filter, operation._doc, upsert=bool(operation._upsert))
+            elif name == "InsertOne":
+                self.insert_one(operation._doc)
+            elif name == "DeleteOne":
+                self.delete_one(operation._filter)
+            elif name == "DeleteMany":
+                self.delete_many(operation._filter)
+            elif name == "ReplaceOne":
+                self.replace_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+            else:
+                raise NotImplementedError(f"Bulk operation {name} is not supported by the in-memory stand-in")
+        return _Result()
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs):
+        docs = [_project(doc, None) for doc in self._docs.values()]
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif operator == "$group":
+                groups = {}
+                for doc in docs:
+                    key = _get_path(doc, spec["_id"][1:]) if isinstance(spec["_id"], str) else None
+                    group = groups.setdefault(repr(key), {"_id": key})
+                    for field, accumulator in spec.items():
+                        if field == "_id":
+                            continue
+                        (acc_op, acc_arg), = accumulator.items()
+                        value = acc_arg if not isinstance(acc_arg, str) else _get_path(doc, acc_arg[1:])
+                        if acc_op == "$sum":
+                            group[field] = group.get(field, 0) + (value or 0)
+                        elif acc_op == "$max":
+                            if value is not None and (group.get(field) is None or value > group[field]):
+                                group[field] = value
+                        elif acc_op == "$min":
+                            if value is not None and (group.get(field) is None or value < group[field]):
+                                group[field] = value
+                        elif acc_op == "$addToSet":
+                            values = group.setdefault(field, [])
+                            if value not in values:
+                                values.append(value)
+                        else:
+                            raise NotImplementedError(f"Accumulator {acc_op} is not supported by the in-memory stand-in")
+                docs = list(groups.values())
+            elif operator == "$sort":
+                docs = list(InMemoryCursor(docs).sort(list(spec.items())))
+            elif operator == "$limit":
+                docs = docs[:spec]
+            elif operator == "$project":
+                docs = [_project(doc, spec) for doc in docs]
+            else:
+                raise NotImplementedError(f"Stage {operator} is not supported by the in-memory stand-in")
+        return iter(docs)
+
+    def drop(self):
+        self._docs.clear()
+
+class InMemoryDatabase:
+    """Subset of pymongo.database.Database - collections are created on first access"""
+
+    def __init__(self, name: str = "benchmark"):
+        self.name = name
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def create_collection(self, name: str, **kwargs) -> InMemoryCollection:
+        return self[name]
+
+    def command(self, name: str, *args, **kwargs):
+        return {"ok": 1}
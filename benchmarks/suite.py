@@ -0,0 +1,237 @@
+# benchmarks/suite.py
+"""
+Retrieval and ingestion hot-path benchmarks. Every benchmark runs offline against
+FakeEmbeddings and the in-memory MongoDB stand-in.
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from typing import List, Dict, Any, Callable
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.vector_store.mongodb_store import MongoDBVectorStore
+from app.vector_store.faiss_store import FAISSVectorStore
+from app.vector_store.faiss_shared import SharedFAISSVectorStore
+from app.vector_store.quantization import code_bytes, smallest
+from app.document_processing.processor import split_documents, assign_parent_documents
+
+from .fakes import FakeEmbeddings, InMemoryDatabase
+
+BENCHMARK_USER_ID = "bench-user"
+
+def make_vocabulary(size: int = 3000, seed: int = 7) -> List[str]:
+    """Deterministic pseudo-words"""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def make_text(rng: random.Random, vocabulary: List[str], length: int) -> str:
+    """Text of roughly `length` characters built from sentences of vocabulary words"""
+    words = []
+    size = 0
+    while size < length:
+        sentence = [rng.choice(vocabulary) for _ in range(rng.randint(6, 18))]
+        sentence[0] = sentence[0].capitalize()
+        text = " ".join(sentence) + "."
+        words.append(text)
+        size += len(text) + 1
+    return " ".join(words)
+
+def make_chunks(count: int, seed: int = 11) -> List[Document]:
+    """`count` chunk-sized documents spread over a handful of parent documents"""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary()
+    return [
+        Document(
+            page_content=make_text(rng, vocabulary, settings.CHUNK_SIZE - settings.CHUNK_OVERLAP),
+            metadata={"document_id": f"doc-{i // 50}", "chunk_index": i, "title": f"Benchmark document {i // 50}"}
+        )
+        for i in range(count)
+    ]
+
+def make_documents(chunk_count: int, pages_per_document: int = 20, seed: int = 13) -> List[Document]:
+    """Page documents that split into roughly `chunk_count` chunks"""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary()
+    chunks_per_page = 3
+    page_count = max(1, chunk_count // chunks_per_page)
+    page_length = chunks_per_page * (settings.CHUNK_SIZE - settings.CHUNK_OVERLAP)
+    return [
+        Document(
+            page_content=make_text(rng, vocabulary, page_length),
+            metadata={"source": f"bench-{i // pages_per_document}.pdf", "page": i % pages_per_document}
+        )
+        for i in range(page_count)
+    ]
+
+def make_queries(count: int, seed: int = 17) -> List[str]:
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary()
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(4, 12))) for _ in range(count)]
+
+def measure(fn: Callable[[], Any], repeat: int, setup: Callable[[], Any] = None) -> Dict[str, float]:
+    """Time `fn` `repeat` times (optionally after a fresh `setup`), returning ms statistics"""
+    timings = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for _ in range(repeat):
+            argument = setup() if setup else None
+            start = time.perf_counter()
+            fn(argument) if setup else fn()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 3),
+        "min_ms": round(timings[0], 3),
+    }
+
+def _silently(fn: Callable[[], Any]):
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return fn()
+
+@contextmanager
+def _quantization(mode: str):
+    previous = settings.VECTOR_QUANTIZATION
+    settings.VECTOR_QUANTIZATION = mode
+    try:
+        yield
+    finally:
+        settings.VECTOR_QUANTIZATION = previous
+
+def _search_quality(search: Callable[[List[float]], List[str]], chunks: List[Document], query_vectors: List[List[float]],
+                    embeddings: FakeEmbeddings, metric: str, mode: str) -> Dict[str, Any]:
+    """Recall@k against an exact numpy search, and the bytes screened per corpus in this mode"""
+    k = settings.SIMILARITY_SEARCH_K
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    if metric == "cosine":
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    hits = expected = 0
+    for query in query_vectors:
+        query = np.asarray(query, dtype=np.float32)
+        if metric == "cosine":
+            distances = -(vectors @ query)
+        else:
+            distances = np.einsum("ij,ij->i", vectors, vectors) - 2.0 * (vectors @ query)
+        exact = {texts[i] for i in smallest(distances, k)}
+        hits += len(exact & set(search(query.tolist())))
+        expected += len(exact)
+
+    dims = vectors.shape[1]
+    return {
+        "recall_at_k": round(hits / max(1, expected), 4),
+        "screen_bytes": code_bytes(mode, len(chunks), dims),
+        "full_bytes": code_bytes("none", len(chunks), dims),
+    }
+
+def local_similarity_search_benchmark(mode: str) -> Callable[..., Dict[str, Any]]:
+    def bench(size: int, dims: int, queries: int, repeat: int) -> Dict[str, Any]:
+        embeddings = FakeEmbeddings(dims)
+        chunks = make_chunks(size)
+        k = settings.SIMILARITY_SEARCH_K
+        with _quantization(mode):
+            store = _silently(lambda: MongoDBVectorStore(embeddings=embeddings, db=InMemoryDatabase()))
+            _silently(lambda: store.add_documents(chunks, BENCHMARK_USER_ID))
+            query_list = embeddings.embed_documents(make_queries(queries * repeat))
+            query_vectors = iter(query_list)
+
+            stats = measure(
+                lambda: store._local_similarity_search(next(query_vectors), k, BENCHMARK_USER_ID),
+                repeat=queries * repeat
+            )
+            stats.update(_search_quality(
+                lambda query: [doc["text"] for doc in store._local_similarity_search(query, k, BENCHMARK_USER_ID)],
+                chunks, query_list[:queries], embeddings, "cosine", mode
+            ))
+        return stats
+    return bench
+
+def shared_faiss_search_benchmark(mode: str) -> Callable[..., Dict[str, Any]]:
+    def bench(size: int, dims: int, queries: int, repeat: int) -> Dict[str, Any]:
+        embeddings = FakeEmbeddings(dims)
+        chunks = make_chunks(size)
+        k = settings.SIMILARITY_SEARCH_K
+        with _quantization(mode), tempfile.TemporaryDirectory() as folder:
+            store = _silently(lambda: SharedFAISSVectorStore(folder, embeddings=embeddings))
+            _silently(lambda: store.add_documents(chunks, BENCHMARK_USER_ID))
+            query_list = embeddings.embed_documents(make_queries(queries * repeat))
+            query_vectors = iter(query_list)
+
+            stats = measure(
+                lambda: store.similarity_search_by_vector(next(query_vectors), k=k, user_id=BENCHMARK_USER_ID),
+                repeat=queries * repeat
+            )
+            stats.update(_search_quality(
+                lambda query: [doc.page_content for doc in store.similarity_search_by_vector(query, k=k, user_id=BENCHMARK_USER_ID)],
+                chunks, query_list[:queries], embeddings, "l2", mode
+            ))
+        return stats
+    return bench
+
+def bench_faiss_similarity_search(size: int, dims: int, queries: int, repeat: int) -> Dict[str, Any]:
+    embeddings = FakeEmbeddings(dims)
+    store = _silently(lambda: FAISSVectorStore(embeddings=embeddings))
+    _silently(lambda: store.add_documents(make_chunks(size), BENCHMARK_USER_ID))
+    query_vectors = iter(embeddings.embed_documents(make_queries(queries * repeat)))
+
+    return measure(
+        lambda: store.similarity_search_by_vector(next(query_vectors), k=settings.SIMILARITY_SEARCH_K, user_id=BENCHMARK_USER_ID),
+        repeat=queries * repeat
+    )
+
+def bench_chunking(size: int, dims: int, queries: int, repeat: int) -> Dict[str, Any]:
+    documents = make_documents(size)
+    return measure(lambda: split_documents(documents), repeat=repeat)
+
+def bench_parent_mapping(size: int, dims: int, queries: int, repeat: int) -> Dict[str, Any]:
+    documents = make_documents(size)
+    for i, doc in enumerate(documents):
+        doc.metadata["document_id"] = f"doc-{i}"
+    chunks = split_documents(documents)
+
+    return measure(lambda: assign_parent_documents(chunks, documents, BENCHMARK_USER_ID), repeat=repeat)
+
+def bench_mongodb_add_documents(size: int, dims: int, queries: int, repeat: int) -> Dict[str, Any]:
+    embeddings = FakeEmbeddings(dims)
+    chunks = make_chunks(size)
+
+    def fresh_store():
+        return MongoDBVectorStore(embeddings=embeddings, db=InMemoryDatabase())
+
+    return measure(lambda store: store.add_documents(chunks, BENCHMARK_USER_ID), repeat=repeat, setup=fresh_store)
+
+BENCHMARKS = {
+    "local_similarity_search": local_similarity_search_benchmark("none"),
+    "local_similarity_search_int8": local_similarity_search_benchmark("int8"),
+    "local_similarity_search_binary": local_similarity_search_benchmark("binary"),
+    "faiss_shared_search": shared_faiss_search_benchmark("none"),
+    "faiss_shared_search_int8": shared_faiss_search_benchmark("int8"),
+    "faiss_shared_search_binary": shared_faiss_search_benchmark("binary"),
+    "faiss_similarity_search": bench_faiss_similarity_search,
+    "chunking": bench_chunking,
+    "parent_mapping": bench_parent_mapping,
+    "mongodb_add_documents": bench_mongodb_add_documents,
+}
+
+def run_benchmarks(names: List[str], sizes: List[int], dims: int, queries: int, repeat: int) -> List[Dict[str, Any]]:
+    """Run the selected benchmarks at every corpus size"""
+    results = []
+    for name in names:
+        for size in sizes:
+            print(f"⏱️  {name} (size={size})...", flush=True)
+            stats = BENCHMARKS[name](size, dims, queries, repeat)
+            results.append({"benchmark": name, "size": size, **stats})
+            print(f"   p50 {stats['p50_ms']:.3f} ms  p95 {stats['p95_ms']:.3f} ms  mean {stats['mean_ms']:.3f} ms")
+            if "recall_at_k" in stats:
+                print(f"   recall@k {stats['recall_at_k']:.3f}  screened {stats['screen_bytes'] / 1e6:.2f} MB "
+                      f"of {stats['full_bytes'] / 1e6:.2f} MB full precision")
+    return results
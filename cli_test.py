@@ -4,6 +4,7 @@ import requests
 import json
 import sys
 import os
+import time
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.panel import Panel
@@ -180,6 +181,73 @@ class ChatbotTester:
         except Exception as e:
             console.print(f"[bold red]Error:[/bold red] {str(e)}")
     
+    def run_batch(self, questions_path, output_path=None, concurrency=None, graph_mode=None):
+        """Send a file of questions to /chat/batch and write the results as they arrive.
+        
+        The file has one question per line, or one JSON object per line (.jsonl) with
+        "message" (or "question") and optional "id" / "thread_id". Results are written
+        as NDJSON in completion order; match them to questions by "index" or "id".
+        """
+        messages = []
+        with open(questions_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if questions_path.endswith(".jsonl"):
+                    entry = json.loads(line)
+                    message = {"message": entry.get("message") or entry["question"]}
+                    for key in ("id", "thread_id"):
+                        if entry.get(key) is not None:
+                            message[key] = str(entry[key])
+                    messages.append(message)
+                else:
+                    messages.append({"message": line})
+        if not messages:
+            console.print(f"[bold red]Error:[/bold red] No questions in {questions_path}")
+            return
+        
+        payload = {"messages": messages, "user_id": self.user_id}
+        if concurrency:
+            payload["concurrency"] = concurrency
+        if graph_mode:
+            payload["graph_mode"] = graph_mode
+        
+        output_path = output_path or os.path.splitext(questions_path)[0] + ".results.jsonl"
+        console.print(f"Sending {len(messages)} questions to {self.host}/chat/batch, writing {output_path}")
+        
+        start = time.perf_counter()
+        completed = failed = 0
+        latencies = []
+        try:
+            with requests.post(f"{self.host}/chat/batch", json=payload, stream=True) as response, \
+                    open(output_path, "w", encoding="utf-8") as out:
+                response.raise_for_status()
+                with console.status("Waiting for results...") as status:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        result = json.loads(line)
+                        out.write(json.dumps(result) + "\n")
+                        completed += 1
+                        failed += result.get("error") is not None
+                        latencies.append(result["latency_ms"])
+                        status.update(f"{completed}/{len(messages)} answered, {failed} failed "
+                                      f"({time.perf_counter() - start:.0f} s)")
+        except Exception as e:
+            console.print(f"[bold red]Error:[/bold red] {str(e)}")
+        
+        elapsed = time.perf_counter() - start
+        mean_latency = sum(latencies) / len(latencies) if latencies else 0
+        console.print(Panel(
+            f"Answered: {completed}/{len(messages)} ({failed} failed)\n"
+            f"Wall time: {elapsed:.1f} s ({completed / elapsed if elapsed else 0:.1f} questions/s)\n"
+            f"Mean latency per question: {mean_latency:.0f} ms\n"
+            f"Results: {output_path}",
+            title="Batch finished",
+            expand=False
+        ))
+    
     def run(self):
         """Run the CLI tester"""
         self.display_welcome()
@@ -231,6 +299,11 @@ if __name__ == "__main__":
                         help="API host URL")
     parser.add_argument("--user", default=os.getenv("TEST_USER_ID", "test-user-123"), 
                         help="User ID for testing")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Answer the questions in FILE (.txt or .jsonl) through /chat/batch instead of chatting")
+    parser.add_argument("--output", help="Where --batch writes its NDJSON results (default: FILE.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, help="Concurrent graph runs for --batch (server default if unset)")
+    parser.add_argument("--graph-mode", choices=["agentic", "retrieval_first"], help="Graph topology for --batch")
     args = parser.parse_args()
     
     # Initialize and run tester
@@ -238,4 +311,7 @@ if __name__ == "__main__":
         host=args.host,
         user_id=args.user
     )
-    tester.run()
\ No newline at end of file
+    if args.batch:
+        tester.run_batch(args.batch, args.output, args.concurrency, args.graph_mode)
+    else:
+        tester.run()
\ No newline at end of file
@@ -0,0 +1,5 @@
+# loadtest/__init__.py
+"""
+End-to-end load testing: a stub OpenAI-compatible server (loadtest.stub_openai)
+and a load generator for the API (python -m loadtest).
+"""
@@ -0,0 +1,185 @@
+# loadtest/__main__.py
+"""
+Load generator for the FastAPI app.
+
+    python -m loadtest --host http://localhost:8001 --concurrency 16 --requests 500 \
+        --mix chat=0.7,upload=0.1,conversations=0.2 --output load.json
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+QUESTIONS = [
+    "What should I eat during the first trimester?",
+    "How much folic acid do I need during pregnancy?",
+    "Is it safe to exercise while pregnant?",
+    "What are the signs of gestational diabetes?",
+    "When should I schedule my first ultrasound?",
+    "What prenatal screening tests are recommended?",
+    "How can I manage morning sickness?",
+    "What vaccines are recommended during pregnancy?",
+]
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))], 1)
+
+class LoadTester:
+    """Drives /chat, /upload-file and /conversations from a pool of worker threads"""
+
+    def __init__(self, host: str, mix: Dict[str, float], users: int, timeout: float):
+        self.host = host.rstrip("/")
+        self.mix = mix
+        self.user_ids = [f"loadtest-user-{i}" for i in range(users)]
+        self.timeout = timeout
+        self.threads: Dict[str, str] = {}  # user_id -> last thread_id
+        self.samples: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, Dict[str, int]] = {name: {} for name in mix}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def chat(self, user_id: str) -> requests.Response:
+        payload = {"message": random.choice(QUESTIONS), "user_id": user_id}
+        # Continue an existing thread half of the time
+        thread_id = self.threads.get(user_id)
+        if thread_id and random.random() < 0.5:
+            payload["thread_id"] = thread_id
+        response = self.session().post(f"{self.host}/chat", json=payload, timeout=self.timeout)
+        if response.ok:
+            self.threads[user_id] = response.json().get("thread_id")
+        return response
+
+    def upload(self, user_id: str) -> requests.Response:
+        content = " ".join(random.choice(QUESTIONS) for _ in range(200)).encode("utf-8")
+        files = {"file": (f"loadtest-{uuid.uuid4().hex[:8]}.txt", io.BytesIO(content), "text/plain")}
+        return self.session().post(f"{self.host}/upload-file", files=files,
+                                   data={"user_id": user_id}, timeout=self.timeout)
+
+    def conversations(self, user_id: str) -> requests.Response:
+        return self.session().get(f"{self.host}/conversations", params={"user_id": user_id}, timeout=self.timeout)
+
+    def run_one(self, _index: int):
+        operation = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        user_id = random.choice(self.user_ids)
+        start = time.perf_counter()
+        error = None
+        try:
+            response = getattr(self, operation)(user_id)
+            if not response.ok:
+                error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self.lock:
+            if error:
+                self.errors[operation][error] = self.errors[operation].get(error, 0) + 1
+            else:
+                self.samples[operation].append(elapsed_ms)
+
+    def run(self, concurrency: int, total_requests: Optional[int], duration: Optional[float]) -> Dict:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if duration:
+                deadline = start + duration
+                index = 0
+                futures = set()
+                while time.perf_counter() < deadline:
+                    # Keep the pool saturated without queueing unbounded work
+                    futures = {future for future in futures if not future.done()}
+                    while len(futures) < concurrency * 2:
+                        futures.add(executor.submit(self.run_one, index))
+                        index += 1
+                    time.sleep(0.005)
+            else:
+                list(executor.map(self.run_one, range(total_requests)))
+        wall_time = time.perf_counter() - start
+        return self.report(concurrency, wall_time)
+
+    def report(self, concurrency: int, wall_time: float) -> Dict:
+        endpoints = {}
+        for operation, samples in self.samples.items():
+            ordered = sorted(samples)
+            error_count = sum(self.errors[operation].values())
+            endpoints[operation] = {
+                "requests": len(ordered) + error_count,
+                "errors": error_count,
+                "error_breakdown": self.errors[operation],
+                "throughput_rps": round(len(ordered) / wall_time, 2) if wall_time else 0,
+                "mean_ms": round(sum(ordered) / len(ordered), 1) if ordered else None,
+                "p50_ms": percentile(ordered, 0.50),
+                "p95_ms": percentile(ordered, 0.95),
+                "p99_ms": percentile(ordered, 0.99),
+                "max_ms": round(ordered[-1], 1) if ordered else None,
+            }
+        return {
+            "metadata": {
+                "timestamp": datetime.now().isoformat(),
+                "host": self.host,
+                "concurrency": concurrency,
+                "mix": self.mix,
+                "wall_time_s": round(wall_time, 2),
+            },
+            "endpoints": endpoints,
+        }
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("chat", "upload", "conversations"):
+            raise argparse.ArgumentTypeError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load generator for the RAG Chatbot API")
+    parser.add_argument("--host", default="http://localhost:8001", help="API host URL")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    group.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed count")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=0.7,upload=0.1,conversations=0.2"),
+                        help="Operation weights, e.g. chat=0.7,upload=0.1,conversations=0.2")
+    parser.add_argument("--users", type=int, default=20, help="Distinct simulated user ids")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    tester = LoadTester(args.host, args.mix, args.users, args.timeout)
+    print(f"🚀 {args.concurrency} clients against {args.host} "
+          f"({'%.0fs' % args.duration if args.duration else '%d requests' % args.requests})")
+    report = tester.run(args.concurrency, args.requests, args.duration)
+
+    print(f"\n📊 Results ({report['metadata']['wall_time_s']}s wall time)")
+    for operation, stats in report["endpoints"].items():
+        print(f"  {operation:<14} n={stats['requests']:<6} errors={stats['errors']:<4} "
+              f"rps={stats['throughput_rps']:<7} p50={stats['p50_ms']} p95={stats['p95_ms']} p99={stats['p99_ms']} ms")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"\n💾 Report written to {args.output}")
+
+    total_errors = sum(stats["errors"] for stats in report["endpoints"].values())
+    return 1 if total_errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
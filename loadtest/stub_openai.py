@@ -0,0 +1,167 @@
+# loadtest/stub_openai.py
+"""
+Local stub of the OpenAI chat completions (incl. tool calling) and embeddings endpoints.
+
+Point the API at it with OPENAI_BASE_URL=http://localhost:8010/v1 and any OPENAI_API_KEY.
+It also serves HTML pages with ETag / Last-Modified at /pages/{slug} as a stand-in for
+URL ingestion (append ?version=N to change a page's content).
+
+    python -m loadtest.stub_openai --port 8010 --chat-latency-ms 400 --embedding-latency-ms 60
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse
+
+from benchmarks.fakes import FakeEmbeddings
+
+app = FastAPI(title="Stub OpenAI API")
+
+# Latency settings - overridable from the command line or environment
+app.state.chat_latency_ms = float(os.getenv("STUB_CHAT_LATENCY_MS", "300"))
+app.state.embedding_latency_ms = float(os.getenv("STUB_EMBEDDING_LATENCY_MS", "50"))
+app.state.page_latency_ms = float(os.getenv("STUB_PAGE_LATENCY_MS", "50"))
+app.state.jitter = float(os.getenv("STUB_LATENCY_JITTER", "0.2"))  # +/- fraction of the base latency
+app.state.embeddings = FakeEmbeddings(int(os.getenv("STUB_EMBEDDING_DIMENSIONS", "1536")))
+
+async def simulate_latency(base_ms: float):
+    if base_ms <= 0:
+        return
+    jitter = app.state.jitter
+    await asyncio.sleep(base_ms * random.uniform(1 - jitter, 1 + jitter) / 1000)
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+def _usage(prompt: str, completion: str = "") -> Dict[str, int]:
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = len(completion) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Answer like gpt-4o-mini: call the first tool for a fresh user turn, otherwise reply in text"""
+    body = await request.json()
+    await simulate_latency(app.state.chat_latency_ms)
+
+    messages: List[Dict[str, Any]] = body.get("messages", [])
+    last_message = messages[-1] if messages else {}
+    prompt = " ".join(_message_text(message) for message in messages)
+    tools = body.get("tools") or []
+
+    if tools and last_message.get("role") == "user":
+        tool_name = tools[0]["function"]["name"]
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": tool_name, "arguments": json.dumps({"query": _message_text(last_message)})}
+            }]
+        }
+        finish_reason = "tool_calls"
+        completion = message["tool_calls"][0]["function"]["arguments"]
+    else:
+        question = next((_message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+        completion = f"Stub answer to: {question[:200]}"
+        message = {"role": "assistant", "content": completion}
+        finish_reason = "stop"
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "logprobs": None, "finish_reason": finish_reason}],
+        "usage": _usage(prompt, completion)
+    }
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    """Deterministic embeddings; accepts strings or token arrays and float / base64 encoding"""
+    body = await request.json()
+    await simulate_latency(app.state.embedding_latency_ms)
+
+    inputs = body.get("input", [])
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    texts = [item if isinstance(item, str) else " ".join(str(token) for token in item) for item in inputs]
+
+    embedder = app.state.embeddings
+    if body.get("dimensions") and body["dimensions"] != embedder.dimensions:
+        embedder = FakeEmbeddings(int(body["dimensions"]))
+    vectors = embedder.embed_documents(texts)
+
+    data = []
+    for index, vector in enumerate(vectors):
+        if body.get("encoding_format") == "base64":
+            vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+        data.append({"object": "embedding", "index": index, "embedding": vector})
+
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "stub"),
+        "usage": _usage(" ".join(texts))
+    }
+
+@app.get("/pages/{slug}")
+async def page(slug: str, request: Request, version: int = 1, paragraphs: int = 20):
+    """Deterministic HTML page; honours If-None-Match with a 304 like a well-behaved origin"""
+    await simulate_latency(app.state.page_latency_ms)
+    etag = f'"{slug}-{version}-{paragraphs}"'
+    headers = {"ETag": etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    body = "".join(
+        f"<p>{slug} version {version}, paragraph {n}: prenatal care covers folic acid, iron, "
+        f"screening tests, nutrition and safe exercise during each trimester.</p>"
+        for n in range(paragraphs)
+    )
+    return HTMLResponse(
+        f"<html><head><title>{slug.replace('-', ' ').title()}</title>"
+        f"<script>var tracking = 1;</script></head><body>{body}</body></html>",
+        headers=headers
+    )
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model", "created": 0, "owned_by": "stub"}]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--chat-latency-ms", type=float, default=app.state.chat_latency_ms)
+    parser.add_argument("--embedding-latency-ms", type=float, default=app.state.embedding_latency_ms)
+    parser.add_argument("--page-latency-ms", type=float, default=app.state.page_latency_ms)
+    parser.add_argument("--jitter", type=float, default=app.state.jitter)
+    args = parser.parse_args()
+
+    app.state.chat_latency_ms = args.chat_latency_ms
+    app.state.embedding_latency_ms = args.embedding_latency_ms
+    app.state.page_latency_ms = args.page_latency_ms
+    app.state.jitter = args.jitter
+
+    print(f"🧪 Stub OpenAI API on http://{args.host}:{args.port}/v1 "
+          f"(chat {args.chat_latency_ms:.0f} ms, embeddings {args.embedding_latency_ms:.0f} ms)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
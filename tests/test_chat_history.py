@@ -0,0 +1,96 @@
+# tests/test_chat_history.py
+"""
+Write-behind chat history (ChatHistoryWriter), run against the in-memory stand-ins from
+benchmarks.fakes.
+"""
+import pytest
+from prometheus_client import REGISTRY
+from pymongo.errors import AutoReconnect
+
+from benchmarks.fakes import InMemoryDatabase
+from app.config import settings
+from app.db.chat_history import ChatHistoryWriter
+
+def dropped():
+    return REGISTRY.get_sample_value("chat_history_writes_total", {"kind": "exchanges", "outcome": "dropped"}) or 0
+
+@pytest.fixture(autouse=True)
+def writer_settings(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_FLUSH_MS", 5000)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_BATCH_SIZE", 4)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_MAX_RETRIES", 2)
+
+@pytest.fixture
+def db():
+    return InMemoryDatabase()
+
+@pytest.fixture
+def writer(db):
+    writer = ChatHistoryWriter()
+    writer._db = db
+    yield writer
+    writer.close(timeout=5)
+
+def record(writer, conversation_id: str, turn: int, user_id: str = "user-1"):
+    writer.record_exchange(conversation_id, user_id, f"question {turn}", f"answer {turn}")
+
+def count_calls(collection, method: str, fail_first: int = 0):
+    """Count calls of a collection method, failing the first `fail_first` with a connection error"""
+    calls = []
+    original = getattr(collection, method)
+
+    def wrapper(*args, **kwargs):
+        calls.append(len(args[0]))
+        if len(calls) <= fail_first:
+            raise AutoReconnect("connection reset")
+        return original(*args, **kwargs)
+
+    setattr(collection, method, wrapper)
+    return calls
+
+def test_exchanges_are_written_in_batches(db, writer):
+    conversation_writes = count_calls(db[settings.CHAT_HISTORY_COLLECTION], "bulk_write")
+    message_writes = count_calls(db[settings.MESSAGES_COLLECTION], "insert_many")
+    for turn in range(5):
+        record(writer, "c1" if turn % 2 else "c2", turn)
+
+    writer.close(timeout=5)
+
+    # A full batch of four exchanges, then the fifth when the writer is closed
+    assert conversation_writes == [2, 1]
+    assert message_writes == [8, 2]
+    conversations = {doc["conversation_id"]: doc for doc in db[settings.CHAT_HISTORY_COLLECTION].find({})}
+    assert conversations["c2"]["message_count"] == 6 and conversations["c1"]["message_count"] == 4
+    assert conversations["c2"]["title"] == "question 0"
+    assert conversations["c2"]["last_message_preview"] == "answer 4"
+    assert db[settings.MESSAGES_COLLECTION].count_documents({}) == 10
+    assert REGISTRY.get_sample_value("chat_history_queue_depth") == 0
+
+def test_failed_writes_are_retried_without_duplicating_messages(db, writer):
+    count_calls(db[settings.CHAT_HISTORY_COLLECTION], "bulk_write", fail_first=1)
+    messages = db[settings.MESSAGES_COLLECTION]
+    insert_many = messages.insert_many
+
+    def insert_then_lose_the_reply(docs, **kwargs):
+        messages.insert_many = insert_many
+        insert_many(docs, **kwargs)
+        raise AutoReconnect("reply lost")
+
+    messages.insert_many = insert_then_lose_the_reply
+    record(writer, "c1", 0)
+    record(writer, "c1", 1)
+
+    writer.close(timeout=5)
+
+    assert db[settings.CHAT_HISTORY_COLLECTION].find_one({"conversation_id": "c1"})["message_count"] == 4
+    assert sorted(doc["content"] for doc in messages.find({})) == ["answer 0", "answer 1", "question 0", "question 1"]
+
+def test_exchanges_are_dropped_when_the_writer_is_closed(db, writer):
+    writer.close()
+    before = dropped()
+
+    record(writer, "c1", 0)
+
+    assert dropped() == before + 1
+    assert db[settings.MESSAGES_COLLECTION].count_documents({}) == 0
@@ -0,0 +1,131 @@
+# tests/test_chunk_references.py
+"""
+Content-addressed chunks and their per-document references in MongoDBVectorStore, run against
+the in-memory stand-ins from benchmarks.fakes.
+"""
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, InMemoryDatabase
+from app.vector_store.mongodb_store import MongoDBVectorStore
+
+TEXTS = [
+    "Take 400 mcg of folic acid every day before and during pregnancy.",
+    "Iron supplements are often recommended in the second trimester.",
+    "Thirty minutes of moderate exercise most days is safe for most pregnancies.",
+]
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self, dimensions: int = 32):
+        super().__init__(dimensions)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+def handout(document_id: str, source: str, texts=TEXTS):
+    return [
+        Document(page_content=text, metadata={"document_id": document_id, "chunk_index": i,
+                                              "source": source, "title": source, "type": "pdf"})
+        for i, text in enumerate(texts)
+    ]
+
+@pytest.fixture
+def db():
+    return InMemoryDatabase()
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbeddings()
+
+@pytest.fixture
+def store(db, embeddings):
+    return MongoDBVectorStore(embeddings=embeddings, db=db)
+
+def search(store, embeddings, user_id, **filters):
+    query = embeddings.embed_query("folic acid every day")
+    return store.similarity_search_by_vector(query, k=3, user_id=user_id, filters=filters or None)
+
+def test_shared_handout_is_embedded_once(db, store, embeddings):
+    store.add_documents(handout("doc-1", "a.pdf"), "user-1")
+    store.add_documents(handout("doc-2", "b.pdf"), "user-2")
+
+    assert embeddings.embedded == len(TEXTS)
+    assert db.vectors.count_documents({}) == len(TEXTS)
+    assert store.refs_collection.count_documents({}) == 2 * len(TEXTS)
+    assert store.get_stats()["total_documents"] == len(TEXTS)
+    assert store.get_stats()["total_references"] == 2 * len(TEXTS)
+
+def test_each_user_finds_shared_chunks_through_their_own_metadata(store, embeddings):
+    store.add_documents(handout("doc-1", "a.pdf"), "user-1")
+    store.add_documents(handout("doc-2", "b.pdf"), "user-2")
+
+    for user_id, source, document_id in (("user-1", "a.pdf", "doc-1"), ("user-2", "b.pdf", "doc-2")):
+        results = search(store, embeddings, user_id, source=source)
+        assert len(results) == 3
+        assert {doc.metadata["document_id"] for doc in results} == {document_id}
+        assert {doc.metadata["source"] for doc in results} == {source}
+        assert len(search(store, embeddings, user_id, title=source)) == 3
+
+    assert search(store, embeddings, "user-3") == []
+
+def test_deleting_one_reference_keeps_the_shared_chunk(db, store, embeddings):
+    store.add_documents(handout("doc-1", "a.pdf"), "user-1")
+    store.add_documents(handout("doc-2", "b.pdf", TEXTS[:2]), "user-2")
+
+    store.delete_by_document("doc-1")
+
+    assert db.vectors.count_documents({}) == 2  # The chunk only doc-1 had is gone
+    chunk = next(iter(db.vectors.find({})))
+    assert chunk["user_ids"] == ["user-2"] and chunk["document_ids"] == ["doc-2"] and chunk["sources"] == ["b.pdf"]
+    assert search(store, embeddings, "user-1") == []
+    assert len(search(store, embeddings, "user-2", source="b.pdf")) == 2
+    assert store.get_stats()["total_documents"] == 2
+
+def test_relink_keeps_a_chunk_linked_while_it_was_checked(db, store):
+    store.add_documents(handout("doc-1", "a.pdf"), "user-1")
+    aggregate = store.refs_collection.aggregate
+
+    def aggregate_then_upload(pipeline, **kwargs):
+        groups = list(aggregate(pipeline, **kwargs))
+        # Another worker shares the chunks after the references were read, before the delete
+        store.add_documents(handout("doc-2", "b.pdf"), "user-2")
+        return iter(groups)
+
+    store.refs_collection.delete_many({"document_id": "doc-1"})
+    store.refs_collection.aggregate = aggregate_then_upload
+    assert store._relink_chunks([chunk["_id"] for chunk in db.vectors.find({})]) == 0
+    del store.refs_collection.aggregate
+
+    assert db.vectors.count_documents({}) == len(TEXTS)
+    assert [doc.page_content for doc in store.get_document_chunks("doc-2")] == TEXTS
+
+def test_upload_recreates_a_chunk_deleted_while_it_was_linked(db, store, embeddings):
+    store.add_documents(handout("doc-1", "a.pdf"), "user-1")
+    bulk_write = store.refs_collection.bulk_write
+
+    def write_refs_then_lose_chunks(operations, **kwargs):
+        result = bulk_write(operations, **kwargs)
+        # A relink that read the references before these were written deletes the chunks now
+        store.refs_collection.bulk_write = bulk_write
+        store._apply_stats_changes({}, total_change=-db.vectors.delete_many({}).deleted_count)
+        return result
+
+    store.refs_collection.bulk_write = write_refs_then_lose_chunks
+    store.add_documents(handout("doc-2", "b.pdf"), "user-2")
+
+    assert embeddings.embedded == 2 * len(TEXTS)  # Re-embedded
+    assert [doc.page_content for doc in store.get_document_chunks("doc-2")] == TEXTS
+    assert all("user-2" in chunk["user_ids"] for chunk in db.vectors.find({}))
+    assert store.get_stats()["total_documents"] == len(TEXTS)
+
+def test_backfill_adds_filter_values_of_every_reference(db, store, embeddings):
+    store.add_documents(handout("doc-1", "a.pdf"), "user-1")
+    for chunk in db.vectors.find({}):  # Linked before the filter arrays existed
+        db.vectors.update_one({"_id": chunk["_id"]}, {"$unset": {"sources": "", "types": "", "titles": ""}})
+    store.add_documents(handout("doc-2", "b.pdf"), "user-2")
+
+    assert search(store, embeddings, "user-1", source="a.pdf") == []
+    assert store.backfill_reference_filters(batch_size=2) == {"relinked": len(TEXTS), "orphaned": 0}
+    assert len(search(store, embeddings, "user-1", source="a.pdf")) == 3
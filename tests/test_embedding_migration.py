@@ -0,0 +1,90 @@
+# tests/test_embedding_migration.py
+"""
+Online re-embedding (EmbeddingMigration), run against the in-memory stand-ins from
+benchmarks.fakes. The job is run in the test's thread instead of a background one.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, InMemoryDatabase
+from app.config import settings
+from app.vector_store.migration import EmbeddingMigration
+from app.vector_store.mongodb_store import MIGRATION_STATE_ID, MongoDBVectorStore
+
+def chunks(start: int, count: int):
+    return [
+        Document(page_content=f"Chunk {i}: iron and folic acid in the second trimester",
+                 metadata={"document_id": f"doc-{i // 4}", "chunk_index": i % 4})
+        for i in range(start, start + count)
+    ]
+
+@pytest.fixture(autouse=True)
+def migration_settings(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_MIGRATION_CHUNKS_PER_SECOND", 0)
+    monkeypatch.setattr(settings, "EMBEDDING_MIGRATION_BATCH_SIZE", 4)
+    monkeypatch.setattr(settings, "EMBEDDING_SPACE_REFRESH_SECONDS", 0)
+    monkeypatch.setattr(settings, "EMBEDDING_MIGRATION_SHADOW_READ_RATE", 0)
+    # Jobs are run by the tests, never in a background thread
+    monkeypatch.setattr(EmbeddingMigration, "resume_if_abandoned", lambda self, migration: None)
+
+@pytest.fixture
+def db():
+    return InMemoryDatabase()
+
+@pytest.fixture
+def store(db):
+    store = MongoDBVectorStore(embeddings=FakeEmbeddings(32), db=db)
+    store.add_documents(chunks(0, 10), "user-1")
+    return store
+
+@pytest.fixture
+def target():
+    return FakeEmbeddings(16)
+
+def test_migration_switches_every_worker_and_clears_the_old_slot(db, store, target):
+    other_worker = MongoDBVectorStore(embeddings=FakeEmbeddings(32), db=db)
+    store.embedding_migration.start(target.model, embeddings=target)
+    store.add_documents(chunks(10, 2), "user-1")  # Written to both spaces while the job runs
+    new_chunk = db.vectors.find_one({"text": chunks(10, 1)[0].page_content})
+    assert len(new_chunk["shadow_embedding"]) == 16 and len(new_chunk["embedding"]) == 32
+
+    store.embedding_migration.run()
+
+    migration = store.embedding_migration.status()["migration"]
+    assert migration["status"] == "completed"
+    assert migration["migrated"] == 10  # The two dual-written chunks needed no pass
+    assert migration["cleared"] == 12
+    assert store.space["slot"] == "shadow_embedding" and store.space["dimensions"] == 16
+    other_worker._refresh_space(force=True)
+    assert other_worker.space == store.space
+    assert all("embedding" not in chunk and len(chunk["shadow_embedding"]) == 16 for chunk in db.vectors.find({}))
+    assert len(store.similarity_search("iron in the second trimester", k=3, user_id="user-1")) == 3
+
+def test_one_worker_runs_the_job_until_its_lease_lapses(db, store, target):
+    store.embedding_migration.start(target.model, embeddings=target)
+    other = EmbeddingMigration(MongoDBVectorStore(embeddings=FakeEmbeddings(32), db=db))
+
+    assert store.embedding_migration._renew_lease() is not None
+    assert other._renew_lease() is None
+    with pytest.raises(RuntimeError, match="in progress"):
+        store.embedding_migration.start("another-model", dimensions=8, embeddings=FakeEmbeddings(8))
+
+    store.state_collection.update_one(
+        {"_id": MIGRATION_STATE_ID}, {"$set": {"migration.lease_expires": datetime.now() - timedelta(seconds=1)}}
+    )
+    assert other._renew_lease()["lease_owner"] == other.owner
+    assert store.embedding_migration._renew_lease() is None
+
+def test_cancelled_migration_keeps_serving_the_source(db, store, target):
+    store.embedding_migration.start(target.model, embeddings=target)
+    migration = store.embedding_migration._renew_lease()
+    assert store.embedding_migration._embed_batch(migration)
+    store.embedding_migration.cancel()
+
+    store.embedding_migration.run()
+
+    assert store.embedding_migration.status()["migration"]["status"] == "cancelled"
+    assert store.space["slot"] == "embedding" and store.space["dimensions"] == 32
+    assert all("shadow_embedding" not in chunk and len(chunk["embedding"]) == 32 for chunk in db.vectors.find({}))
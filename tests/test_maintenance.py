@@ -0,0 +1,198 @@
+# tests/test_maintenance.py
+"""
+Retention and orphan cleanup jobs, run against the in-memory stand-ins from benchmarks.fakes.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, InMemoryDatabase
+from app.config import settings
+from app.db.maintenance import MAINTENANCE_STATE_ID, Maintenance
+from app.vector_store.mongodb_store import MongoDBVectorStore
+
+def object_id(hours_ago: float) -> ObjectId:
+    """A unique ObjectId carrying a creation time `hours_ago` hours back"""
+    created = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+    return ObjectId(format(int(created.timestamp()), "08x") + os.urandom(8).hex())
+
+def chunks(document_id: str, count: int = 3):
+    return [
+        Document(page_content=f"{document_id} chunk {i} about prenatal vitamins",
+                 metadata={"document_id": document_id, "chunk_index": i})
+        for i in range(count)
+    ]
+
+@pytest.fixture(autouse=True)
+def maintenance_settings(monkeypatch):
+    monkeypatch.setattr(settings, "MAINTENANCE_DELETES_PER_SECOND", 0)
+    monkeypatch.setattr(settings, "MAINTENANCE_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "MAINTENANCE_ORPHAN_GRACE_MINUTES", 60)
+    monkeypatch.setattr(settings, "ENABLE_CHAT_HISTORY", True)
+    monkeypatch.setattr(settings, "MAINTENANCE_ORPHANED_CHECKPOINTS", True)
+    monkeypatch.setattr(settings, "RETENTION_CONVERSATION_DAYS", 0)
+    monkeypatch.setattr(settings, "CHECKPOINTS_PER_THREAD", 0)
+
+@pytest.fixture
+def db():
+    return InMemoryDatabase()
+
+@pytest.fixture
+def store(db):
+    return MongoDBVectorStore(embeddings=FakeEmbeddings(32), db=db)
+
+@pytest.fixture
+def maintenance(db, store):
+    """A worker holding the lease, so single jobs can be run directly"""
+    maintenance = Maintenance()
+    maintenance._db = db
+    maintenance.vector_store = store
+    assert maintenance._acquire_lease(force=True)
+    return maintenance
+
+def checkpoint(db, thread_id: str, hours_ago: float, checkpoint_id: str = "001"):
+    db[settings.LANGGRAPH_CHECKPOINT_COLLECTION].insert_one(
+        {"_id": object_id(hours_ago), "thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": checkpoint_id}
+    )
+    db[settings.LANGGRAPH_WRITES_COLLECTION].insert_one(
+        {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": checkpoint_id, "task_id": "t"}
+    )
+
+def enable_chat_history(db, maintenance, hours_ago: float):
+    maintenance.record_chat_history_start()
+    db[settings.MAINTENANCE_COLLECTION].update_one(
+        {"_id": MAINTENANCE_STATE_ID},
+        {"$set": {"chat_history_since": datetime.now(timezone.utc) - timedelta(hours=hours_ago)}}
+    )
+
+def thread_ids(db):
+    return {doc["thread_id"] for doc in db[settings.LANGGRAPH_CHECKPOINT_COLLECTION].find({})}
+
+def test_threads_from_before_chat_history_keep_their_checkpoints(db, maintenance):
+    enable_chat_history(db, maintenance, hours_ago=24)
+    checkpoint(db, "before-history", hours_ago=48)
+    checkpoint(db, "before-history", hours_ago=2, checkpoint_id="002")  # Still in use since
+    checkpoint(db, "orphaned", hours_ago=5)
+    checkpoint(db, "recorded", hours_ago=5)
+    checkpoint(db, "recent", hours_ago=0)
+    db[settings.CHAT_HISTORY_COLLECTION].insert_one({"conversation_id": "recorded", "updated_at": datetime.now()})
+
+    assert maintenance._orphaned_checkpoints() == 2  # Checkpoint and pending write
+    assert thread_ids(db) == {"before-history", "recorded", "recent"}
+    assert db[settings.LANGGRAPH_WRITES_COLLECTION].count_documents({"thread_id": "orphaned"}) == 0
+
+def test_orphaned_checkpoints_are_off_by_default(db, maintenance, monkeypatch):
+    monkeypatch.setattr(settings, "MAINTENANCE_ORPHANED_CHECKPOINTS", False)
+    enable_chat_history(db, maintenance, hours_ago=24)
+    checkpoint(db, "orphaned", hours_ago=5)
+
+    assert maintenance._orphaned_checkpoints() == 0
+    assert thread_ids(db) == {"orphaned"}
+
+def test_orphaned_checkpoints_need_a_chat_history_start(db, maintenance):
+    checkpoint(db, "orphaned", hours_ago=5)
+
+    assert maintenance._orphaned_checkpoints() == 0
+    assert thread_ids(db) == {"orphaned"}
+
+def test_disabling_chat_history_clears_the_start(db, maintenance, monkeypatch):
+    maintenance.record_chat_history_start()
+    first = db[settings.MAINTENANCE_COLLECTION].find_one({"_id": MAINTENANCE_STATE_ID})["chat_history_since"]
+    maintenance.record_chat_history_start()
+    assert db[settings.MAINTENANCE_COLLECTION].find_one({"_id": MAINTENANCE_STATE_ID})["chat_history_since"] == first
+
+    monkeypatch.setattr(settings, "ENABLE_CHAT_HISTORY", False)
+    maintenance.record_chat_history_start()
+    assert "chat_history_since" not in db[settings.MAINTENANCE_COLLECTION].find_one({"_id": MAINTENANCE_STATE_ID})
+
+def test_expired_conversations_take_their_messages_and_checkpoints(db, maintenance, monkeypatch):
+    monkeypatch.setattr(settings, "RETENTION_CONVERSATION_DAYS", 30)
+    now = datetime.now()
+    conversations = db[settings.CHAT_HISTORY_COLLECTION]
+    messages = db[settings.MESSAGES_COLLECTION]
+    for conversation_id, age in (("idle", 40), ("active", 1)):
+        conversations.insert_one({"conversation_id": conversation_id, "updated_at": now - timedelta(days=age)})
+        messages.insert_one({"conversation_id": conversation_id, "message_id": f"{conversation_id}-1", "timestamp": now})
+        checkpoint(db, conversation_id, hours_ago=age * 24)
+
+    assert maintenance._expired_conversations() == 4
+    assert [doc["conversation_id"] for doc in conversations.find({})] == ["active"]
+    assert [doc["conversation_id"] for doc in messages.find({})] == ["active"]
+    assert thread_ids(db) == {"active"}
+
+def test_orphaned_messages_are_deleted(db, maintenance):
+    db[settings.CHAT_HISTORY_COLLECTION].insert_one({"conversation_id": "kept", "updated_at": datetime.now()})
+    messages = db[settings.MESSAGES_COLLECTION]
+    for conversation_id in ("kept", "gone", "gone", "also-gone"):
+        messages.insert_one({"conversation_id": conversation_id, "message_id": os.urandom(4).hex()})
+
+    assert maintenance._orphaned_messages() == 3
+    assert {doc["conversation_id"] for doc in messages.find({})} == {"kept"}
+
+def test_failed_documents_lose_their_vectors_but_shared_chunks_stay(db, store, maintenance):
+    documents = db[settings.DOCUMENTS_COLLECTION]
+    now = datetime.now()
+    documents.insert_one({"_id": "ok", "processing_status": "completed", "date_added": now - timedelta(days=30)})
+    documents.insert_one({"_id": "failed", "processing_status": "error", "date_added": now - timedelta(days=30)})
+    documents.insert_one({"_id": "stuck", "processing_status": "processing", "date_added": now - timedelta(days=3)})
+    documents.insert_one({"_id": "failing", "processing_status": "error", "date_added": now})
+    store.add_documents(chunks("ok"), "u1")
+    store.add_documents(chunks("failed")[:2] + [Document(page_content="ok chunk 0 about prenatal vitamins",
+                                                         metadata={"document_id": "failed", "chunk_index": 2})], "u1")
+    store.add_documents(chunks("stuck"), "u1")
+
+    maintenance._failed_documents()
+
+    assert {doc["_id"] for doc in documents.find({})} == {"ok", "failing"}
+    assert {ref["document_id"] for ref in store.refs_collection.find({})} == {"ok"}
+    assert db.vectors.count_documents({}) == 3  # The chunk "failed" shared with "ok" is kept
+    assert store.get_stats()["total_documents"] == 3
+
+def test_orphaned_vectors_are_deleted(db, store, maintenance):
+    db[settings.DOCUMENTS_COLLECTION].insert_one({"_id": "kept", "processing_status": "completed"})
+    store.add_documents(chunks("kept"), "u1")
+    store.add_documents(chunks("deleted"), "u1")
+    db.vectors.insert_one({"_id": "unreferenced", "text": "left over", "user_ids": ["u1"], "document_ids": ["x"]})
+
+    maintenance._orphaned_vectors()
+
+    assert {ref["document_id"] for ref in store.refs_collection.find({})} == {"kept"}
+    assert db.vectors.count_documents({}) == 3
+    assert db.vectors.find_one({"_id": "unreferenced"}) is None
+
+def test_checkpoint_history_keeps_the_newest(db, maintenance, monkeypatch):
+    monkeypatch.setattr(settings, "CHECKPOINTS_PER_THREAD", 2)
+    db[settings.CHAT_HISTORY_COLLECTION].insert_one({"conversation_id": "thread", "updated_at": datetime.now()})
+    for i in range(5):
+        checkpoint(db, "thread", hours_ago=5 - i, checkpoint_id=f"{i:03d}")
+
+    assert maintenance._checkpoint_history() == 6
+    assert sorted(doc["checkpoint_id"] for doc in db[settings.LANGGRAPH_CHECKPOINT_COLLECTION].find({})) == ["003", "004"]
+    assert sorted(doc["checkpoint_id"] for doc in db[settings.LANGGRAPH_WRITES_COLLECTION].find({})) == ["003", "004"]
+
+def test_run_holds_the_lease_and_reports(db, store):
+    maintenance = Maintenance()
+    maintenance._db = db
+    maintenance.vector_store = store
+    report = maintenance.run_if_due()
+
+    assert set(report["deleted"]) == {
+        "expired_conversations", "failed_documents", "orphaned_messages",
+        "orphaned_checkpoints", "orphaned_vectors", "checkpoint_history"
+    }
+    assert report["errors"] == {}
+    state = db[settings.MAINTENANCE_COLLECTION].find_one({"_id": MAINTENANCE_STATE_ID})
+    assert state["lease_owner"] is None and state["next_run_at"] > datetime.now()
+    assert maintenance.run_if_due() is None  # Not due again yet
+
+    other = Maintenance()
+    other._db = db
+    db[settings.MAINTENANCE_COLLECTION].update_one(
+        {"_id": MAINTENANCE_STATE_ID},
+        {"$set": {"lease_owner": other.owner, "lease_expires": datetime.now() + timedelta(minutes=5)}}
+    )
+    with pytest.raises(RuntimeError, match="another worker"):
+        maintenance.run_now()
@@ -0,0 +1,77 @@
+# tests/test_pagination.py
+"""
+Keyset pagination of conversations and messages, run against the in-memory stand-ins from
+benchmarks.fakes.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.fakes import InMemoryDatabase
+from app.api import chat as chat_api
+from app.db.pagination import decode_cursor, encode_cursor, iter_rows, read_page
+
+START = datetime(2026, 3, 1, 9, 30)
+
+@pytest.fixture
+def db(monkeypatch):
+    db = InMemoryDatabase()
+    monkeypatch.setattr(chat_api, "get_database", lambda: db)
+    return db
+
+def add_messages(db, conversation_id: str, count: int, first: int = 0):
+    for i in range(first, first + count):
+        # Two messages per timestamp, like a user message and a reply saved together
+        db.messages.insert_one({"conversation_id": conversation_id, "message_id": f"m{i:03d}",
+                                "timestamp": START + timedelta(seconds=i // 2), "content": f"message {i}"})
+
+def test_cursor_round_trips_and_rejects_garbage():
+    cursor = encode_cursor(START, "m007")
+
+    assert decode_cursor(cursor) == (START, "m007")
+    for garbage in ("", "not-a-cursor", encode_cursor(START, "m007")[:-3]):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(garbage)
+
+def test_pages_cover_every_row_once_across_equal_timestamps(db):
+    add_messages(db, "c1", 11)
+    add_messages(db, "c2", 3)
+
+    ids, cursor = [], None
+    while True:
+        rows, cursor = read_page(db.messages, {"conversation_id": "c1"}, "timestamp", "message_id", 4, cursor)
+        ids.extend(row["message_id"] for row in rows)
+        if cursor is None:
+            break
+
+    assert ids == [f"m{i:03d}" for i in range(11)]
+    assert [row["message_id"] for row in iter_rows(db.messages, {"conversation_id": "c1"},
+                                                    "timestamp", "message_id", 3)] == ids
+
+def test_newer_rows_do_not_shift_a_descending_listing(db):
+    for i in range(6):
+        db.conversations.insert_one({"user_id": "user-1", "conversation_id": f"c{i}",
+                                     "updated_at": START + timedelta(minutes=i)})
+
+    first = asyncio.run(chat_api.list_conversations("user-1", limit=3))
+    db.conversations.insert_one({"user_id": "user-1", "conversation_id": "c9", "updated_at": START + timedelta(hours=1)})
+    second = asyncio.run(chat_api.list_conversations("user-1", cursor=first.next_cursor, limit=3))
+
+    assert [each["conversation_id"] for each in first.conversations] == ["c5", "c4", "c3"]
+    assert [each["conversation_id"] for each in second.conversations] == ["c2", "c1", "c0"]
+    assert second.next_cursor is None
+
+def test_message_pages_follow_the_cursor_and_reject_bad_ones(db):
+    db.conversations.insert_one({"conversation_id": "c1", "user_id": "user-1", "message_count": 5})
+    add_messages(db, "c1", 5)
+
+    first = asyncio.run(chat_api.get_conversation_messages("c1", limit=2))
+    rest = asyncio.run(chat_api.get_conversation_messages("c1", cursor=first["next_cursor"], limit=10))
+
+    assert [message["message_id"] for message in first["messages"] + rest["messages"]] == [f"m{i:03d}" for i in range(5)]
+    assert rest["next_cursor"] is None and first["total_messages"] == 5
+    with pytest.raises(HTTPException) as bad_cursor:
+        asyncio.run(chat_api.get_conversation_messages("c1", cursor="bogus", limit=2))
+    assert bad_cursor.value.status_code == 400
@@ -0,0 +1,98 @@
+# tests/test_quantization.py
+"""
+Screening by compact codes (int8 / sign bits) followed by exact rescoring, in the local
+MongoDB search and the shared FAISS segments.
+"""
+import random
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, InMemoryDatabase
+from app.config import settings
+from app.vector_store.faiss_shared import SharedFAISSVectorStore
+from app.vector_store.mongodb_store import MongoDBVectorStore, quantized_field
+from app.vector_store.quantization import hamming_distances, int8_dot, pack_bits, quantize_int8, smallest
+
+DIMENSIONS = 64
+WORDS = ("folic", "acid", "iron", "calcium", "vitamin", "trimester", "nausea", "exercise", "sleep",
+         "glucose", "screening", "ultrasound", "caffeine", "fish", "protein", "water", "rest", "walk")
+
+def texts(count: int = 60):
+    rng = random.Random(7)
+    return [f"Note {i}: " + " ".join(rng.choice(WORDS) for _ in range(8)) for i in range(count)]
+
+def exact_top(embeddings, corpus, query: str, k: int):
+    vectors = np.asarray(embeddings.embed_documents(corpus), dtype=np.float32)
+    return [corpus[i] for i in smallest(-(vectors @ np.asarray(embeddings.embed_query(query))), k)]
+
+def test_int8_codes_approximate_the_dot_product():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(100, DIMENSIONS)).astype(np.float32)
+    query = rng.normal(size=DIMENSIONS).astype(np.float32)
+
+    codes, scales = quantize_int8(vectors)
+
+    assert codes.dtype == np.int8 and codes.shape == vectors.shape
+    assert np.allclose(int8_dot(codes, scales, query), vectors @ query, atol=0.05 * np.abs(vectors @ query).max())
+
+def test_hamming_distance_counts_differing_signs():
+    vectors = np.array([[1, -1, 1, -1] * 4, [-1, -1, 1, -1] * 4, [-1, 1, -1, 1] * 4], dtype=np.float32)
+
+    distances = hamming_distances(pack_bits(vectors), pack_bits(vectors[0])[0])
+
+    assert distances.tolist() == [0, 4, 16]
+    assert smallest(distances, 2).tolist() == [0, 1]
+
+@pytest.mark.parametrize("mode", ["int8", "binary"])
+def test_local_search_rescores_screened_candidates_exactly(mode, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_QUANTIZATION", mode)
+    monkeypatch.setattr(settings, "QUANTIZATION_CANDIDATES", 4)
+    monkeypatch.setattr(settings, "BINARY_QUANTIZATION_CANDIDATES", 8)
+    embeddings = FakeEmbeddings(DIMENSIONS)
+    store = MongoDBVectorStore(embeddings=embeddings, db=InMemoryDatabase())
+    corpus = texts()
+    store.add_documents([Document(page_content=text, metadata={"document_id": "doc-1", "chunk_index": i})
+                         for i, text in enumerate(corpus)], "user-1")
+    assert all(quantized_field("embedding", mode) in chunk for chunk in store.collection.find({}))
+
+    query = corpus[17]
+    results = store.similarity_search(query, k=3, user_id="user-1")
+
+    assert results[0].page_content == query
+    exact = {text: score for text, score in zip(
+        corpus, np.asarray(embeddings.embed_documents(corpus)) @ np.asarray(embeddings.embed_query(query))
+    )}
+    for doc in results:  # Scores are the full-precision cosine, not the screening approximation
+        assert doc.metadata["similarity_score"] == pytest.approx(exact[doc.page_content], abs=1e-5)
+
+def test_chunks_without_codes_are_scored_exactly_until_backfilled(monkeypatch):
+    embeddings = FakeEmbeddings(DIMENSIONS)
+    store = MongoDBVectorStore(embeddings=embeddings, db=InMemoryDatabase())
+    corpus = texts(20)
+    store.add_documents([Document(page_content=text, metadata={"document_id": "doc-1", "chunk_index": i})
+                         for i, text in enumerate(corpus)], "user-1")
+    monkeypatch.setattr(settings, "VECTOR_QUANTIZATION", "int8")
+
+    assert store.similarity_search(corpus[3], k=1, user_id="user-1")[0].page_content == corpus[3]
+    assert store.backfill_quantized_codes(batch_size=7) == {"coded": len(corpus)}
+    assert store.backfill_quantized_codes() == {"coded": 0}
+    assert store.similarity_search(corpus[3], k=1, user_id="user-1")[0].page_content == corpus[3]
+
+@pytest.mark.parametrize("mode", ["int8", "binary"])
+def test_shared_faiss_segments_screen_and_rescore(mode, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_QUANTIZATION", mode)
+    monkeypatch.setattr(settings, "QUANTIZATION_CANDIDATES", 4)
+    monkeypatch.setattr(settings, "BINARY_QUANTIZATION_CANDIDATES", 8)
+    embeddings = FakeEmbeddings(DIMENSIONS)
+    store = SharedFAISSVectorStore(folder=str(tmp_path), embeddings=embeddings)
+    corpus = texts()
+    store.add_documents([Document(page_content=text, metadata={"document_id": "doc-1"}) for text in corpus], "user-1")
+    assert store._segments[0].codes.keys() == {mode}
+
+    query = corpus[42]
+    results = store.similarity_search(query, k=3)  # Unfiltered, so only k * candidates rows are rescored
+
+    assert results[0].page_content == query
+    assert [doc.page_content for doc in results] == exact_top(embeddings, corpus, query, 3)
@@ -0,0 +1,151 @@
+# tests/test_rag_engine.py
+"""
+Graph runs of the RAG engine with a scripted chat model and a recording vector store: user
+scoping, speculative retrieval and batched query embeddings.
+"""
+import threading
+from collections import deque
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from prometheus_client import REGISTRY
+
+from app.config import settings
+from app.rag import engine as rag_engine
+
+QUESTION = "how much folic acid should I take while pregnant"
+
+class ScriptedChatModel(GenericFakeChatModel):
+    """Replies with the scripted messages in order; tools are accepted and ignored"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.requests = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class RecordingVectorStore:
+    """Records the user every search was scoped to"""
+
+    def __init__(self):
+        self.embeddings = FakeEmbeddings()
+        self.searches = []
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def _results(self, user_id):
+        with self._lock:
+            self.searches.append(user_id)
+        return [Document(page_content="Take 400 mcg of folic acid daily.",
+                         metadata={"title": "Prenatal handout", "similarity_score": 0.9})]
+
+    def similarity_search(self, query, k=4, user_id=None):
+        self.queries.append(query)
+        return self._results(user_id)
+
+    def similarity_search_by_vector(self, query_embedding, k=4, user_id=None):
+        return self._results(user_id)
+
+def tool_call_turn(user_id=None, query=QUESTION):
+    """The model asks for a search (of the question, unless told otherwise), with whatever user id it made up"""
+    args = {"query": query}
+    if user_id is not None:
+        args["user_id"] = user_id
+    return [
+        AIMessage(content="", tool_calls=[{"name": "retrieve", "args": args, "id": "call-1"}]),
+        AIMessage(content="Take 400 mcg daily."),
+    ]
+
+def make_engine(mode, replies):
+    engine = rag_engine.RAGEngine.__new__(rag_engine.RAGEngine)
+    engine.llm = ScriptedChatModel(messages=iter(replies))
+    engine.vector_store = RecordingVectorStore()
+    engine.graph_mode = mode
+    engine._speculation_stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0}
+    engine._latencies = {each: deque(maxlen=10) for each in rag_engine.GRAPH_MODES}
+    engine.checkpointer = InMemorySaver()
+    engine.graphs = {}
+    engine.graph = engine._get_graph(mode)
+    return engine
+
+@pytest.fixture(autouse=True)
+def engine_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_SPECULATIVE_RETRIEVAL", True)
+    monkeypatch.setattr(settings, "ENABLE_MULTI_QUERY_RETRIEVAL", True)
+
+@pytest.mark.parametrize("model_user_id", [None, "someone-else"])
+def test_batch_run_uses_the_speculative_search_of_the_requesting_user(model_user_id):
+    engine = make_engine("agentic", tool_call_turn(model_user_id))
+
+    results = list(engine.process_batch([{"message": QUESTION, "id": "q1"}], user_id="user-1", concurrency=1))
+
+    assert results[0]["error"] is None
+    assert results[0]["response"] == "Take 400 mcg daily."
+    assert engine._speculation_stats["hits"] == 1
+    assert engine._speculation_stats["misses"] == 0
+    assert engine.vector_store.searches == ["user-1"]
+    assert engine.vector_store.embeddings.requests == [[QUESTION]]
+
+def test_tool_query_close_to_the_message_counts_as_a_match():
+    assert rag_engine._queries_match("folic acid pregnant", QUESTION, 0.8)
+    assert rag_engine._queries_match("How much FOLIC acid?", "how much folic acid", 0.8)
+    assert not rag_engine._queries_match("iron supplements second trimester", QUESTION, 0.8)
+    assert not rag_engine._queries_match("", QUESTION, 0.8)
+
+def test_direct_answer_cancels_the_speculative_search():
+    engine = make_engine("agentic", [AIMessage(content="Hello! How can I help?")])
+
+    response, _ = engine.process_message(QUESTION, user_id="user-1")
+
+    assert response == "Hello! How can I help?"
+    assert engine._speculation_stats == {"started": 1, "hits": 0, "misses": 0, "cancelled": 1}
+
+def test_unrelated_tool_query_searches_again():
+    engine = make_engine("agentic", tool_call_turn(query="iron supplements second trimester"))
+
+    response, _ = engine.process_message(QUESTION, user_id="user-1")
+
+    assert response == "Take 400 mcg daily."
+    assert engine._speculation_stats == {"started": 1, "hits": 0, "misses": 1, "cancelled": 0}
+    # The speculative search may be cancelled before it runs; the tool's own always runs
+    assert "iron supplements second trimester" in engine.vector_store.queries
+    assert set(engine.vector_store.searches) == {"user-1"}
+
+def test_tool_searches_are_scoped_to_the_conversation_user(monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_SPECULATIVE_RETRIEVAL", False)
+    engine = make_engine("agentic", tool_call_turn("someone-else"))
+
+    response, _ = engine.process_message(QUESTION, user_id="user-1")
+
+    assert response == "Take 400 mcg daily."
+    assert engine.vector_store.searches == ["user-1"]
+
+def test_retrieval_first_batch_is_scoped_and_shares_embeddings():
+    engine = make_engine("retrieval_first", [AIMessage(content="answer")] * 6)
+    messages = [{"message": f"question {i} about iron supplements"} for i in range(6)]
+
+    results = list(engine.process_batch(messages, user_id="user-1", concurrency=3))
+
+    assert sorted(result["index"] for result in results) == list(range(6))
+    assert all(result["error"] is None for result in results)
+    assert set(engine.vector_store.searches) == {"user-1"}
+    # The questions were prefetched in one request
+    assert engine.vector_store.embeddings.requests[0] == [message["message"] for message in messages]
+    assert REGISTRY.get_sample_value("rag_retrieval_queue_depth") == 0
+
+def test_unknown_graph_mode_is_rejected():
+    engine = make_engine("agentic", [])
+
+    with pytest.raises(ValueError, match="Unknown graph mode"):
+        engine.process_message(QUESTION, graph_mode="retreival_first")
@@ -0,0 +1,110 @@
+# tests/test_source_updates.py
+"""
+In-place re-ingestion of a source (update_source_documents), run against the in-memory
+stand-ins from benchmarks.fakes.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, InMemoryDatabase
+from app.config import settings
+from app.document_processing import processor
+from app.vector_store.mongodb_store import MongoDBVectorStore
+
+SOURCE = "guide.pdf"
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self, dimensions: int = 32):
+        super().__init__(dimensions)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+class AppendOnlyStore:
+    """A vector store that can only add chunks, like the FAISS stores"""
+
+    def __init__(self):
+        self.added = []
+
+    def add_documents(self, documents, user_id=None):
+        self.added.extend(documents)
+
+def pages(count: int, edits=None):
+    edits = edits or {}
+    return [
+        Document(page_content=f"Page {page}, version {edits.get(page, 0)}: take folic acid every day.",
+                 metadata={"source": SOURCE, "title": "Guide", "type": "pdf", "page": page})
+        for page in range(count)
+    ]
+
+def update(documents, user_id="user-1"):
+    return asyncio.run(processor.update_source_documents(documents, user_id, SOURCE))
+
+@pytest.fixture
+def db(monkeypatch):
+    db = InMemoryDatabase()
+    monkeypatch.setattr(processor, "get_database", lambda: db)
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    monkeypatch.setattr(settings, "INGEST_BATCH_DOCUMENTS", 2)
+    return db
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbeddings()
+
+@pytest.fixture
+def store(db, embeddings, monkeypatch):
+    store = MongoDBVectorStore(embeddings=embeddings, db=db)
+    monkeypatch.setattr(processor, "get_vector_store", lambda: store)
+    return store
+
+def test_only_changed_pages_are_embedded_and_removed_pages_are_deleted(db, store, embeddings):
+    first_ids, _ = update(pages(4))
+    embeddings.embedded = 0
+
+    ids, changes = update(pages(3, edits={1: 1}))
+
+    assert ids == first_ids[:3]
+    assert embeddings.embedded == 1
+    assert changes["documents_unchanged"] == 2
+    assert changes["documents_updated"] == 1
+    assert changes["documents_removed"] == 1
+    assert db[settings.DOCUMENTS_COLLECTION].count_documents({}) == 3
+    assert db.vectors.count_documents({}) == 3
+    assert ["version 1" in doc.page_content for doc in store.get_document_chunks(ids[1])] == [True]
+    assert store.get_document_chunks(first_ids[3]) == []
+
+def test_update_is_refused_while_another_holds_the_source(db, store):
+    update(pages(2))
+    leases = db[settings.SOURCE_UPDATES_COLLECTION]
+    leases.update_one({"user_id": "user-1", "source": SOURCE},
+                      {"$set": {"lease_owner": "other-worker", "lease_expires": datetime.now() + timedelta(minutes=5)}})
+
+    with pytest.raises(HTTPException) as refused:
+        update(pages(2, edits={0: 1}))
+    assert refused.value.status_code == 409
+    assert update(pages(2), user_id="user-2")[1]["documents_added"] == 2  # Other users' copies are separate
+
+    # A crashed update's lease runs out
+    leases.update_one({"user_id": "user-1", "source": SOURCE}, {"$set": {"lease_expires": datetime.now()}})
+    assert update(pages(2, edits={0: 1}))[1]["documents_updated"] == 1
+    assert leases.find_one({"user_id": "user-1", "source": SOURCE})["lease_owner"] is None
+
+def test_append_only_store_refuses_to_update_a_stored_source(db, monkeypatch):
+    append_only = AppendOnlyStore()
+    monkeypatch.setattr(processor, "get_vector_store", lambda: append_only)
+
+    ids, changes = update(pages(2))
+    assert changes["documents_added"] == 2 and len(append_only.added) == 2
+
+    with pytest.raises(HTTPException) as refused:
+        update(pages(2, edits={0: 1}))
+    assert refused.value.status_code == 400
+    assert len(append_only.added) == 2
+    assert {doc["_id"] for doc in db[settings.DOCUMENTS_COLLECTION].find({})} == set(ids)
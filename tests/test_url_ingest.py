@@ -0,0 +1,89 @@
+# tests/test_url_ingest.py
+"""
+Conditional URL re-fetch: the per-user URL cache, run against the in-memory stand-ins from
+benchmarks.fakes with the fetch and the ingestion replaced.
+"""
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import InMemoryDatabase
+from app.config import settings
+from app.document_processing import url_ingest
+from app.document_processing.fetcher import FetchedPage
+
+URL = "https://example.org/prenatal-vitamins"
+
+class Site:
+    """Serves one page, answering 304 when the ETag still matches"""
+
+    def __init__(self):
+        self.fetches = []
+        self.host_limits = []
+
+    async def fetch_url(self, url, etag=None, last_modified=None, host_limits=None):
+        self.fetches.append(etag)
+        self.host_limits.append(host_limits)
+        if etag == '"v1"':
+            return FetchedPage(url, 304, etag=etag)
+        return FetchedPage(url, 200, text="Take 400 mcg of folic acid daily.", title="Vitamins",
+                           etag='"v1"', sha256="abc")
+
+@pytest.fixture
+def db(monkeypatch):
+    db = InMemoryDatabase()
+    opened = []
+    monkeypatch.setattr(url_ingest, "get_database", lambda: opened.append(db) or db)
+    db.opened = opened
+    return db
+
+@pytest.fixture
+def site(monkeypatch):
+    site = Site()
+    monkeypatch.setattr(url_ingest, "fetch_url", site.fetch_url)
+    return site
+
+@pytest.fixture
+def ingested(db, monkeypatch):
+    """Stores one completed document per ingestion, as update_source_documents would"""
+    ingested = []
+
+    async def update_source_documents(documents, user_id, source):
+        document_id = f"doc-{len(ingested) + 1}"
+        db[settings.DOCUMENTS_COLLECTION].insert_one(
+            {"_id": document_id, "user_id": user_id, "processing_status": "completed"}
+        )
+        ingested.append(document_id)
+        return [document_id], {"documents_added": 1}
+
+    monkeypatch.setattr(url_ingest, "update_source_documents", update_source_documents)
+    return ingested
+
+def test_unchanged_page_returns_the_stored_documents(db, site, ingested):
+    first = asyncio.run(url_ingest.ingest_url(URL, "user-1"))
+    second = asyncio.run(url_ingest.ingest_url(URL, "user-1"))
+
+    assert first["status"] == "success" and second["status"] == "unchanged"
+    assert second["document_ids"] == first["document_ids"] == ["doc-1"]
+    assert site.fetches == [None, '"v1"']
+    assert ingested == ["doc-1"]
+
+def test_deleted_documents_are_ingested_again(db, site, ingested):
+    asyncio.run(url_ingest.ingest_url(URL, "user-1"))
+    db[settings.DOCUMENTS_COLLECTION].delete_many({"_id": "doc-1"})
+
+    result = asyncio.run(url_ingest.ingest_url(URL, "user-1"))
+
+    assert result["status"] == "success"
+    assert result["document_ids"] == ["doc-2"]
+    assert site.fetches == [None, None]  # Fetched without validators, so never a 304
+
+def test_batch_shares_one_database_and_its_host_limits(db, site, ingested):
+    urls = [f"{URL}/{i}" for i in range(4)] + [f"{URL}/0"]
+
+    results = asyncio.run(url_ingest.ingest_urls(urls, "user-1"))
+
+    assert [result["status"] for result in results] == ["success"] * 4
+    assert len(db.opened) == 1
+    assert len({id(limits) for limits in site.host_limits}) == 1
+    assert site.host_limits[0] is not None
@@ -0,0 +1,158 @@
+# tests/test_vector_search_pipeline.py
+"""
+Atlas $vectorSearch pipelines and search index management, checked against the in-memory
+stand-ins from benchmarks.fakes (no Atlas cluster needed).
+"""
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings, InMemoryDatabase
+from app.config import settings
+from app.vector_store.mongodb_store import (
+    MongoDBVectorStore,
+    WINNER_PROJECTION,
+    ensure_vector_search_index,
+    vector_index_name,
+    vector_search_index_definition,
+)
+
+DIMENSIONS = 64
+
+class SearchIndexCollection:
+    """Collection stand-in for the Atlas search index helpers, recording the calls made"""
+
+    def __init__(self, indexes=None):
+        self.indexes = list(indexes or [])
+        self.created = []
+        self.updated = []
+
+    def list_search_indexes(self):
+        return iter(self.indexes)
+
+    def create_search_index(self, model):
+        self.created.append(model.document)
+        return model.document["name"]
+
+    def update_search_index(self, name, definition):
+        self.updated.append((name, definition))
+
+@pytest.fixture
+def store():
+    return MongoDBVectorStore(embeddings=FakeEmbeddings(DIMENSIONS), db=InMemoryDatabase())
+
+@pytest.fixture
+def query_vector():
+    return FakeEmbeddings(DIMENSIONS).embed_query("folic acid in the first trimester")
+
+def test_single_condition_is_a_plain_filter_inside_vector_search(store, query_vector):
+    pipeline = store._build_vector_search_pipeline(query_vector, k=4)
+
+    vector_search = pipeline[0]["$vectorSearch"]
+    assert vector_search["filter"] == {"embedding_model": {"$eq": store.embedding_model}}
+    assert not any("$match" in stage for stage in pipeline)
+
+def test_several_conditions_are_combined_with_and(store, query_vector):
+    pipeline = store._build_vector_search_pipeline(
+        query_vector, k=4, user_id="user-1", filters={"document_id": "doc-1", "source": "handout.pdf"}
+    )
+
+    vector_search = pipeline[0]["$vectorSearch"]
+    assert list(vector_search["filter"]) == ["$and"]
+    conditions = vector_search["filter"]["$and"]
+    assert len(conditions) == 4
+    for condition in (
+        {"user_ids": {"$eq": "user-1"}},
+        {"document_ids": {"$eq": "doc-1"}},
+        {"sources": {"$eq": "handout.pdf"}},
+        {"embedding_model": {"$eq": store.embedding_model}},
+    ):
+        assert condition in conditions
+    assert not any("$match" in stage for stage in pipeline)
+
+def test_index_name_comes_from_settings(store, query_vector, monkeypatch):
+    monkeypatch.setattr(settings, "ATLAS_VECTOR_INDEX_NAME", "handouts_index")
+
+    pipeline = store._build_vector_search_pipeline(query_vector, k=4)
+    assert pipeline[0]["$vectorSearch"]["index"] == "handouts_index"
+    assert pipeline[0]["$vectorSearch"]["path"] == "embedding"
+
+    shadow = {**store.space, "slot": "shadow_embedding"}
+    pipeline = store._build_vector_search_pipeline(query_vector, k=4, space=shadow)
+    assert vector_index_name("shadow_embedding") == "handouts_index_shadow_embedding"
+    assert pipeline[0]["$vectorSearch"]["index"] == "handouts_index_shadow_embedding"
+    assert pipeline[0]["$vectorSearch"]["path"] == "shadow_embedding"
+
+def test_num_candidates_scale_with_k(store, query_vector, monkeypatch):
+    monkeypatch.setattr(settings, "ATLAS_NUM_CANDIDATES_MULTIPLIER", 7)
+
+    vector_search = store._build_vector_search_pipeline(query_vector, k=5)[0]["$vectorSearch"]
+    assert vector_search["numCandidates"] == 35
+    assert vector_search["limit"] == 5
+
+def test_score_is_set_and_vectors_are_dropped(store, query_vector):
+    pipeline = store._build_vector_search_pipeline(query_vector, k=4)
+
+    assert pipeline[1] == {"$set": {"score": {"$meta": "vectorSearchScore"}}}
+    assert "embedding" in pipeline[2]["$unset"]
+    assert set(pipeline[2]["$unset"]) == set(WINNER_PROJECTION)
+
+def test_unindexed_filter_field_is_rejected(store, query_vector):
+    with pytest.raises(ValueError, match="not indexed"):
+        store._build_vector_search_pipeline(query_vector, k=4, filters={"chunk_index": 3})
+
+def test_missing_index_is_created():
+    collection = SearchIndexCollection()
+
+    result = ensure_vector_search_index(collection, num_dimensions=DIMENSIONS)
+
+    assert result == {"name": settings.ATLAS_VECTOR_INDEX_NAME, "status": "created", "problems": []}
+    assert collection.created == [{
+        "name": settings.ATLAS_VECTOR_INDEX_NAME,
+        "type": "vectorSearch",
+        "definition": vector_search_index_definition(DIMENSIONS),
+    }]
+    assert collection.updated == []
+
+def test_matching_index_is_left_alone():
+    collection = SearchIndexCollection([{
+        "name": settings.ATLAS_VECTOR_INDEX_NAME,
+        "type": "vectorSearch",
+        "status": "READY",
+        "queryable": True,
+        "latestDefinition": vector_search_index_definition(DIMENSIONS),
+    }])
+
+    result = ensure_vector_search_index(collection, num_dimensions=DIMENSIONS)
+
+    assert result["status"] == "READY"
+    assert result["queryable"] is True
+    assert result["problems"] == []
+    assert collection.created == [] and collection.updated == []
+
+def test_drifted_index_is_updated():
+    drifted = vector_search_index_definition(DIMENSIONS // 2)
+    drifted["fields"] = [field for field in drifted["fields"] if field.get("path") != "sources"]
+    collection = SearchIndexCollection([{
+        "name": settings.ATLAS_VECTOR_INDEX_NAME,
+        "type": "vectorSearch",
+        "latestDefinition": drifted,
+    }])
+
+    result = ensure_vector_search_index(collection, num_dimensions=DIMENSIONS)
+
+    assert result["status"] == "updated"
+    assert "missing filter field sources" in result["problems"]
+    assert f"embedding numDimensions is {DIMENSIONS // 2}, expected {DIMENSIONS}" in result["problems"]
+    assert collection.updated == [(settings.ATLAS_VECTOR_INDEX_NAME, vector_search_index_definition(DIMENSIONS))]
+    assert collection.created == []
+
+def test_index_of_the_shadow_slot_is_managed_separately():
+    collection = SearchIndexCollection([{
+        "name": settings.ATLAS_VECTOR_INDEX_NAME,
+        "latestDefinition": vector_search_index_definition(DIMENSIONS),
+    }])
+
+    result = ensure_vector_search_index(collection, num_dimensions=DIMENSIONS, slot="shadow_embedding")
+
+    assert result["status"] == "created"
+    assert collection.created[0]["name"] == vector_index_name("shadow_embedding")
+    assert collection.created[0]["definition"]["fields"][0]["path"] == "shadow_embedding"